@@ -0,0 +1,14 @@
+"""
+    URL-конфигурация ASGI-развертывания: async-чтение рецептов,
+    тэгов и ингредиентов перед маршрутами backend.urls
+"""
+from django.urls import path
+from django.urls import include
+
+from . import urls
+
+urlpatterns = [
+    path('', include('tags.async_urls')),
+    path('', include('recipes.async_urls')),
+    *urls.urlpatterns,
+]
@@ -0,0 +1,104 @@
+"""
+    Async-представления чтения для запуска под ASGI.
+
+    GET обрабатывает async-обработчик, не занимая поток: запросы к базе
+    идут через async ORM, сериализуются уже загруженные объекты.
+    Остальные методы и случаи, которые обработчик не поддерживает
+    (он вернул None), отдаются DRF-представлению через sync_to_async,
+    так ответы и ошибки совпадают с WSGI-развертыванием.
+"""
+from asgiref.sync import sync_to_async
+
+from django.http import HttpResponse
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import acache_response
+from .cache import aget_cache_key
+from .cache import aget_cached_response
+from .conditional import conditional
+from .conditional import set_validators
+
+
+def wants_json(request) -> bool:
+    """
+        Браузер и ?format= получают ответ DRF (Browsable API)
+    """
+    accept = request.headers.get('Accept', '')
+    return 'format' not in request.GET and 'text/html' not in accept
+
+
+def async_read_view(handler, fallback):
+    """
+    :param handler: async-функция (request, **kwargs) -> HttpResponse
+        или None, если запрос должно обработать DRF-представление
+    :param fallback: DRF-представление, ViewSet.as_view(actions)
+    :return: async-представление
+    """
+    fallback = sync_to_async(fallback)
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET' and wants_json(request):
+            try:
+                response = await handler(request, **kwargs)
+            except AuthenticationFailed:
+                # Ответ 401 с заголовками формирует DRF
+                response = None
+            if response is not None:
+                return response
+        return await fallback(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+def render(data, status=200):
+    """
+        JSON-ответ, байт в байт совпадающий с ответом DRF
+    """
+    response = HttpResponse(
+        JSONRenderer().render(data), status=status,
+        content_type=JSONRenderer.media_type
+    )
+    response['Vary'] = 'Accept'
+    return response
+
+
+async def conditional_response(request, validators, build):
+    """
+        Ответ 304 без вызова build, если клиент прислал актуальные
+        ETag/Last-Modified, иначе ответ build с этими заголовками
+    :param validators: ETag и Last-Modified (None - только ETag)
+    :param build: async-функция без аргументов -> HttpResponse или None
+    """
+    etag, last_modified = validators
+    response = conditional(request, etag, last_modified)
+    if response is not None:
+        return response
+    response = await build()
+    if response is not None and response.status_code == 200:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+async def cached_response(request, user, cache_params, build):
+    """
+        Кэш ответов анонимным пользователям, ключи общие с CachedReadMixin.
+        Кэш читается через async API, файловый бэкенд не блокирует
+        цикл событий
+    :param cache_params: параметры запроса, влияющие на ответ
+    :param build: async-функция без аргументов -> HttpResponse или None
+    """
+    key = await aget_cache_key(
+        request, user, request.GET, cache_params, 'json'
+    )
+    if key is not None:
+        response = await aget_cached_response(key)
+        if response is not None:
+            return response
+    response = await build()
+    if key is not None and response is not None \
+            and response.status_code == 200:
+        await acache_response(key, response)
+    return response
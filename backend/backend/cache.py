@@ -0,0 +1,252 @@
+"""
+    Кэш ответов на анонимные запросы чтения (рецепты, тэги, ингредиенты).
+
+    Бэкенд задается алиасом RESPONSE_CACHE в settings.CACHES.
+    Все ключи содержат поколение, после коммита изменения сигналы
+    моделей записывают новое, и старые записи перестают читаться, пока
+    не истечет их TIMEOUT. Поколение хранится в том же бэкенде, поэтому
+    с общим бэкендом (файловым) сброс видят все воркеры.
+"""
+import time
+import threading
+
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+
+GENERATION_KEY = 'response-cache:generation'
+
+# Для management-команд, меняющих данные в обход сигналов
+LOCAL_CACHE_WARNING = (
+    'Кэш ответов в памяти процесса: работающие воркеры отдают '
+    'прежние ответы до истечения TIMEOUT кэша. Перезапустите их '
+    'или используйте RESPONSE_CACHE=shared-responses'
+)
+
+_lock = threading.Lock()
+_stats = dict(hits=0, misses=0, invalidations=0)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+def get_cache():
+    alias = getattr(settings, 'RESPONSE_CACHE', None)
+    if alias:
+        return caches[alias]
+    return None
+
+
+def is_shared() -> bool:
+    """
+        Видят ли сброс из этого процесса остальные: кэш в памяти
+        процесса (LocMemCache) у каждого воркера свой, и сброс
+        из management-команды до них не доходит
+    """
+    return not isinstance(get_cache(), LocMemCache)
+
+
+def get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Ключа нет (первый запуск, вытеснен при чистке бэкенда):
+        # старые записи не должны читаться
+        cache.add(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+async def aget_generation(cache):
+    """
+        get_generation для async-представлений
+    """
+    generation = await cache.aget(GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = await cache.aget(GENERATION_KEY)
+    return generation
+
+
+def invalidate() -> None:
+    """
+        Делает недоступными все закэшированные ответы после коммита
+        текущей транзакции: запрос, начатый до коммита, не сохранит
+        прежние данные под новым поколением
+    :return: None
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+
+    def bump():
+        # Не incr: у файлового бэкенда это чтение и запись,
+        # одновременные сбросы дали бы одно и то же поколение
+        cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+        _count('invalidations')
+
+    transaction.on_commit(bump)
+
+
+def _key_params(user, query_params, cache_params):
+    if user.is_authenticated or set(query_params) - set(cache_params):
+        return None
+
+    params = []
+    for name in cache_params:
+        values = sorted(set(query_params.getlist(name)) - {''})
+        if name == 'page' and values == ['1']:
+            continue
+        params.extend((name, x) for x in values)
+    return params
+
+
+def _cache_key(generation, request, params, renderer_format):
+    return (
+        f'response:{generation}:{renderer_format}:'
+        f'{request.get_host()}{request.path}?{urlencode(params)}'
+    )
+
+
+def get_cache_key(request, user, query_params, cache_params,
+                  renderer_format):
+    """
+        Ключ ответа на анонимный запрос чтения
+    :param request: HttpRequest
+    :param user: текущий пользователь
+    :param query_params: QueryDict параметров запроса
+    :param cache_params: параметры запроса, влияющие на ответ
+    :param renderer_format: формат ответа (json, api)
+    :return: ключ или None, если ответ не кэшируется
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    params = _key_params(user, query_params, cache_params)
+    if params is None:
+        return None
+    return _cache_key(
+        get_generation(cache), request, params, renderer_format
+    )
+
+
+async def aget_cache_key(request, user, query_params, cache_params,
+                         renderer_format):
+    """
+        get_cache_key для async-представлений
+    """
+    cache = get_cache()
+    if cache is None:
+        return None
+    params = _key_params(user, query_params, cache_params)
+    if params is None:
+        return None
+    return _cache_key(
+        await aget_generation(cache), request, params, renderer_format
+    )
+
+
+def get_cached_response(key):
+    """
+    :param key: ключ из get_cache_key
+    :return: HttpResponse из кэша или None
+    """
+    return _cached_response(get_cache().get(key))
+
+
+async def aget_cached_response(key):
+    """
+        get_cached_response для async-представлений
+    """
+    return _cached_response(await get_cache().aget(key))
+
+
+def _cached_response(cached):
+    if cached is None:
+        _count('misses')
+        return None
+    _count('hits')
+    content_type, content = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def cache_response(key, response) -> None:
+    """
+        Сохраняет отрендеренный ответ с кодом 200
+    """
+    get_cache().set(key, (response['Content-Type'], response.content))
+    response['X-Cache'] = 'MISS'
+
+
+async def acache_response(key, response) -> None:
+    """
+        cache_response для async-представлений
+    """
+    await get_cache().aset(
+        key, (response['Content-Type'], response.content)
+    )
+    response['X-Cache'] = 'MISS'
+
+
+class CachedReadMixin:
+    """
+        Кэширует list/retrieve для анонимных пользователей.
+        cache_params - параметры запроса, влияющие на ответ.
+        Запросы с другими параметрами не кэшируются
+    """
+    cache_params = ()
+
+    def get_response_cache_key(self, request):
+        return get_cache_key(
+            request, request.user, request.query_params, self.cache_params,
+            request.accepted_renderer.format
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is not None:
+            response = get_cached_response(key)
+            if response is not None:
+                return response
+            self.response_cache_key = key
+        return handler(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        key = getattr(self, 'response_cache_key', None)
+        if key and isinstance(response, Response) \
+                and response.status_code == 200:
+            response.render()
+            cache_response(key, response)
+        return response
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(stats())
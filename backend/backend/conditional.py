@@ -0,0 +1,190 @@
+"""
+    Условные GET-запросы: ETag / Last-Modified и ответ 304 до сериализации.
+
+    Для списков используется версия коллекции в таблице CollectionVersion,
+    общей для всех процессов. Сигналы моделей увеличивают ее после
+    коммита изменения.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.http import http_date
+from django.utils.cache import get_conditional_response
+
+from recipes.models import CollectionVersion
+
+
+def _create_versions(collections):
+    """
+        Начальное значение берется из времени, чтобы версии
+        не повторялись после пересоздания базы
+    """
+    CollectionVersion.objects.bulk_create(
+        [
+            CollectionVersion(
+                name=x, version=time.time_ns(), modified=time.time()
+            ) for x in collections
+        ],
+        ignore_conflicts=True
+    )
+
+
+def get_versions(*collections):
+    """
+        Текущие версии коллекций одним запросом
+    :param collections: имена коллекций
+    :return: имя -> dict(version, modified)
+    """
+    versions = {
+        x['name']: x for x in CollectionVersion.objects.filter(
+            name__in=collections
+        ).values('name', 'version', 'modified')
+    }
+    missing = set(collections) - set(versions)
+    if missing:
+        _create_versions(missing)
+        return get_versions(*collections)
+    return versions
+
+
+async def aget_versions(*collections):
+    """
+        get_versions для async-представлений
+    """
+    versions = {
+        x['name']: x async for x in CollectionVersion.objects.filter(
+            name__in=collections
+        ).values('name', 'version', 'modified')
+    }
+    missing = set(collections) - set(versions)
+    if missing:
+        await sync_to_async(_create_versions)(missing)
+        return await aget_versions(*collections)
+    return versions
+
+
+def get_version(collection):
+    """
+        Текущая версия коллекции
+    :param collection: имя коллекции
+    :return: dict(version, modified)
+    """
+    return get_versions(collection)[collection]
+
+
+def increment_version(collection):
+    """
+        Сразу увеличивает версию коллекции
+    :param collection: имя коллекции
+    :return: новая версия
+    """
+    with transaction.atomic():
+        updated = CollectionVersion.objects.filter(name=collection).update(
+            version=F('version') + 1, modified=time.time()
+        )
+        if not updated:
+            _create_versions([collection])
+        return get_version(collection)['version']
+
+
+def bump_version(collection) -> None:
+    """
+        Увеличивает версию коллекции после коммита текущей транзакции:
+        процесс, прочитавший новую версию, видит и изменение
+    :param collection: имя коллекции
+    :return: None
+    """
+    transaction.on_commit(lambda: increment_version(collection))
+
+
+def _collection_validators(collection, version):
+    return f'"{collection}-{version["version"]}"', version['modified']
+
+
+def get_collection_validators(collection):
+    """
+    :param collection: имя коллекции
+    :return: ETag и Last-Modified списка по версии коллекции
+    """
+    return _collection_validators(collection, get_version(collection))
+
+
+async def aget_collection_validators(collection):
+    versions = await aget_versions(collection)
+    return _collection_validators(collection, versions[collection])
+
+
+def conditional(request, etag, last_modified):
+    """
+        Ответ 304/412 по If-None-Match/If-Modified-Since
+    :param etag: ETag ответа
+    :param last_modified: время изменения или None, если
+        по дате ответ не проверяется
+    :return: HttpResponse или None, если нужен полный ответ
+    """
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    return get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+
+
+def set_validators(response, etag, last_modified) -> None:
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+
+
+class ConditionalReadMixin:
+    """
+        Добавляет ETag/Last-Modified к list/retrieve и отвечает 304,
+        не выполняя обработчик, если клиент прислал актуальные значения
+    """
+    collection = None
+    conditional_actions = ('list', 'retrieve')
+
+    def get_list_validators(self):
+        return get_collection_validators(self.collection)
+
+    def get_object_validators(self):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        updated_at = self.get_queryset().filter(
+            **{self.lookup_field: self.kwargs[lookup]}
+        ).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None
+        return (
+            f'"{self.collection}-{self.kwargs[lookup]}-'
+            f'{updated_at.timestamp()}"',
+            updated_at.timestamp()
+        )
+
+    def conditional_response(self, validators, handler,
+                             request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+
+        etag, last_modified = validators()
+        if etag is not None:
+            response = conditional(request, etag, last_modified)
+            if response is not None:
+                return response
+
+        response = handler(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_validators, super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_validators, super().retrieve,
+            request, *args, **kwargs
+        )
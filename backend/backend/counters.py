@@ -0,0 +1,174 @@
+"""
+    Денормализованные счетчики связанных строк.
+
+    Счетчик - целочисленное поле модели, которое меняется через F()
+    одним UPDATE при изменении связей, без Count() на чтении.
+    Расхождения исправляет команда reconcile_counters.
+"""
+from collections import Counter as Multiset
+
+from django.db.models import F
+from django.db.models import Count
+from django.db.models import OuterRef
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import post_delete
+from django.db.models.signals import m2m_changed
+
+counters = []
+
+
+def increment(model, counter, pks, delta=1) -> None:
+    """
+        counter = counter + delta для строк pks.
+        Повторяющиеся pk складываются, одинаковые приращения
+        выполняются одним запросом
+    :param model: модель со счетчиком
+    :param counter: имя поля счетчика
+    :param pks: первичные ключи, pk может повторяться
+    :param delta: приращение на одно вхождение pk
+    """
+    groups = dict()
+    for pk, times in Multiset(pks).items():
+        groups.setdefault(times * delta, []).append(pk)
+    for value, group in groups.items():
+        model.objects.filter(pk__in=group).update(
+            **{counter: F(counter) + value}
+        )
+
+
+class RelatedCounter:
+    """
+        Счетчик строк rows, ссылающихся на model через поле column
+    """
+
+    def __init__(self, model, counter, rows, column):
+        self.model = model
+        self.counter = counter
+        self.rows = rows
+        self.column = column
+
+    def __str__(self):
+        return f'{self.model._meta.label}.{self.counter}'
+
+    def actual(self):
+        return Coalesce(
+            Subquery(
+                self.rows.objects.filter(
+                    **{self.column: OuterRef('pk')}
+                ).order_by().values(self.column).annotate(
+                    count=Count('pk')
+                ).values('count')
+            ),
+            0
+        )
+
+    def reconcile(self) -> int:
+        """
+            Пересчитывает счетчик там, где он разошелся с данными
+        :return: кол-во исправленных строк
+        """
+        return self.model.objects.exclude(
+            **{self.counter: self.actual()}
+        ).update(**{self.counter: self.actual()})
+
+    def connect(self):
+        counters.append(self)
+        return self
+
+
+class ForeignKeyCounter(RelatedCounter):
+    """
+        Счетчик обратной связи ForeignKey, например User.recipes_count
+    """
+
+    def __init__(self, descriptor, counter):
+        field = descriptor.field
+        super().__init__(
+            field.related_model, counter, field.model, field.name
+        )
+        self.attname = field.attname
+
+    def created(self, sender, instance, created, raw=False, **kwargs):
+        if created and not raw:
+            increment(
+                self.model, self.counter, [getattr(instance, self.attname)]
+            )
+
+    def deleted(self, sender, instance, **kwargs):
+        increment(
+            self.model, self.counter, [getattr(instance, self.attname)], -1
+        )
+
+    def connect(self):
+        post_save.connect(self.created, sender=self.rows, weak=False)
+        post_delete.connect(self.deleted, sender=self.rows, weak=False)
+        return super().connect()
+
+
+class ManyToManyCounter(RelatedCounter):
+    """
+        Счетчик строк промежуточной таблицы ManyToManyField на стороне
+        целевой модели, например Recipe.favorites_count.
+        Следит за add/remove/clear с обеих сторон связи и за удалением
+        владельца связи
+    """
+
+    def __init__(self, descriptor, counter):
+        field = descriptor.field
+        self.through = descriptor.through
+        self.owner = field.model
+        self.source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        super().__init__(field.related_model, counter, self.through, target)
+
+    def rows_of(self, instance, reverse, pk_set=None):
+        """
+            pk целевых строк, по одному на каждую существующую связь
+        """
+        if reverse:
+            rows = self.through.objects.filter(**{self.column: instance.pk})
+            lookup = self.source
+        else:
+            rows = self.through.objects.filter(**{self.source: instance.pk})
+            lookup = self.column
+        if pk_set is not None:
+            rows = rows.filter(**{f'{lookup}__in': pk_set})
+        return list(rows.values_list(f'{self.column}_id', flat=True))
+
+    def changed(self, sender, instance, action, reverse, pk_set, **kwargs):
+        if action == 'post_add':
+            # pk_set содержит только действительно добавленные связи
+            if reverse:
+                pks = [instance.pk] * len(pk_set)
+            else:
+                pks = pk_set
+            increment(self.model, self.counter, pks)
+        elif action in ('pre_remove', 'pre_clear'):
+            # remove() присылает все переданные pk, поэтому
+            # существующие связи считаются до удаления
+            instance.__dict__.setdefault('_removed_rows', dict())[
+                self.counter
+            ] = self.rows_of(
+                instance, reverse, pk_set if action == 'pre_remove' else None
+            )
+        elif action in ('post_remove', 'post_clear'):
+            pks = instance.__dict__.get('_removed_rows', dict()).pop(
+                self.counter, ()
+            )
+            increment(self.model, self.counter, pks, -1)
+
+    def source_deleted(self, sender, instance, **kwargs):
+        # Связи удаляются каскадом без m2m_changed
+        increment(
+            self.model, self.counter, self.rows_of(instance, False), -1
+        )
+
+    def connect(self):
+        m2m_changed.connect(self.changed, sender=self.through, weak=False)
+        pre_delete.connect(
+            self.source_deleted, sender=self.owner, weak=False
+        )
+        return super().connect()
@@ -0,0 +1,56 @@
+"""
+    Конфигурация gunicorn:
+
+        gunicorn -c python:backend.gunicorn_config backend.wsgi:application
+
+    Приложение загружается в мастере (preload_app) и прогревается
+    до fork (backend.warmup), поэтому новый воркер, в том числе после
+    перезапуска по max_requests, сразу отвечает быстро и делит память
+    мастера. Параметры меняются переменными окружения GUNICORN_*
+    или аргументами командной строки.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+    # Приложение импортируется в мастере, поэтому патчить модули
+    # нужно до него, а не в воркере после fork
+    from gevent import monkey
+
+    monkey.patch_all()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+# Один воркер gevent: параллельные запросы обслуживают гринлеты,
+# а записи в SQLite все равно идут по очереди. Кэш ответов
+# по умолчанию в памяти процесса, поэтому при GUNICORN_WORKERS > 1
+# нужен общий RESPONSE_CACHE=shared-responses. Индексы в памяти
+# и версии коллекций согласуются через базу (recipes.changes,
+# CollectionVersion), кэш токенов - через TOKEN_CACHE_TTL
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_connections = int(
+    os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100)
+)
+# Перезапуск воркера дешев (fork прогретого мастера) и нужен
+# только как страховка от утечек памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+preload_app = True
+
+capture_output = True
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+        Мастер загрузил приложение, воркеры еще не запущены
+    """
+    from backend.warmup import warm_up
+
+    result = warm_up()
+    server.log.info(
+        'Warm-up: %.0f ms, serializers: %s, frozen objects: %s',
+        result['duration'] * 1000, result['serializers'], result['frozen']
+    )
@@ -0,0 +1,253 @@
+"""
+    Инструментирование запросов: кол-во SQL-запросов, время в базе,
+    повторяющиеся запросы (N+1) и время ответа по маршрутам.
+
+    Каждый запрос получает заголовок Server-Timing и строку JSON
+    в логгере backend.instrumentation. Перцентили по последним
+    METRICS_WINDOW запросам каждого маршрута отдает /metrics/,
+    если включен METRICS_ENABLED.
+
+    Счетчик запроса лежит в ContextVar, а обертка execute подключается
+    к каждому соединению один раз: под ASGI async ORM выполняет
+    SQL в соединении другого потока, куда контекст копирует asgiref.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from collections import Counter
+from collections import deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 95, 99)
+
+_lock = threading.Lock()
+_routes = dict()
+_current = ContextVar('instrumentation_queries', default=None)
+
+
+class QueryStats:
+    """
+        Счетчик SQL-запросов одного HTTP-запроса, подключается
+        к каждой базе через connection.execute_wrapper
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    @property
+    def duplicates(self) -> int:
+        return sum(x - 1 for x in self.statements.values())
+
+    def repeated(self, threshold):
+        """
+            Запросы, выполненные не меньше threshold раз, - признак N+1
+        """
+        return [
+            (sql, count) for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def _execute(execute, sql, params, many, context):
+    queries = _current.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs) -> None:
+    """
+        Подключает счетчик к соединению, обработчик connection_created.
+        Обертка встает первой: connection.execute_wrapper() снимает
+        последнюю обертку списка
+    """
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+connection_created.connect(install)
+
+
+class RouteStats:
+    def __init__(self, window):
+        self.requests = 0
+        self.queries = 0
+        self.durations = deque(maxlen=window)
+
+    def add(self, duration, queries):
+        self.requests += 1
+        self.queries += queries
+        self.durations.append(duration)
+
+    def summary(self):
+        durations = sorted(self.durations)
+        data = dict(
+            requests=self.requests,
+            queries_per_request=round(self.queries / self.requests, 2),
+        )
+        for percentile in PERCENTILES:
+            index = min(
+                len(durations) - 1, len(durations) * percentile // 100
+            )
+            data[f'p{percentile}_ms'] = round(durations[index] * 1000, 2)
+        return data
+
+
+def record(route, duration, queries) -> None:
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = RouteStats(
+                getattr(settings, 'METRICS_WINDOW', 1000)
+            )
+        stats.add(duration, queries)
+
+
+def metrics():
+    with _lock:
+        return {route: x.summary() for route, x in sorted(_routes.items())}
+
+
+def reset() -> None:
+    with _lock:
+        _routes.clear()
+
+
+def get_route(request):
+    match = request.resolver_match
+    if match is None:
+        return f'{request.method} <unresolved>'
+    return f'{request.method} /{match.route}'
+
+
+class InstrumentationMiddleware:
+    """
+        Должен стоять первым в MIDDLEWARE, чтобы время ответа
+        включало остальные middleware
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Соединения, открытые до загрузки middleware
+        for alias in connections:
+            install(connections[alias])
+        if asyncio.iscoroutinefunction(get_response):
+            # Так Django узнает async-middleware, как в MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        queries = QueryStats()
+        for alias in connections:
+            install(connections[alias])
+        token = _current.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_response(request, response, queries, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        queries = QueryStats()
+        token = _current.set(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_response(request, response, queries, started)
+
+    def process_response(self, request, response, queries, started):
+        self.set_server_timing(response, queries, started)
+        if response.streaming:
+            # Запросы выполняются во время отдачи тела ответа,
+            # в заголовок попадает только то, что было до него
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response,
+                queries, started
+            )
+        else:
+            self.finish(request, response, queries, started)
+        return response
+
+    def stream(self, content, request, response, queries, started):
+        token = _current.set(queries)
+        try:
+            yield from content
+        finally:
+            _current.reset(token)
+        self.finish(request, response, queries, started)
+
+    @staticmethod
+    def set_server_timing(response, queries, started):
+        total = (time.perf_counter() - started) * 1000
+        response['Server-Timing'] = (
+            f'db;desc="{queries.count} queries";'
+            f'dur={queries.duration * 1000:.2f}, '
+            f'total;dur={total:.2f}'
+        )
+
+    @staticmethod
+    def finish(request, response, queries, started):
+        duration = time.perf_counter() - started
+        route = get_route(request)
+        record(route, duration, queries.count)
+
+        repeated = queries.repeated(
+            getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+        )
+        logger.info(json.dumps(dict(
+            route=route,
+            path=request.path,
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 2),
+            queries=queries.count,
+            sql_ms=round(queries.duration * 1000, 2),
+            duplicates=queries.duplicates,
+        ), ensure_ascii=False))
+        for sql, count in repeated:
+            logger.warning(
+                'Возможен N+1: %s, запрос выполнен %s раз: %s',
+                route, count, sql[:500]
+            )
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise Http404
+        return Response(metrics())
@@ -0,0 +1,114 @@
+"""
+    Потоковое чтение CSV/JSON/JSONL для команд загрузки данных.
+
+    Файл читается построчно или блоками, в памяти держится только
+    текущая пачка.
+"""
+import csv
+import json
+
+from itertools import islice
+from pathlib import Path
+
+FORMATS = ('csv', 'json', 'jsonl')
+
+CHUNK_SIZE = 64 * 1024
+
+
+def detect_format(path, file_format=None) -> str:
+    """
+    :param path: путь к файлу
+    :param file_format: явно указанный формат
+    :return: формат из FORMATS, по умолчанию - по расширению файла
+    """
+    file_format = file_format or Path(path).suffix.lstrip('.').lower()
+    if file_format == 'ndjson':
+        file_format = 'jsonl'
+    if file_format not in FORMATS:
+        raise ValueError(f'Неизвестный формат файла: {file_format}')
+    return file_format
+
+
+def _csv_rows(file, fieldnames=None):
+    """
+        Если fieldnames заданы, заголовок в файле необязателен
+    """
+    rows = csv.DictReader(file, fieldnames)
+    for number, row in enumerate(rows):
+        if number == 0 and fieldnames and list(row.values()) == fieldnames:
+            continue
+        yield row
+
+
+def _skip(buffer, position, chars):
+    while position < len(buffer) and buffer[position] in chars:
+        position += 1
+    return position
+
+
+def _json_array_items(file):
+    """
+        Элементы JSON-массива верхнего уровня без загрузки файла целиком
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            position = _skip(buffer, position, ' \t\r\n,')
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ValueError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Элемент не поместился в буфер целиком
+                break
+            # Число на границе буфера может продолжаться в следующем блоке,
+            # поэтому элемент принимается только перед "," или "]"
+            end = _skip(buffer, end, ' \t\r\n')
+            if end == len(buffer) or buffer[end] not in ',]':
+                break
+            position = end
+            yield item
+        if not chunk:
+            raise ValueError('Неожиданный конец JSON-массива')
+
+
+def read_rows(path, file_format=None, fieldnames=None):
+    """
+        Генератор строк файла в виде dict
+    :param path: путь к файлу
+    :param file_format: csv, json или jsonl, по умолчанию - по расширению
+    :param fieldnames: колонки CSV-файла без заголовка
+    """
+    file_format = detect_format(path, file_format)
+    with open(path, encoding='utf-8', newline='') as file:
+        if file_format == 'csv':
+            yield from _csv_rows(file, fieldnames)
+        elif file_format == 'json':
+            yield from _json_array_items(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(rows, size):
+    """
+        Разбивает поток строк на списки не длиннее size
+    """
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
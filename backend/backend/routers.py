@@ -0,0 +1,31 @@
+"""
+    Маршрутизация запросов между подключениями к одной базе SQLite.
+"""
+from django.db import connections
+
+WRITE_DB = 'default'
+READ_DB = 'replica'
+
+
+class ReadReplicaRouter:
+    """
+        Чтение идет через подключение только для чтения READ_DB,
+        запись и чтение внутри транзакции - через WRITE_DB, чтобы
+        транзакция видела собственные изменения.
+        В режиме WAL читатели не ждут писателя и видят все
+        зафиксированные изменения, отставания реплики нет
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections[WRITE_DB].in_atomic_block:
+            return WRITE_DB
+        return READ_DB
+
+    def db_for_write(self, model, **hints):
+        return WRITE_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == WRITE_DB
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os.path
+import sys
 
 from pathlib import Path
 
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +61,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'backend.urls'
+# backend.asgi подставляет backend.asgi_urls с async-чтением
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'backend.urls')
 
 TEMPLATES = [
     {
@@ -84,11 +87,43 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': 'backend.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# DB_PROFILE=production: WAL и прагмы производительности, запись через
+# BEGIN IMMEDIATE с повтором при блокировке, чтение через отдельное
+# подключение только для чтения (backend.routers.ReadReplicaRouter).
+# Ожидание блокировки внутри SQLite останавливает весь воркер gevent,
+# поэтому timeout небольшой, а дальше повторы с паузой в Python
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+
+if DB_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    DATABASES['default']['OPTIONS'] = {
+        'timeout': 0.05,
+        'pragmas': {'journal_mode': 'WAL', **SQLITE_PRAGMAS},
+        'transaction_mode': 'IMMEDIATE',
+        'busy_retries': 8,
+    }
+    DATABASES['replica'] = {
+        'ENGINE': 'backend.sqlite3',
+        'NAME': f'file:{DATABASES["default"]["NAME"]}?mode=ro',
+        'OPTIONS': {
+            'timeout': 0.05,
+            'pragmas': {'query_only': 1, **SQLITE_PRAGMAS},
+            'busy_retries': 8,
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['backend.routers.ReadReplicaRouter']
+
 AUTH_USER_MODEL = "users.User"
 
 # Password validation
@@ -140,3 +175,99 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12
 }
+
+# Время жизни записи token -> user в кэше процесса, в секундах.
+# Выход и блокировка пользователя в другом воркере действуют
+# не позже чем через столько секунд
+TOKEN_CACHE_TTL = 5
+
+# TrueType-шрифт с кириллицей для выгрузки списка покупок в PDF
+SHOP_LIST_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+# Автодополнение ингредиентов: максимум результатов
+INGREDIENT_SEARCH_LIMIT = 50
+
+# Подбор рецептов по ингредиентам (/recipes/by_ingredients/)
+RECIPE_BY_INGREDIENTS_LIMIT = 100
+
+# Лог изменений рецептов для индексов в памяти (recipes.changes):
+# сколько последних строк хранить и как часто (раз во столько строк)
+# удалять старые. Индекс, отставший больше, строится заново
+RECIPE_CHANGES_KEEP = 100000
+RECIPE_CHANGES_TRIM_EVERY = 1000
+
+# Лента подписок (/recipes/feed/): длина ленты пользователя и как часто
+# (в среднем раз во столько добавлений) ленту обрезают до этой длины
+RECIPE_TIMELINE_LENGTH = 1000
+RECIPE_TIMELINE_TRIM_EVERY = 50
+
+# Похожие рецепты (/recipes/{id}/similar/): раз во столько измененных
+# рецептов их сигнатуры вливаются в основной индекс MinHash,
+# кол-во рецептов по умолчанию и максимум в ?limit=
+SIMILAR_RECIPES_MERGE_EVERY = 1000
+SIMILAR_RECIPES_COUNT = 6
+SIMILAR_RECIPES_LIMIT = 50
+
+# Кэш ответов анонимным пользователям (backend.cache): алиас из CACHES.
+# 'responses' - в памяти процесса, для одного воркера gunicorn;
+# 'shared-responses' - файлы в RESPONSE_CACHE_DIR, общие для всех
+# воркеров: RESPONSE_CACHE=shared-responses при GUNICORN_WORKERS > 1
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 300,
+    },
+    'shared-responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'RESPONSE_CACHE_DIR', os.path.join(BASE_DIR, 'cache')
+        ),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'responses')
+
+# Варианты картинок рецептов: (размер, формат, обрезка до размера).
+# Кодирование идет в пуле из RECIPE_IMAGE_WORKERS потоков,
+# 0 - синхронно в процессе сохранения
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': ((320, 320), 'JPEG', True),
+    'thumbnail_webp': ((320, 320), 'WEBP', True),
+    'webp': ((1280, 1280), 'WEBP', False),
+}
+RECIPE_IMAGE_WORKERS = 2
+
+# Инструментирование запросов (backend.instrumentation): /metrics/
+# включается переменной окружения, перцентили считаются по последним
+# METRICS_WINDOW запросам маршрута, повтор одного SQL-запроса
+# N_PLUS_ONE_THRESHOLD раз попадает в лог как возможный N+1
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+METRICS_WINDOW = 1000
+N_PLUS_ONE_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'backend.instrumentation': {
+            'handlers': ['console'],
+            'level': os.environ.get(
+                'INSTRUMENTATION_LOG_LEVEL',
+                # строки запросов не смешиваются с выводом тестов
+                'WARNING' if sys.argv[1:2] == ['test'] else 'INFO'
+            ),
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,76 @@
+"""
+    Бэкенд SQLite с настройками для нескольких воркеров.
+
+    Дополнительные ключи OPTIONS:
+        pragmas - PRAGMA, выполняемые при открытии подключения;
+        transaction_mode - режим BEGIN для atomic, IMMEDIATE берет
+            блокировку записи сразу, а не при первом изменении;
+        busy_retries, busy_backoff - повторы запроса вне транзакции
+            при "database is locked" с экспоненциальной паузой.
+
+    Пауза делается через time.sleep, поэтому под gevent другие
+    гринлеты продолжают работать, в отличие от ожидания внутри SQLite
+    (timeout подключения), так что timeout стоит держать небольшим.
+"""
+import random
+import time
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+EXTRA_OPTIONS = ('pragmas', 'transaction_mode', 'busy_retries', 'busy_backoff')
+
+MAX_BACKOFF = 1.0
+
+
+def is_busy_error(error) -> bool:
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+        self.pragmas = options.get('pragmas', dict())
+        self.transaction_mode = options.get('transaction_mode')
+        self.busy_retries = options.get('busy_retries', 0)
+        self.busy_backoff = options.get('busy_backoff', 0.01)
+        if self.busy_retries:
+            self.execute_wrappers.append(self._retry_busy)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for key in EXTRA_OPTIONS:
+            params.pop(key, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
+        else:
+            super()._start_transaction_under_autocommit()
+
+    def _retry_busy(self, execute, sql, params, many, context):
+        """
+            Повтор безопасен только вне транзакции: внутри нее
+            занятая база означает конфликт, который решает откат
+        """
+        attempt = 0
+        while True:
+            in_transaction = self.connection.in_transaction
+            try:
+                return execute(sql, params, many, context)
+            except OperationalError as error:
+                if (in_transaction or attempt >= self.busy_retries
+                        or not is_busy_error(error)):
+                    raise
+            delay = min(self.busy_backoff * 2 ** attempt, MAX_BACKOFF)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            attempt += 1
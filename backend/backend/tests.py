@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from unittest import mock
+
+from django.db import transaction
+from django.db import OperationalError
+from django.db import DatabaseError
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from rest_framework.test import APITestCase
+
+from recipes.models import IngredientUnit
+from recipes.models import CollectionVersion
+from recipes.search import ingredient_index
+from tags.models import Tag
+from users.models import User
+
+from . import warmup
+from . import instrumentation
+from .routers import ReadReplicaRouter
+from .conditional import get_version
+
+
+class SQLiteBackendTestCase(TransactionTestCase):
+    def setUp(self) -> None:
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'db.sqlite3')
+
+        def database(**options):
+            return dict(ENGINE='backend.sqlite3', NAME=path, OPTIONS=dict(
+                timeout=0.01, **options
+            ))
+
+        self.connections = ConnectionHandler(dict(
+            default=database(
+                pragmas=dict(journal_mode='WAL', synchronous='NORMAL'),
+                transaction_mode='IMMEDIATE'
+            ),
+            retrying=database(busy_retries=8, busy_backoff=0.01),
+            plain=database(),
+        ))
+        self.addCleanup(self.connections.close_all)
+        with self.connections['default'].cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+
+    def _insert(self, alias):
+        with self.connections[alias].cursor() as cursor:
+            cursor.execute('INSERT INTO item DEFAULT VALUES')
+
+    def test_pragmas(self):
+        with self.connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_busy_retry(self):
+        writer = self.connections['default']
+        writer._start_transaction_under_autocommit()
+
+        # BEGIN IMMEDIATE сразу забирает блокировку записи
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            self._insert('plain')
+        self._insert('default')
+
+        timer = threading.Timer(0.1, writer.connection.commit)
+        timer.start()
+        self._insert('retrying')
+        timer.join()
+
+        with self.connections['plain'].cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM item')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class ReadReplicaRouterTestCase(TransactionTestCase):
+    def test_routing(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(None), 'replica')
+        self.assertEqual(router.db_for_write(None), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(None), 'default')
+        self.assertTrue(router.allow_migrate('default', 'recipes'))
+        self.assertFalse(router.allow_migrate('replica', 'recipes'))
+
+
+@override_settings(RESPONSE_CACHE=None, N_PLUS_ONE_THRESHOLD=2)
+class InstrumentationTestCase(APITestCase):
+    def setUp(self) -> None:
+        instrumentation.reset()
+        self.addCleanup(instrumentation.reset)
+        Tag.objects.create(name='Tag', slug='tag')
+        # Строка версии создается при первом чтении
+        get_version('tags')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@mail.ru', password='12345678'
+        )
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response['Server-Timing'],
+            rf'^db;desc="{len(queries)} queries";dur=[\d.]+, '
+            r'total;dur=[\d.]+$'
+        )
+
+    def test_log_line(self):
+        with self.assertLogs('backend.instrumentation', 'INFO') as logs:
+            self.client.get('/tags/')
+        data = json.loads(logs.records[0].getMessage())
+        self.assertEqual(data['route'], 'GET /^tags/$')
+        self.assertEqual(data['status'], 200)
+        # Версия коллекции и тэги
+        self.assertEqual(data['queries'], 2)
+
+    def test_n_plus_one(self):
+        def view(request):
+            for _ in range(2):
+                Tag.objects.first()
+            return HttpResponse()
+
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        with self.assertLogs('backend.instrumentation', 'WARNING') as logs:
+            middleware(request)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Возможен N+1', logs.records[0].getMessage())
+
+    def test_metrics(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+
+        for _ in range(3):
+            self.client.get('/tags/')
+        with override_settings(METRICS_ENABLED=True):
+            response = self.client.get('/metrics/')
+            self.client.force_authenticate(None)
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(response.status_code, 200)
+        stats = response.data['GET /^tags/$']
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['queries_per_request'], 2)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+
+@mock.patch.object(warmup.connections, 'close_all')
+class WarmUpTestCase(APITestCase):
+    def setUp(self) -> None:
+        ingredient_index.invalidate()
+        self.addCleanup(ingredient_index.invalidate)
+        IngredientUnit.objects.create(name='Соль', measurement_unit='г')
+
+    def test_warm_up(self, close_all):
+        result = warmup.warm_up(freeze=False)
+        close_all.assert_called_once()
+        self.assertGreater(result['serializers'], 0)
+        self.assertEqual(
+            CollectionVersion.objects.filter(
+                name__in=warmup.COLLECTIONS
+            ).count(),
+            len(warmup.COLLECTIONS)
+        )
+        # Только версия коллекции: индекс уже построен
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                ingredient_index.search('сол', 10)[0]['name'], 'Соль'
+            )
+
+    def test_database_error(self, close_all):
+        with mock.patch.object(
+                warmup, 'prime_caches', side_effect=DatabaseError('no table')
+        ), self.assertLogs('backend.warmup', 'WARNING'):
+            result = warmup.warm_up(freeze=False)
+        self.assertGreater(result['serializers'], 0)
+        close_all.assert_called_once()
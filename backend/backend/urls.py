@@ -20,10 +20,15 @@ from django.conf import settings
 from django.urls import path
 from django.urls import include
 
+from .cache import ResponseCacheStatsView
+from .instrumentation import MetricsView
+
 urlpatterns = [
     path('', include('users.urls')),
     path('', include('tags.urls')),
-    path('', include('recipes.urls'))
+    path('', include('recipes.urls')),
+    path('cache/stats/', ResponseCacheStatsView.as_view()),
+    path('metrics/', MetricsView.as_view()),
 ]
 
 if settings.DEBUG:
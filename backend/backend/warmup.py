@@ -0,0 +1,131 @@
+"""
+    Прогрев процесса перед fork воркеров gunicorn (preload_app).
+
+    Все, что воркер иначе делал бы на первых запросах, выполняется
+    один раз в мастере: импорт представлений и сериализаторов,
+    построение полей сериализаторов и кэшей _meta моделей, загрузка
+    переводов, индекс ингредиентов и версии коллекций. Затем соединения
+    с базой закрываются, а объекты замораживаются gc.freeze(), чтобы
+    сборщик мусора воркеров не трогал их и страницы памяти оставались
+    общими (copy-on-write).
+"""
+import gc
+import inspect
+import logging
+import time
+
+from importlib import import_module
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError
+from django.db import connections
+from django.urls import get_resolver
+from django.utils import translation
+
+from rest_framework.serializers import Serializer
+
+from .conditional import get_version
+
+logger = logging.getLogger(__name__)
+
+# Версии, по которым считаются валидаторы списков и карточек
+COLLECTIONS = ('tags', 'ingredients')
+
+
+def _app_modules(name):
+    """
+        Модули name приложений проекта (без django и сторонних пакетов)
+    """
+    for config in apps.get_app_configs():
+        path = config.path
+        if not path.startswith(str(settings.BASE_DIR)) \
+                or 'site-packages' in path:
+            continue
+        try:
+            yield import_module(f'{config.name}.{name}')
+        except ModuleNotFoundError as e:
+            if e.name != f'{config.name}.{name}':
+                raise
+
+
+def _local_classes(module, base):
+    for value in vars(module).values():
+        if inspect.isclass(value) and issubclass(value, base) \
+                and value.__module__ == module.__name__:
+            yield value
+
+
+def build_serializers() -> int:
+    """
+        Строит поля всех сериализаторов приложений: ModelSerializer
+        разбирает модель при каждом создании, но импорты DRF, кэши
+        _meta моделей и ленивые строки полей заполняются один раз
+    :return: кол-во сериализаторов
+    """
+    count = 0
+    for module in _app_modules('serializers'):
+        for serializer_class in _local_classes(module, Serializer):
+            serializer_class(context=dict()).fields
+            count += 1
+    return count
+
+
+def load_urls() -> None:
+    """
+        Импортирует urlconf (а с ним представления и сериализаторы)
+        и заполняет таблицы reverse
+    """
+    get_resolver().reverse_dict
+
+
+def prime_caches() -> None:
+    """
+        Индексы в памяти, тэги и версии коллекций. Строки версий
+        создаются в таблице CollectionVersion до запуска воркеров,
+        а индексы после fork догоняют изменения по логу recipes.changes
+        и версиям коллекций. Чтение таблиц прогревает страничный кэш ОС
+    """
+    from recipes.models import Recipe
+    from recipes.search import ingredient_index
+    from recipes.coverage import recipe_ingredient_index
+    from recipes.tag_bitmaps import tag_index
+    from recipes.similar import similar_index
+    from tags.models import Tag
+
+    ingredient_index.build()
+    recipe_ingredient_index.build()
+    tag_index.build()
+    similar_index.build()
+    list(Tag.objects.all())
+    Recipe.objects.count()
+    for collection in COLLECTIONS:
+        get_version(collection)
+
+
+def warm_up(freeze=True):
+    """
+        Прогревает процесс. Ошибки базы (например, нет таблиц до migrate)
+        не мешают запуску: кэши заполнятся на первых запросах
+    :param freeze: заморозить объекты для copy-on-write после fork
+    :return: dict(duration, serializers, frozen)
+    """
+    started = time.perf_counter()
+    load_urls()
+    with translation.override(settings.LANGUAGE_CODE):
+        serializers = build_serializers()
+    try:
+        prime_caches()
+    except DatabaseError as e:
+        logger.warning('Кэши не прогреты: %s', e)
+    finally:
+        # Соединения SQLite нельзя разделять между процессами
+        connections.close_all()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    return dict(
+        duration=time.perf_counter() - started,
+        serializers=serializers,
+        frozen=gc.get_freeze_count(),
+    )
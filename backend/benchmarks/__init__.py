@@ -0,0 +1,57 @@
+"""
+
+    Бенчмарки запускаются из каталога backend:
+
+        python -m benchmarks.<имя модуля>
+
+    Данные создаются в тестовой базе, рабочая db.sqlite3 не затрагивается.
+
+"""
+import os
+import time
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment(debug=False)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    connection.queries_log.clear()
+
+
+def measure(func, count):
+    """
+        Выполняет func count раз
+    :param func: функция без аргументов
+    :param count: кол-во вызовов
+    :return: кол-во вызовов в секунду
+    """
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - started)
+
+
+def count_queries(func):
+    """
+        Считает SQL-запросы, выполненные func
+    :param func: функция без аргументов
+    :return: кол-во запросов
+    """
+    from django.db import connection
+
+    executed = []
+
+    def wrapper(execute, sql, params, many, context):
+        executed.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        func()
+    return len(executed)
@@ -0,0 +1,227 @@
+"""
+
+    Нагрузочный прогон API на синтетических данных generate_dataset.
+
+    Запросы идут в WSGI-приложение в том же процессе, без сети,
+    результат печатается в JSON для сравнения прогонов:
+
+        python -m benchmarks.bench_api --recipes 100000 > before.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from urllib.parse import quote
+
+from . import setup
+
+PERCENTILES = (50, 95, 99)
+SEARCH = ('суп', 'сал', 'пир', 'ка', 'п')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Запросов к каждому сценарию'
+    )
+    parser.add_argument(
+        '--warmup', type=int, default=20,
+        help='Запросов перед замером, в результат не входят'
+    )
+    parser.add_argument(
+        '--cache', action='store_true',
+        help='Не отключать кэш ответов'
+    )
+    parser.add_argument(
+        '--only', action='append',
+        help='Запустить только указанные сценарии'
+    )
+    return parser.parse_args()
+
+
+def scenarios(rnd, recipes, tags, authors):
+    """
+        Имя сценария -> (нужна ли авторизация, функция, возвращающая путь)
+    """
+    return {
+        'recipes_list': (
+            False, lambda: f'/recipes/?page={rnd.randint(1, 50)}'
+        ),
+        'recipes_list_auth': (
+            True, lambda: f'/recipes/?page={rnd.randint(1, 50)}'
+        ),
+        'recipes_by_tag': (
+            True, lambda: f'/recipes/?tags={rnd.choice(tags)}'
+        ),
+        'recipes_by_author': (
+            False, lambda: f'/recipes/?author={rnd.choice(authors)}'
+        ),
+        'recipe_detail': (
+            True, lambda: f'/recipes/{rnd.choice(recipes)}/'
+        ),
+        'ingredients_search': (
+            False, lambda: f'/ingredients/?name={rnd.choice(SEARCH)}'
+        ),
+        'users_list': (
+            True, lambda: f'/users/?page={rnd.randint(1, 20)}'
+        ),
+        'subscriptions': (
+            True, lambda: '/users/subscriptions/?recipes_limit=3'
+        ),
+        'download_shopping_cart': (
+            True, lambda: '/recipes/download_shopping_cart/'
+        ),
+    }
+
+
+def environ(path, token=None):
+    from wsgiref.util import setup_testing_defaults
+
+    path, _, query = path.partition('?')
+    data = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': quote(query, safe='=&'),
+        'wsgi.input': io.BytesIO(),
+    }
+    if token:
+        data['HTTP_AUTHORIZATION'] = f'Token {token}'
+    setup_testing_defaults(data)
+    return data
+
+
+def request(application, path, token):
+    """
+    :return: код ответа
+    """
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(int(value.split()[0]))
+
+    body = application(environ(path, token), start_response)
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return status[0]
+
+
+def percentile(values, value):
+    return values[min(len(values) - 1, len(values) * value // 100)]
+
+
+def run(application, make_path, token, count, warmup):
+    from django.db import connection
+
+    from backend.instrumentation import QueryStats
+
+    for _ in range(warmup):
+        request(application, make_path(), token)
+
+    timings = []
+    statuses = dict()
+    queries = QueryStats()
+    started = time.perf_counter()
+    with connection.execute_wrapper(queries):
+        for _ in range(count):
+            request_started = time.perf_counter()
+            code = request(application, make_path(), token)
+            timings.append(time.perf_counter() - request_started)
+            statuses[code] = statuses.get(code, 0) + 1
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    result = dict(
+        requests=count,
+        rps=round(count / elapsed, 1),
+        queries_per_request=round(queries.count / count, 2),
+        sql_ms_per_request=round(queries.duration * 1000 / count, 3),
+        statuses=statuses,
+    )
+    for value in PERCENTILES:
+        result[f'p{value}_ms'] = round(percentile(timings, value) * 1000, 3)
+    return result
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from rest_framework.authtoken.models import Token
+
+    from tags.models import Tag
+    from users.models import User
+    from recipes.models import Recipe
+
+    if not args.cache:
+        settings.RESPONSE_CACHE = None
+    # Строки лога на каждый запрос искажают замер
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    call_command(
+        'generate_dataset', users=args.users, recipes=args.recipes,
+        seed=args.seed, stdout=io.StringIO()
+    )
+    generated = time.perf_counter() - started
+
+    # Самый активный пользователь: больше всего подписок и покупок
+    user = User.objects.order_by('id').first()
+    token = Token.objects.get_or_create(user=user)[0].key
+
+    rnd = random.Random(args.seed)
+    recipes = list(Recipe.objects.values_list('id', flat=True))
+    tags = list(Tag.objects.values_list('slug', flat=True))
+    authors = list(
+        User.objects.filter(recipes_count__gt=0).values_list('id', flat=True)
+    )
+
+    application = get_wsgi_application()
+    results = dict()
+    for name, (auth, make_path) in scenarios(
+            rnd, recipes, tags, authors
+    ).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = run(
+            application, make_path, token if auth else None,
+            args.requests, args.warmup
+        )
+
+    json.dump(dict(
+        dataset=dict(
+            users=args.users,
+            recipes=args.recipes,
+            seed=args.seed,
+            generate_seconds=round(generated, 1),
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+            response_cache=args.cache,
+        ),
+        scenarios=results,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
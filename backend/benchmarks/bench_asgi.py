@@ -0,0 +1,229 @@
+"""
+
+    Чтение ленты, карточки рецепта, тэгов и поиска ингредиентов
+    при 500 одновременных соединениях: gunicorn с воркерами gevent
+    (WSGI, backend.urls) против gunicorn с воркерами uvicorn
+    (ASGI, async-представления backend.asgi_urls).
+
+    Серверы запускаются отдельными процессами на файловой базе
+    профиля production, нагрузку дает клиент на asyncio с keep-alive:
+
+        python -m benchmarks.bench_asgi --recipes 10000 > asgi.json
+
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from urllib.parse import quote
+
+BACKEND = Path(__file__).resolve().parent.parent
+PERCENTILES = (50, 95, 99)
+SEARCH = ('суп', 'сал', 'пир', 'ка', 'п')
+CONTENT_LENGTH = re.compile(rb'content-length:\s*(\d+)', re.IGNORECASE)
+
+DEPLOYMENTS = {
+    'wsgi_gevent': [
+        'backend.wsgi:application', '-k', 'gevent',
+        '--worker-connections', '1000',
+    ],
+    'asgi_uvicorn': [
+        'backend.asgi:application', '-k', 'uvicorn.workers.UvicornWorker',
+    ],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=10_000)
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument(
+        '--duration', type=float, default=10,
+        help='Секунд нагрузки на каждый сценарий'
+    )
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def scenarios(rnd, recipes):
+    """
+        Имя сценария -> (нужна ли авторизация, функция, возвращающая путь)
+    """
+    return {
+        'recipes_list': (
+            True, lambda: f'/recipes/?page={rnd.randint(1, 50)}'
+        ),
+        'recipe_detail': (
+            True, lambda: f'/recipes/{rnd.randint(1, recipes)}/'
+        ),
+        'tags': (False, lambda: '/tags/'),
+        'ingredients_search': (
+            False, lambda: f'/ingredients/?name={quote(rnd.choice(SEARCH))}'
+        ),
+    }
+
+
+def manage(env, *args):
+    return subprocess.run(
+        [sys.executable, 'manage.py', *args], cwd=BACKEND, env=env,
+        check=True, capture_output=True, text=True
+    ).stdout
+
+
+def prepare(env, args):
+    """
+    :return: токен первого пользователя
+    """
+    manage(env, 'migrate', '--run-syncdb', '--verbosity=0')
+    manage(
+        env, 'generate_dataset', f'--users={args.users}',
+        f'--recipes={args.recipes}', f'--seed={args.seed}'
+    )
+    output = manage(
+        env, 'drf_create_token', 'user_0@dataset.example'
+    )
+    return output.split()[2]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('Сервер не запустился')
+
+
+async def connection(port, make_path, headers, deadline, timings, counts):
+    reader = writer = None
+    while time.monotonic() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port
+                )
+            started = time.perf_counter()
+            writer.write(
+                f'GET {make_path()} HTTP/1.1\r\n'
+                f'Host: localhost\r\n{headers}\r\n'.encode()
+            )
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = CONTENT_LENGTH.search(head)
+            await reader.readexactly(int(length.group(1)) if length else 0)
+            timings.append(time.perf_counter() - started)
+            status = int(head.split(b' ', 2)[1])
+            counts[status] = counts.get(status, 0) + 1
+            if b'connection: close' in head.lower():
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError):
+            counts['errors'] = counts.get('errors', 0) + 1
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, make_path, headers, connections, duration):
+    timings = []
+    counts = dict()
+    started = time.monotonic()
+    await asyncio.gather(*(
+        connection(
+            port, make_path, headers, started + duration, timings, counts
+        ) for _ in range(connections)
+    ))
+    elapsed = time.monotonic() - started
+    timings.sort()
+    result = dict(
+        requests=len(timings),
+        rps=round(len(timings) / elapsed, 1),
+        statuses={str(k): v for k, v in counts.items()},
+    )
+    for value in PERCENTILES:
+        index = min(len(timings) - 1, len(timings) * value // 100)
+        result[f'p{value}_ms'] = (
+            round(timings[index] * 1000, 1) if timings else None
+        )
+    return result
+
+
+def run(deployment, env, args, token):
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', *DEPLOYMENTS[deployment],
+            '-b', f'127.0.0.1:{port}', '-w', str(args.workers),
+            '--backlog', str(args.connections * 2),
+        ],
+        cwd=BACKEND, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(port)
+        rnd = random.Random(args.seed)
+        results = dict()
+        for name, (auth, make_path) in scenarios(
+                rnd, args.recipes
+        ).items():
+            headers = f'Authorization: Token {token}\r\n' if auth else ''
+            results[name] = asyncio.run(load(
+                port, make_path, headers, args.connections, args.duration
+            ))
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='backend.settings',
+        DB_PROFILE='production',
+        SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+        INSTRUMENTATION_LOG_LEVEL='WARNING',
+    )
+    try:
+        token = prepare(env, args)
+        results = {
+            name: run(name, env, args, token) for name in DEPLOYMENTS
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    json.dump(dict(
+        dataset=dict(users=args.users, recipes=args.recipes, seed=args.seed),
+        connections=args.connections,
+        duration=args.duration,
+        workers=args.workers,
+        deployments=results,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+
+    Запросы в секунду к списку рецептов с токеном
+    до (TokenAuthentication) и после (CachedTokenAuthentication)
+
+"""
+from . import setup
+from . import measure
+from . import count_queries
+
+REQUESTS = 500
+
+
+def main():
+    setup()
+
+    from unittest import mock
+
+    from rest_framework.test import APIClient
+    from rest_framework.authentication import TokenAuthentication
+
+    from users.models import User
+    from recipes.models import Recipe
+    from recipes.views import RecipeViewSet
+
+    user = User.objects.create_user(
+        username='bench', email='bench@mail.ru', password='12345678'
+    )
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=user, image='recipe.png', name=f'Рецепт {i}',
+            text='string', cooking_time=1
+        ) for i in range(12)
+    )
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {user.auth_token.key}')
+
+    def request():
+        client.get('/recipes/')
+
+    def run(name):
+        request()
+        queries = count_queries(request)
+        rps = measure(request, REQUESTS)
+        print(f'{name:<26} {rps:8.1f} req/s, {queries} SQL/request')
+
+    with mock.patch.object(
+            RecipeViewSet, 'authentication_classes', (TokenAuthentication,)
+    ):
+        run('TokenAuthentication')
+    run('CachedTokenAuthentication')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+
+    Поиск по индексу автодополнения ингредиентов на 100k названий
+
+"""
+import random
+import time
+
+from . import setup
+
+CATALOGUE = 100_000
+QUERIES = 2000
+LIMIT = 50
+
+
+def main():
+    setup()
+
+    from recipes.search import IngredientIndex
+
+    rnd = random.Random(0)
+    alphabet = 'абвгдеёжзийклмнопрстуфхцчшщьыэюя'
+
+    def word():
+        return ''.join(rnd.choices(alphabet, k=rnd.randint(3, 9)))
+
+    rows = [
+        (i, ' '.join(word() for _ in range(rnd.randint(1, 3))).capitalize(),
+         'г')
+        for i in range(CATALOGUE)
+    ]
+
+    index = IngredientIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    print(f'build: {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    names = [x[1] for x in rows]
+    for kind, make_query in (
+            ('prefix', lambda n: n[:rnd.randint(1, 4)].upper()),
+            ('substring', lambda n: n[1:rnd.randint(3, 6)]),
+            ('rare', lambda n: n[-5:] + 'ъ'),
+    ):
+        timings = []
+        for _ in range(QUERIES):
+            query = make_query(rnd.choice(names))
+            started = time.perf_counter()
+            index.search(query, LIMIT)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p50 = timings[len(timings) // 2] * 1000
+        p99 = timings[int(len(timings) * 0.99)] * 1000
+        print(f'{kind:<10} p50 {p50:.3f} ms, p99 {p99:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
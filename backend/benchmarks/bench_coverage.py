@@ -0,0 +1,172 @@
+"""
+
+    Подбор рецептов по ингредиентам (/recipes/by_ingredients/):
+    индекс в памяти против GROUP BY ... HAVING по таблице Ingredient.
+    По умолчанию 100 тыс. рецептов до 20 ингредиентов, около
+    1 млн строк Ingredient:
+
+        python -m benchmarks.bench_coverage > coverage.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from . import setup
+from .bench_api import run
+from .bench_api import percentile
+from .bench_api import PERCENTILES
+
+# Кол-во ингредиентов в запросе
+SIZES = (3, 10, 30)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=100_000)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Запросов к каждому сценарию'
+    )
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument(
+        '--baseline-requests', type=int, default=5,
+        help='Запросов GROUP BY к каждому сценарию'
+    )
+    return parser.parse_args()
+
+
+def timings(func, count):
+    values = []
+    for _ in range(count):
+        started = time.perf_counter()
+        func()
+        values.append(time.perf_counter() - started)
+    values.sort()
+    return {
+        f'p{x}_ms': round(percentile(values, x) * 1000, 3)
+        for x in PERCENTILES
+    }
+
+
+def group_by(unit_ids, max_missing):
+    """
+        Тот же подбор одним SQL-запросом: первая страница
+    """
+    from django.db.models import Q
+    from django.db.models import F
+    from django.db.models import Count
+
+    from recipes.models import Ingredient
+
+    queryset = Ingredient.objects.order_by().values('recipes_id').annotate(
+        matched=Count('id', filter=Q(ingredient_unit_id__in=unit_ids)),
+        missing=Count('id') - Count(
+            'id', filter=Q(ingredient_unit_id__in=unit_ids)
+        ),
+    ).filter(matched__gt=0)
+    if max_missing is not None:
+        queryset = queryset.filter(missing__lte=max_missing)
+    return list(queryset.order_by(
+        'missing', F('matched').desc(), F('recipes_id').desc()
+    )[:12])
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from recipes.models import Ingredient
+    from recipes.models import IngredientUnit
+    from recipes.coverage import recipe_ingredient_index
+
+    settings.RESPONSE_CACHE = None
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    call_command(
+        'generate_dataset', users=args.users, recipes=args.recipes,
+        ingredients_per_recipe=args.ingredients_per_recipe,
+        seed=args.seed, stdout=io.StringIO()
+    )
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    recipe_ingredient_index.build()
+    built = time.perf_counter() - started
+
+    rnd = random.Random(args.seed)
+    units = list(IngredientUnit.objects.values_list('id', flat=True))
+
+    def make_units(size):
+        # Популярные ингредиенты в начале, как в generate_dataset
+        return {
+            units[int(len(units) * rnd.random() ** 2)] for _ in range(size)
+        }
+
+    application = get_wsgi_application()
+    scenarios = dict()
+    for size in SIZES:
+        for mode, max_missing in (('partial', None), ('full', 0)):
+            name = f'{mode}_{size}'
+
+            def make_path(size=size, max_missing=max_missing):
+                path = '/recipes/by_ingredients/?ingredients=' + ','.join(
+                    map(str, make_units(size))
+                )
+                if max_missing is not None:
+                    path += f'&max_missing={max_missing}'
+                return path
+
+            scenarios[name] = dict(
+                index=timings(
+                    lambda size=size, max_missing=max_missing:
+                    recipe_ingredient_index.search(
+                        make_units(size), max_missing
+                    ),
+                    args.requests
+                ),
+                api=run(
+                    application, make_path, None,
+                    args.requests, args.warmup
+                ),
+                group_by=timings(
+                    lambda size=size, max_missing=max_missing:
+                    group_by(make_units(size), max_missing),
+                    args.baseline_requests
+                ),
+            )
+
+    json.dump(dict(
+        dataset=dict(
+            users=args.users,
+            recipes=args.recipes,
+            ingredient_rows=Ingredient.objects.count(),
+            seed=args.seed,
+            generate_seconds=round(generated, 1),
+            index_build_seconds=round(built, 2),
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+        ),
+        scenarios=scenarios,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
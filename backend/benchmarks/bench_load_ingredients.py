@@ -0,0 +1,110 @@
+"""
+
+    Загрузка справочника ингредиентов из файлов на 1M строк
+
+"""
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from . import setup
+
+ROWS = 1_000_000
+UNIQUE = 900_000
+BATCH_SIZE = 5000
+
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщьыэюя'
+UNITS = ('г', 'кг', 'мл', 'шт.', 'по вкусу')
+
+
+def name(number):
+    letters = []
+    while True:
+        number, digit = divmod(number, len(ALPHABET))
+        letters.append(ALPHABET[digit])
+        if not number:
+            return ''.join(letters).capitalize()
+
+
+def generate_rows():
+    """
+        Строки без промежуточного списка, чтобы максимальный RSS
+        показывал память загрузчика. Последние 10% - повторы
+    """
+    rnd = random.Random(0)
+    for i in range(ROWS):
+        number = rnd.randrange(UNIQUE) if i >= UNIQUE else i
+        yield name(number), UNITS[number % len(UNITS)]
+
+
+def write_files(directory):
+    paths = dict(
+        csv=os.path.join(directory, 'ingredients.csv'),
+        json=os.path.join(directory, 'ingredients.json'),
+    )
+    with open(paths['csv'], 'w', encoding='utf-8') as file:
+        file.writelines(f'{x},{unit}\n' for x, unit in generate_rows())
+    with open(paths['json'], 'w', encoding='utf-8') as file:
+        file.write('[\n')
+        for i, (x, unit) in enumerate(generate_rows()):
+            file.write(',\n' if i else '')
+            file.write(json.dumps(
+                dict(name=x, measurement_unit=unit), ensure_ascii=False
+            ))
+        file.write('\n]\n')
+    return paths
+
+
+def clear():
+    from django.db import connection
+
+    from recipes.models import IngredientUnit
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {IngredientUnit._meta.db_table}')
+
+
+def load(path):
+    from django.core.management import call_command
+
+    from recipes.models import IngredientUnit
+
+    started = time.perf_counter()
+    call_command(
+        'load_ingredients', path, f'--batch-size={BATCH_SIZE}',
+        stdout=io.StringIO()
+    )
+    return time.perf_counter() - started, IngredientUnit.objects.count()
+
+
+def main():
+    setup()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_files(directory)
+        for file_format, path in paths.items():
+            clear()
+            elapsed, count = load(path)
+            print(
+                f'{file_format:<5} {ROWS / elapsed:,.0f} rows/s, '
+                f'{count} rows in table'
+            )
+
+        # Таблица тестовой базы лежит в памяти процесса, поэтому
+        # память загрузчика считается по куче Python, без SQLite
+        for file_format, path in paths.items():
+            clear()
+            tracemalloc.start()
+            load(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{file_format:<5} peak Python heap {peak / 2 ** 20:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+
+    Время ответа ленты рецептов на первой и на 10 000-й странице:
+    пагинация по номеру страницы против пагинации по курсору
+
+"""
+import time
+
+from . import setup
+
+RECIPES = 120_012
+PAGE = 10_000
+REPEAT = 20
+
+
+def main():
+    setup()
+
+    from django.conf import settings
+
+    from rest_framework.test import APIClient
+    from rest_framework.pagination import Cursor
+
+    from tags.models import Tag
+    from users.models import User
+    from recipes.models import Recipe
+    from recipes.pagination import RecipeCursorPagination
+
+    settings.RESPONSE_CACHE = None
+
+    user = User.objects.create_user(
+        username='bench', email='bench@mail.ru', password='12345678'
+    )
+    tag = Tag.objects.create(name='Обед', slug='lunch')
+    for start in range(0, RECIPES, 10_000):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=user, image='recipe.png', name=f'Рецепт {i}',
+                text='string', cooking_time=1
+            ) for i in range(start, min(start + 10_000, RECIPES))
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=x, tag=tag) for x in recipes
+        )
+
+    # Курсор 10 000-й страницы указывает на последний id 9 999-й
+    position = Recipe.objects.values_list(
+        'id', flat=True
+    )[(PAGE - 1) * 12 - 1]
+    paginator = RecipeCursorPagination()
+    paginator.base_url = 'http://testserver/recipes/?tags=lunch'
+    deep_cursor = paginator.encode_cursor(
+        Cursor(offset=0, reverse=False, position=position)
+    )
+
+    client = APIClient()
+    for name, url in (
+            ('page=1', '/recipes/?tags=lunch&page=1'),
+            (f'page={PAGE}', f'/recipes/?tags=lunch&page={PAGE}'),
+            ('cursor first page', '/recipes/?tags=lunch&cursor='),
+            (f'cursor page {PAGE}', deep_cursor),
+    ):
+        timings = []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+        assert len(response.data['results']) == 12
+        timings.sort()
+        print(f'{name:<20} {timings[len(timings) // 2] * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
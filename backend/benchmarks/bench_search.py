@@ -0,0 +1,160 @@
+"""
+
+    Задержка полнотекстового поиска рецептов (?search=, FTS5)
+    на синтетических данных generate_dataset, по умолчанию 500 тыс.
+    рецептов. Для сравнения тот же поиск через icontains
+    по названию и описанию - полный проход таблицы:
+
+        python -m benchmarks.bench_search --recipes 500000 > search.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from . import setup
+from .bench_api import run
+from .bench_api import percentile
+from .bench_api import PERCENTILES
+
+QUERIES = {
+    # Слово из названия примерно каждого 14-го рецепта
+    'common_word': lambda rnd: rnd.choice(('суп', 'салат', 'плов')),
+    'two_words': lambda rnd: f"{rnd.choice(('суп', 'паста'))} острый",
+    'prefix': lambda rnd: rnd.choice(('запек', 'котл', 'пря')),
+    'selective': lambda rnd: f'№{rnd.randint(0, 1000)}',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--recipes', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=100,
+        help='Запросов к каждому сценарию'
+    )
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument(
+        '--baseline-requests', type=int, default=5,
+        help='Запросов icontains к каждому сценарию'
+    )
+    return parser.parse_args()
+
+
+def scenarios(rnd, tags, authors):
+    """
+        Имя сценария -> функция, возвращающая путь.
+        Строку запроса кодирует bench_api.environ
+    """
+    result = dict()
+    for name, make_query in QUERIES.items():
+        result[name] = (
+            lambda make_query=make_query:
+            f'/recipes/?search={make_query(rnd)}'
+        )
+    word = QUERIES['common_word']
+    result['with_tag'] = (
+        lambda: f'/recipes/?search={word(rnd)}&tags={rnd.choice(tags)}'
+    )
+    result['with_author'] = (
+        lambda: f'/recipes/?search={word(rnd)}&author={rnd.choice(authors)}'
+    )
+    return result
+
+
+def icontains(rnd, make_query, count):
+    """
+        Первая страница и count() для поиска через icontains
+    :return: задержки в мс по перцентилям
+    """
+    from django.db.models import Q
+
+    from recipes.models import Recipe
+
+    timings = []
+    for _ in range(count):
+        query = Q()
+        for word in make_query(rnd).split():
+            query &= Q(name__icontains=word) | Q(text__icontains=word)
+        started = time.perf_counter()
+        queryset = Recipe.objects.filter(query).order_by('-id')
+        queryset.count()
+        list(queryset[:12])
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        f'p{x}_ms': round(percentile(timings, x) * 1000, 3)
+        for x in PERCENTILES
+    }
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from tags.models import Tag
+    from users.models import User
+
+    settings.RESPONSE_CACHE = None
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    call_command(
+        'generate_dataset', users=args.users, recipes=args.recipes,
+        seed=args.seed, stdout=io.StringIO()
+    )
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    call_command('rebuild_search_index', optimize=True, stdout=io.StringIO())
+    indexed = time.perf_counter() - started
+
+    rnd = random.Random(args.seed)
+    tags = list(Tag.objects.values_list('slug', flat=True))
+    authors = list(
+        User.objects.filter(recipes_count__gt=0).values_list('id', flat=True)
+    )
+
+    application = get_wsgi_application()
+    results = dict()
+    for name, make_path in scenarios(rnd, tags, authors).items():
+        results[name] = run(
+            application, make_path, None, args.requests, args.warmup
+        )
+    baseline = {
+        name: icontains(rnd, make_query, args.baseline_requests)
+        for name, make_query in QUERIES.items()
+    }
+
+    json.dump(dict(
+        dataset=dict(
+            users=args.users,
+            recipes=args.recipes,
+            seed=args.seed,
+            generate_seconds=round(generated, 1),
+            rebuild_index_seconds=round(indexed, 1),
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+        ),
+        scenarios=results,
+        icontains=baseline,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
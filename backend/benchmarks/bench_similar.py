@@ -0,0 +1,176 @@
+"""
+
+    Похожие рецепты (/recipes/{id}/similar/): построение индекса
+    MinHash/LSH на синтетических строках Ingredient (по умолчанию
+    1 млн рецептов, до 20 ингредиентов), задержка поиска и полнота
+    top-k по сравнению с перебором всех сигнатур. Задержка API -
+    на базе generate_dataset меньшего размера:
+
+        python -m benchmarks.bench_similar > similar.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from . import setup
+from .bench_api import run
+from .bench_coverage import timings
+
+RECALL_SIMILARITY = 0.5
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--recipes', type=int, default=1_000_000)
+    parser.add_argument('--ingredients', type=int, default=2000)
+    parser.add_argument('--ingredients-per-recipe', type=int, default=20)
+    parser.add_argument('--count', type=int, default=6, help='top-k')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Запросов к индексу и к API'
+    )
+    parser.add_argument(
+        '--recall-queries', type=int, default=50,
+        help='Запросов для сравнения с перебором сигнатур'
+    )
+    parser.add_argument(
+        '--api-recipes', type=int, default=50_000,
+        help='Рецептов в базе для замера API, 0 - без API'
+    )
+    parser.add_argument('--warmup', type=int, default=10)
+    return parser.parse_args()
+
+
+def synthetic_rows(args):
+    """
+        Пары (recipe_id, ingredient_unit_id): популярные ингредиенты
+        встречаются чаще, как в generate_dataset
+    """
+    rng = np.random.default_rng(args.seed)
+    sizes = rng.integers(1, args.ingredients_per_recipe + 1, args.recipes)
+    recipes = np.repeat(np.arange(1, args.recipes + 1), sizes)
+    units = 1 + (
+        args.ingredients * rng.random(len(recipes)) ** 2
+    ).astype(np.int64)
+    return np.column_stack((recipes, units))
+
+
+def full_scan(index, recipe_id, count):
+    """
+        Top-k перебором всех сигнатур: эталон для полноты LSH
+    """
+    ids = index._ids
+    values = index._signatures
+    signature = values[np.searchsorted(ids, recipe_id)]
+    scores = (values == signature).mean(axis=1)
+    scores[ids == recipe_id] = -1
+    order = np.lexsort((-ids, -scores))[:count]
+    return ids[order], scores[order]
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from recipes.models import Recipe
+    from recipes.similar import SimilarRecipeIndex
+    from recipes.similar import similar_index
+
+    settings.RESPONSE_CACHE = None
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    rows = synthetic_rows(args)
+    index = SimilarRecipeIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    built = time.perf_counter() - started
+    memory = index._ids.nbytes + index._signatures.nbytes + sum(
+        keys.nbytes + members.nbytes for keys, members in index._buckets
+    )
+
+    rnd = random.Random(args.seed)
+    search = timings(
+        lambda: index.search(rnd.randint(1, args.recipes), args.count),
+        args.requests
+    )
+    scan = timings(
+        lambda: full_scan(index, rnd.randint(1, args.recipes), args.count),
+        args.recall_queries
+    )
+
+    # Полнота: доля рецептов эталонного top-k со сходством
+    # не ниже RECALL_SIMILARITY, которые нашел LSH
+    found = total = 0
+    for _ in range(args.recall_queries):
+        recipe_id = rnd.randint(1, args.recipes)
+        _, scores = index.search(recipe_id, args.count)
+        _, expected = full_scan(index, recipe_id, args.count)
+        total += int((expected >= RECALL_SIMILARITY).sum())
+        found += int((scores >= RECALL_SIMILARITY).sum())
+
+    result = dict(
+        dataset=dict(
+            recipes=args.recipes,
+            ingredient_rows=len(rows),
+            ingredients=args.ingredients,
+            seed=args.seed,
+        ),
+        build=dict(
+            seconds=round(built, 2),
+            memory_mb=round(memory / 2 ** 20, 1),
+        ),
+        search=search,
+        full_scan=scan,
+        recall=dict(
+            similarity=RECALL_SIMILARITY,
+            relevant=total,
+            value=round(found / max(total, 1), 3),
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+            numpy=np.__version__,
+        ),
+    )
+
+    if args.api_recipes:
+        call_command(
+            'generate_dataset', recipes=args.api_recipes,
+            ingredients=args.ingredients, seed=args.seed,
+            ingredients_per_recipe=args.ingredients_per_recipe,
+            stdout=io.StringIO()
+        )
+        started = time.perf_counter()
+        similar_index.build()
+        db_built = time.perf_counter() - started
+        ids = list(Recipe.objects.values_list('id', flat=True))
+        result['api'] = dict(
+            recipes=args.api_recipes,
+            build_from_db_seconds=round(db_built, 2),
+            **run(
+                get_wsgi_application(),
+                lambda: f'/recipes/{rnd.choice(ids)}/similar/', None,
+                args.requests, args.warmup
+            )
+        )
+
+    json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+
+    Параллельные чтение и запись в файловую базу SQLite:
+    настройки по умолчанию против профиля production
+    (WAL, BEGIN IMMEDIATE с повторами, чтение через реплику)
+
+"""
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+WRITERS = 4
+READERS = 8
+DURATION = 5
+RECIPES = 10_000
+USERS = 100
+
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def databases(directory):
+    """
+        Для каждого профиля: псевдоним записи и псевдоним чтения
+    """
+    development = os.path.join(directory, 'development.sqlite3')
+    production = os.path.join(directory, 'production.sqlite3')
+    return {
+        'development': dict(ENGINE='backend.sqlite3', NAME=development),
+        'production': dict(
+            ENGINE='backend.sqlite3', NAME=production, OPTIONS={
+                'timeout': 0.05,
+                'pragmas': {'journal_mode': 'WAL', **PRAGMAS},
+                'transaction_mode': 'IMMEDIATE',
+                'busy_retries': 8,
+            }
+        ),
+        'production_replica': dict(
+            ENGINE='backend.sqlite3', NAME=f'file:{production}?mode=ro',
+            OPTIONS={
+                'timeout': 0.05,
+                'pragmas': {'query_only': 1, **PRAGMAS},
+                'busy_retries': 8,
+            }
+        ),
+    }
+
+
+def create_schema(alias):
+    from django.db import connections
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'CREATE TABLE recipe (id INTEGER PRIMARY KEY, '
+            'name TEXT, favorites_count INTEGER NOT NULL DEFAULT 0)'
+        )
+        cursor.execute(
+            'CREATE TABLE favorite (user_id INTEGER, recipe_id INTEGER, '
+            'UNIQUE (user_id, recipe_id))'
+        )
+        cursor.executemany(
+            'INSERT INTO recipe (name) VALUES (%s)',
+            [(f'Рецепт {i}',) for i in range(RECIPES)]
+        )
+
+
+def toggle(alias, rnd):
+    from django.db import connections
+    from django.db import transaction
+
+    user, recipe = rnd.randrange(USERS), rnd.randrange(1, RECIPES + 1)
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                'INSERT OR IGNORE INTO favorite VALUES (%s, %s)',
+                (user, recipe)
+            )
+            delta = 1
+            if not cursor.rowcount:
+                cursor.execute(
+                    'DELETE FROM favorite '
+                    'WHERE user_id = %s AND recipe_id = %s',
+                    (user, recipe)
+                )
+                delta = -1
+            cursor.execute(
+                'UPDATE recipe SET favorites_count = favorites_count + %s '
+                'WHERE id = %s', (delta, recipe)
+            )
+
+
+def feed(alias, rnd):
+    from django.db import connections
+
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            'SELECT id, name, favorites_count, EXISTS ('
+            '  SELECT 1 FROM favorite'
+            '  WHERE user_id = %s AND recipe_id = recipe.id'
+            ') FROM recipe WHERE id <= %s ORDER BY id DESC LIMIT 12',
+            (rnd.randrange(USERS), rnd.randrange(12, RECIPES + 1))
+        )
+        cursor.fetchall()
+
+
+def run(write_alias, read_alias):
+    from django.db import connections
+
+    stop = threading.Event()
+    counts = dict(reads=0, writes=0, errors=0)
+    lock = threading.Lock()
+
+    def worker(func, alias, key, seed):
+        rnd = random.Random(seed)
+        done = errors = 0
+        while not stop.is_set():
+            try:
+                func(alias, rnd)
+                done += 1
+            except Exception:
+                errors += 1
+        connections.close_all()
+        with lock:
+            counts[key] += done
+            counts['errors'] += errors
+
+    threads = [
+        threading.Thread(
+            target=worker, args=(toggle, write_alias, 'writes', i)
+        ) for i in range(WRITERS)
+    ] + [
+        threading.Thread(
+            target=worker, args=(feed, read_alias, 'reads', -i)
+        ) for i in range(READERS)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+    from django.conf import settings
+
+    directory = tempfile.mkdtemp()
+    try:
+        settings.DATABASES.update(databases(directory))
+
+        import django
+        django.setup()
+
+        for write_alias, read_alias in (
+                ('development', 'development'),
+                ('production', 'production_replica'),
+        ):
+            create_schema(write_alias)
+            counts = run(write_alias, read_alias)
+            print(
+                f'{write_alias:<12} '
+                f'reads {counts["reads"] / DURATION:,.0f}/s, '
+                f'writes {counts["writes"] / DURATION:,.0f}/s, '
+                f'errors {counts["errors"]}'
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+
+    Время до первого ответа и стоимость перезапуска воркеров:
+    прежний запуск gunicorn (приложение грузится в каждом воркере)
+    против backend.gunicorn_config (preload_app и прогрев до fork).
+
+    Для каждого варианта замеряется время от запуска сервера до первого
+    ответа, первые ответы каждого сценария и задержки серии запросов,
+    во время которой воркер перезапускается каждые --max-requests:
+
+        python -m benchmarks.bench_startup --max-requests 100 > startup.json
+
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from urllib.parse import quote
+
+from .bench_asgi import BACKEND
+from .bench_asgi import SEARCH
+from .bench_asgi import PERCENTILES
+from .bench_asgi import free_port
+from .bench_asgi import prepare
+
+DEPLOYMENTS = {
+    'cold': [
+        'backend.wsgi:application', '-k', 'gevent',
+        '--worker-connections', '100',
+    ],
+    'preload': [
+        '-c', 'python:backend.gunicorn_config', 'backend.wsgi:application',
+    ],
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--recipes', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--max-requests', type=int, default=100)
+    parser.add_argument(
+        '--requests', type=int, default=1000,
+        help='Запросов в серии с перезапусками воркеров'
+    )
+    parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Запусков сервера для замера старта'
+    )
+    return parser.parse_args()
+
+
+def scenarios(rnd, recipes):
+    return {
+        'tags': lambda: '/tags/',
+        'recipes_list': lambda: f'/recipes/?page={rnd.randint(1, 50)}',
+        'recipe_detail': lambda: f'/recipes/{rnd.randint(1, recipes)}/',
+        'ingredients_search': (
+            lambda: f'/ingredients/?name={quote(rnd.choice(SEARCH))}'
+        ),
+    }
+
+
+def get(port, path, token, timeout=60):
+    """
+    :return: код ответа, ConnectionRefusedError до открытия порта
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout)
+    try:
+        connection.request(
+            'GET', path, headers={'Authorization': f'Token {token}'}
+        )
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def start(deployment, env, args, port):
+    return subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', *DEPLOYMENTS[deployment],
+            '-b', f'127.0.0.1:{port}', '-w', str(args.workers),
+            '--max-requests', str(args.max_requests),
+            '--max-requests-jitter', '0',
+        ],
+        cwd=BACKEND, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def first_responses(port, paths, token, started, timeout=60):
+    """
+    :return: время от запуска до первого ответа и задержки первых
+        запросов каждого сценария, мс
+    """
+    deadline = started + timeout
+    while True:
+        try:
+            get(port, '/tags/', token)
+            break
+        except ConnectionRefusedError:
+            if time.perf_counter() > deadline:
+                raise RuntimeError('Сервер не запустился')
+            time.sleep(0.01)
+    result = dict(startup_ms=(time.perf_counter() - started) * 1000)
+    for name, make_path in paths.items():
+        if name == 'tags':
+            continue
+        request_started = time.perf_counter()
+        get(port, make_path(), token)
+        result[f'{name}_ms'] = (time.perf_counter() - request_started) * 1000
+    return result
+
+
+def series(port, paths, token, count):
+    """
+        Запросы по очереди ко всем сценариям
+    :return: задержки, мс
+    """
+    timings = []
+    statuses = dict()
+    make_paths = list(paths.values())
+    for i in range(count):
+        started = time.perf_counter()
+        status = get(port, make_paths[i % len(make_paths)](), token)
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+    timings.sort()
+    result = dict(
+        requests=count,
+        statuses={str(k): v for k, v in statuses.items()},
+        max_ms=round(timings[-1], 1),
+        mean_ms=round(sum(timings) / count, 1),
+    )
+    for value in PERCENTILES:
+        index = min(count - 1, count * value // 100)
+        result[f'p{value}_ms'] = round(timings[index], 1)
+    return result
+
+
+def median(values):
+    values = sorted(values)
+    return round(values[len(values) // 2], 1)
+
+
+def run(deployment, env, args, token):
+    rnd = random.Random(args.seed)
+    paths = scenarios(rnd, args.recipes)
+    starts = []
+    for _ in range(args.runs):
+        port = free_port()
+        started = time.perf_counter()
+        server = start(deployment, env, args, port)
+        try:
+            starts.append(first_responses(port, paths, token, started))
+            if len(starts) == args.runs:
+                recycling = series(port, paths, token, args.requests)
+        finally:
+            server.terminate()
+            server.wait()
+    return dict(
+        first_response={
+            key: median([x[key] for x in starts]) for key in starts[0]
+        },
+        recycling=recycling,
+    )
+
+
+def main():
+    args = parse_args()
+    directory = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='backend.settings',
+        DB_PROFILE='production',
+        SQLITE_PATH=os.path.join(directory, 'db.sqlite3'),
+        INSTRUMENTATION_LOG_LEVEL='WARNING',
+        GUNICORN_WORKER_CLASS='gevent',
+    )
+    try:
+        token = prepare(env, args)
+        results = {
+            name: run(name, env, args, token) for name in DEPLOYMENTS
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    json.dump(dict(
+        dataset=dict(users=args.users, recipes=args.recipes, seed=args.seed),
+        workers=args.workers,
+        max_requests=args.max_requests,
+        runs=args.runs,
+        deployments=results,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+
+    Лента с фильтром по тэгам (/recipes/?tags=): битовые карты тэгов
+    в памяти против EXISTS по recipes_recipe_tags с COUNT по базе
+    (тот же запрос с отключенным индексом). По умолчанию 500 тыс.
+    рецептов:
+
+        python -m benchmarks.bench_tags > tags.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from unittest import mock
+
+from . import setup
+from .bench_api import run
+
+# Сценарий -> (кол-во тэгов, с автором, страница)
+SCENARIOS = {
+    'one_tag': (1, False, 1),
+    'three_tags': (3, False, 1),
+    'one_tag_deep_page': (1, False, 50),
+    'two_tags_author': (2, True, 1),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--recipes', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=100,
+        help='Запросов к каждому сценарию'
+    )
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument(
+        '--baseline-requests', type=int, default=20,
+        help='Запросов без индекса к каждому сценарию'
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from tags.models import Tag
+    from users.models import User
+    from recipes.tag_bitmaps import tag_index
+
+    settings.RESPONSE_CACHE = None
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    call_command(
+        'generate_dataset', users=args.users, recipes=args.recipes,
+        seed=args.seed, stdout=io.StringIO()
+    )
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tag_index.build()
+    built = time.perf_counter() - started
+
+    rnd = random.Random(args.seed)
+    tags = list(Tag.objects.values_list('slug', flat=True))
+    authors = list(
+        User.objects.filter(recipes_count__gt=0).values_list('id', flat=True)
+    )
+
+    application = get_wsgi_application()
+    results = dict()
+    for name, (size, with_author, page) in SCENARIOS.items():
+        def make_path(size=size, with_author=with_author, page=page):
+            path = '/recipes/?' + '&'.join(
+                f'tags={x}' for x in rnd.sample(tags, size)
+            )
+            if with_author:
+                path += f'&author={rnd.choice(authors)}'
+            return f'{path}&page={page}'
+
+        index = run(
+            application, make_path, None, args.requests, args.warmup
+        )
+        with mock.patch(
+                'recipes.views.indexed_feed_params', return_value=None
+        ):
+            exists = run(
+                application, make_path, None, args.baseline_requests, 1
+            )
+        results[name] = dict(index=index, exists=exists)
+
+    json.dump(dict(
+        dataset=dict(
+            users=args.users,
+            recipes=args.recipes,
+            tags=len(tags),
+            seed=args.seed,
+            generate_seconds=round(generated, 1),
+            index_build_seconds=round(built, 2),
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+        ),
+        scenarios=results,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+
+    Лента подписок (/recipes/feed/): материализованная TimelineEntry
+    против сборки ленты при чтении - JOIN подписок и рецептов
+    с сортировкой по id. Также время rebuild и fan-out нового рецепта.
+    По умолчанию 500 тыс. рецептов, до 50 подписок у пользователя:
+
+        python -m benchmarks.bench_timeline > timeline.json
+
+"""
+import argparse
+import io
+import json
+import logging
+import platform
+import random
+import sqlite3
+import sys
+import time
+
+from . import setup
+from .bench_api import run
+from .bench_api import percentile
+from .bench_api import PERCENTILES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--recipes', type=int, default=500_000)
+    parser.add_argument('--subscriptions', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--requests', type=int, default=100,
+        help='Запросов к каждому сценарию'
+    )
+    parser.add_argument('--warmup', type=int, default=10)
+    return parser.parse_args()
+
+
+def timings(func, count):
+    values = []
+    for _ in range(count):
+        started = time.perf_counter()
+        func()
+        values.append(time.perf_counter() - started)
+    values.sort()
+    return {
+        f'p{x}_ms': round(percentile(values, x) * 1000, 3)
+        for x in PERCENTILES
+    }
+
+
+def read_time_feed(user_id):
+    """
+        Лента без материализации: первая страница и count()
+    """
+    from recipes.models import Recipe
+
+    queryset = Recipe.objects.filter(
+        author__user_subscriptions__owner_id=user_id
+    ).order_by('-id')
+    queryset.count()
+    return list(queryset.values_list('id', flat=True)[:12])
+
+
+def main():
+    args = parse_args()
+    setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.core.wsgi import get_wsgi_application
+
+    from rest_framework.authtoken.models import Token
+
+    from users.models import User
+    from recipes.models import Recipe
+    from recipes.models import TimelineEntry
+    from recipes import timeline
+
+    settings.RESPONSE_CACHE = None
+    logging.getLogger('backend.instrumentation').setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    call_command(
+        'generate_dataset', users=args.users, recipes=args.recipes,
+        subscriptions=args.subscriptions, seed=args.seed,
+        stdout=io.StringIO()
+    )
+    generated = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rows = timeline.rebuild()
+    rebuilt = time.perf_counter() - started
+
+    rnd = random.Random(args.seed)
+    users = list(User.objects.values_list('id', flat=True))
+    reader = User.objects.filter(subscribe_model__isnull=False).first()
+    token = Token.objects.get_or_create(user=reader)[0].key
+    pages = -(-TimelineEntry.objects.filter(owner=reader).count() // 12)
+
+    application = get_wsgi_application()
+    scenarios = dict(
+        feed_first_page=run(
+            application, lambda: '/recipes/feed/', token,
+            args.requests, args.warmup
+        ),
+        feed_random_page=run(
+            application,
+            lambda: f'/recipes/feed/?page={rnd.randint(1, max(pages, 1))}',
+            token, args.requests, args.warmup
+        ),
+        feed_cursor=run(
+            application, lambda: '/recipes/feed/?cursor=', token,
+            args.requests, args.warmup
+        ),
+        materialized_page=timings(
+            lambda: list(TimelineEntry.objects.filter(
+                owner_id=rnd.choice(users)
+            ).order_by('-recipe_id').values_list('recipe_id', flat=True)[:12]),
+            args.requests
+        ),
+        read_time_page=timings(
+            lambda: read_time_feed(rnd.choice(users)), args.requests
+        ),
+    )
+
+    # Автор с наибольшим числом подписчиков: самый дорогой fan-out
+    author = User.objects.order_by('-subscribers_count').first()
+    recipe = Recipe.objects.filter(author=author).first()
+    scenarios['fan_out'] = timings(lambda: timeline.fan_out(recipe), 20)
+
+    json.dump(dict(
+        dataset=dict(
+            users=args.users,
+            recipes=args.recipes,
+            subscriptions=args.subscriptions,
+            seed=args.seed,
+            generate_seconds=round(generated, 1),
+            timeline_rows=rows,
+            rebuild_seconds=round(rebuilt, 2),
+            max_subscribers=author.subscribers_count,
+        ),
+        environment=dict(
+            python=platform.python_version(),
+            sqlite=sqlite3.sqlite_version,
+        ),
+        scenarios=scenarios,
+    ), sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
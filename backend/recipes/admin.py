@@ -1,30 +1,60 @@
 from django.contrib import admin
+from django.db import transaction
 
 from .models import Recipe
 from .models import ShopList
 from .models import Favorite
+from .models import ShopListRecipe
+from .models import FavoriteRecipe
 from .models import Ingredient
 from .models import IngredientUnit
 
+from . import changes
+
 
 class IngredientUnitAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'measurement_unit')
+    search_fields = ('^name',)
 
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('ingredient_unit',)
 
+    # Индексы ингредиентов читают рецепты из лога изменений,
+    # сигнала на удаление строки нет (recipes.signals)
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        changes.record([obj.recipes_id])
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        changes.record(queryset.values_list('recipes_id', flat=True))
+        super().delete_queryset(request, queryset)
+
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('author', 'name',)
+    list_display = ('author', 'name', 'favorites_count', 'in_carts_count')
+
+
+class ShopListRecipeInline(admin.TabularInline):
+    model = ShopListRecipe
+    raw_id_fields = ('recipe',)
+
+
+class FavoriteRecipeInline(admin.TabularInline):
+    model = FavoriteRecipe
+    raw_id_fields = ('recipe',)
 
 
 class ShopListAdmin(admin.ModelAdmin):
     list_display = ('author',)
+    inlines = (ShopListRecipeInline,)
 
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('author',)
+    inlines = (FavoriteRecipeInline,)
 
 
 admin.site.register(Recipe, RecipeAdmin)
@@ -0,0 +1,24 @@
+"""
+    Маршруты async-чтения, остальное обрабатывают представления из urls
+"""
+from django.urls import path
+
+from backend.asynchronous import async_read_view
+
+from . import async_views
+
+from .urls import router
+
+views = {x.name: x.callback for x in router.urls}
+
+urlpatterns = [
+    path('recipes/', async_read_view(
+        async_views.recipe_list, views['recipe-list']
+    )),
+    path('recipes/<int:pk>/', async_read_view(
+        async_views.recipe_detail, views['recipe-detail']
+    )),
+    path('ingredients/', async_read_view(
+        async_views.ingredient_list, views['ingredientunit-list']
+    )),
+]
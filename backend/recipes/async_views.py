@@ -0,0 +1,179 @@
+"""
+    Async-чтение ленты и карточки рецептов и поиск ингредиентов (ASGI)
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import F
+
+from backend.asynchronous import render
+from backend.asynchronous import cached_response
+from backend.asynchronous import conditional_response
+from backend.conditional import aget_versions
+from backend.conditional import aget_collection_validators
+
+from tags.models import Tag
+
+from users.authentication import aauthenticate
+
+from .models import Recipe
+from .models import Ingredient
+
+from .serializers import RecipeSerializer
+from .serializers import IngredientUnitSerializer
+
+from .search import ingredient_index
+from .tag_bitmaps import tag_index
+
+from .views import RecipeViewSet
+from .views import IngredientUnitViewSet
+from .views import filter_recipes
+from .views import indexed_feed_params
+from .views import RECIPE_COLLECTIONS
+from .views import recipe_validators
+from .views import recipe_validator_fields
+
+
+async def get_user(request):
+    result = await aauthenticate(request)
+    return AnonymousUser() if result is None else result[0]
+
+
+def _set_prefetched(instance, name, objects):
+    """
+        Кладет объекты в кэш prefetch_related, чтобы сериализатор
+        не обращался к базе
+    """
+    queryset = getattr(instance, name).all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    instance.__dict__.setdefault('_prefetched_objects_cache', dict())
+    instance._prefetched_objects_cache[name] = queryset
+
+
+async def prefetch(recipes):
+    """
+        Тэги и ингредиенты рецептов двумя запросами,
+        как prefetch_related в RecipeViewSet
+    """
+    ids = [x.pk for x in recipes]
+    tags = defaultdict(list)
+    async for tag in Tag.objects.filter(recipe__in=ids).annotate(
+            recipe_pk=F('recipe')
+    ):
+        tags[tag.recipe_pk].append(tag)
+    ingredients = defaultdict(list)
+    async for ingredient in Ingredient.objects.filter(
+            recipes__in=ids
+    ).select_related('ingredient_unit'):
+        ingredients[ingredient.recipes_id].append(ingredient)
+    for recipe in recipes:
+        _set_prefetched(recipe, 'tags', tags[recipe.pk])
+        _set_prefetched(recipe, 'ingredients', ingredients[recipe.pk])
+
+
+def _recipes(user, request):
+    return filter_recipes(
+        Recipe.objects.select_related('author'), user, request.GET
+    )
+
+
+def _value(instance, field):
+    for name in field.split('__'):
+        instance = getattr(instance, name)
+    return instance
+
+
+async def recipe_list(request):
+    if 'cursor' in request.GET:
+        return None
+    user = await get_user(request)
+    pagination = RecipeViewSet.pagination_class()
+    queryset = _recipes(user, request)
+
+    async def build():
+        params = indexed_feed_params(user, request.GET)
+        ids = None
+        if params is not None:
+            ids = await tag_index.arecipe_ids(*params)
+        paginator = pagination.django_paginator_class(
+            queryset if ids is None else ids, pagination.page_size
+        )
+        # count - cached_property, num_pages и validate_number берут его
+        if ids is None:
+            paginator.count = await queryset.acount()
+        number = request.GET.get(pagination.page_query_param) or 1
+        if number in pagination.last_page_strings:
+            number = paginator.num_pages
+        try:
+            number = paginator.validate_number(number)
+        except InvalidPage:
+            # 404 с текстом ошибки отдает DRF
+            return None
+
+        offset = (number - 1) * paginator.per_page
+        if ids is None:
+            recipes = [
+                x async for x in queryset[offset:offset + paginator.per_page]
+            ]
+        else:
+            page = ids[offset:offset + paginator.per_page].tolist()
+            objects = {
+                x.pk: x async for x in queryset.filter(pk__in=page)
+            }
+            recipes = [objects[x] for x in page if x in objects]
+        await prefetch(recipes)
+        pagination.page = paginator._get_page(recipes, number, paginator)
+        pagination.request = request
+        serializer = RecipeSerializer(
+            recipes, many=True, context=dict(request=request)
+        )
+        return render(pagination.get_paginated_response(serializer.data).data)
+
+    return await cached_response(
+        request, user, RecipeViewSet.cache_params, build
+    )
+
+
+async def recipe_detail(request, pk):
+    user = await get_user(request)
+    recipe = await _recipes(user, request).filter(pk=pk).afirst()
+    if recipe is None:
+        return None
+    row = [_value(recipe, x) for x in recipe_validator_fields(user)]
+
+    async def build():
+        await prefetch([recipe])
+        return render(
+            RecipeSerializer(recipe, context=dict(request=request)).data
+        )
+
+    return await conditional_response(
+        request, recipe_validators(
+            row, user, await aget_versions(*RECIPE_COLLECTIONS)
+        ),
+        lambda: cached_response(
+            request, user, RecipeViewSet.cache_params, build
+        )
+    )
+
+
+async def ingredient_list(request):
+    async def build():
+        units = await ingredient_index.asearch(
+            request.GET.get('name', ''), settings.INGREDIENT_SEARCH_LIMIT
+        )
+        return render(IngredientUnitSerializer(units, many=True).data)
+
+    validators = await aget_collection_validators(
+        IngredientUnitViewSet.collection
+    )
+    return await conditional_response(
+        request, validators,
+        lambda: cached_response(
+            request, AnonymousUser(), IngredientUnitViewSet.cache_params,
+            build
+        )
+    )
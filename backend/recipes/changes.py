@@ -0,0 +1,139 @@
+"""
+    Лог изменений рецептов для индексов в памяти процесса.
+
+    Сигналы добавляют в RecipeChange id рецептов, у которых изменились
+    тэги или ингредиенты, в той же транзакции, что и само изменение.
+    Перед чтением индекс забирает строки после последней прочитанной
+    и перечитывает эти рецепты из базы, поэтому изменение из одного
+    воркера видят все, а индекс не перестраивается целиком.
+    SQLite выполняет записи по очереди, поэтому id строк растут
+    в порядке коммитов.
+"""
+import threading
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db.models import Max
+
+from .models import RecipeChange
+
+
+def last_id():
+    return RecipeChange.objects.aggregate(Max('id'))['id__max'] or 0
+
+
+async def alast_id():
+    value = await RecipeChange.objects.aaggregate(Max('id'))
+    return value['id__max'] or 0
+
+
+def record(recipe_ids) -> None:
+    """
+        Отмечает изменение рецептов в текущей транзакции.
+        Раз в RECIPE_CHANGES_TRIM_EVERY строк лог обрезается
+        до RECIPE_CHANGES_KEEP последних
+    :param recipe_ids: id рецептов
+    """
+    rows = RecipeChange.objects.bulk_create(
+        RecipeChange(recipe_id=x) for x in set(recipe_ids)
+    )
+    every = settings.RECIPE_CHANGES_TRIM_EVERY
+    if rows and rows[-1].id // every != (rows[0].id - 1) // every:
+        RecipeChange.objects.filter(
+            id__lte=rows[-1].id - settings.RECIPE_CHANGES_KEEP
+        ).delete()
+
+
+def reset() -> None:
+    """
+        Индексы во всех процессах нужно построить заново:
+        для массовой загрузки, которая не отправляет сигналы
+    """
+    RecipeChange.objects.create(recipe_id=None)
+
+
+def since(change_id):
+    """
+    :param change_id: последняя прочитанная строка, 0 - лог был пуст
+    :return: id последней строки и множество id рецептов или None,
+        если индекс нужно построить заново: был reset или строка
+        change_id уже удалена (лог обрезан, транзакция откатилась)
+    """
+    rows = list(RecipeChange.objects.filter(
+        id__gte=change_id
+    ).order_by('id').values_list('id', 'recipe_id'))
+    if change_id:
+        if not rows or rows[0][0] != change_id:
+            return change_id, None
+        rows = rows[1:]
+    if not rows:
+        return change_id, set()
+    recipe_ids = {x for _, x in rows}
+    if None in recipe_ids:
+        return rows[-1][0], None
+    return rows[-1][0], recipe_ids
+
+
+class ChangeTrackingIndex:
+    """
+        Индекс, который перед чтением догоняет лог изменений.
+        Наследник строит индекс целиком в _build и перечитывает
+        рецепты в _reload
+    """
+
+    def __init__(self):
+        self._sync_lock = threading.Lock()
+        self._change_id = None
+
+    def _build(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def _reload(self, recipe_ids):
+        raise NotImplementedError
+
+    def build(self, *args, **kwargs) -> None:
+        # Изменения, закоммиченные во время построения,
+        # будут перечитаны при следующем refresh
+        change_id = last_id()
+        self._build(*args, **kwargs)
+        self._change_id = change_id
+
+    def invalidate(self) -> None:
+        """
+            Построить индекс заново: в этом процессе сразу,
+            в остальных - при следующем чтении
+        """
+        self._change_id = None
+        reset()
+
+    def refresh(self, blocking=True) -> bool:
+        """
+            Применяет изменения из лога, при необходимости строит индекс
+        :param blocking: ждать, пока индекс обновляет другой поток
+        :return: False, если индекс обновляет другой поток
+        """
+        if not self._sync_lock.acquire(blocking=blocking):
+            return False
+        try:
+            if self._change_id is not None:
+                change_id, recipe_ids = since(self._change_id)
+                if recipe_ids is not None:
+                    if recipe_ids:
+                        self._reload(recipe_ids)
+                    self._change_id = change_id
+                    return True
+            self.build()
+            return True
+        finally:
+            self._sync_lock.release()
+
+    async def arefresh(self, blocking=True) -> bool:
+        """
+            refresh для async-представлений: без изменений в логе
+            обходится одним async-запросом
+        """
+        if self._change_id is not None \
+                and await alast_id() == self._change_id:
+            return True
+        return await sync_to_async(self.refresh)(blocking)
@@ -0,0 +1,165 @@
+"""
+    Подбор рецептов по имеющимся ингредиентам: инвертированный индекс
+    IngredientUnit.id -> отсортированный массив id рецептов в памяти
+    процесса
+"""
+import threading
+
+from itertools import chain
+from collections import defaultdict
+
+import numpy as np
+
+from .models import Ingredient
+from .changes import ChangeTrackingIndex
+
+DTYPE = np.int32
+
+
+class RecipeIngredientIndex(ChangeTrackingIndex):
+    """
+        Для каждого ингредиента - массив рецептов, где он есть, для
+        каждого рецепта - кол-во ингредиентов (массив по id рецепта)
+        и сами ингредиенты: при построении - массив, упорядоченный
+        по рецептам, со смещениями по id рецепта, после - в _changed.
+        Перед поиском индекс перечитывает рецепты из лога изменений
+        (recipes.changes) и меняет списки только их ингредиентов,
+        целиком строится только после массовой загрузки
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._postings = None
+        self._sizes = None
+        self._offsets = None
+        self._units = None
+        self._changed = dict()
+
+    def _build(self, rows=None):
+        """
+            Строит индекс
+        :param rows: массив (n, 2) или пары (recipe_id, ingredient_unit_id),
+            по умолчанию из БД
+        :return: None
+        """
+        if rows is None:
+            rows = Ingredient.objects.values_list(
+                'recipes_id', 'ingredient_unit_id'
+            ).order_by().iterator(chunk_size=10000)
+        if not isinstance(rows, np.ndarray):
+            rows = np.fromiter(chain.from_iterable(rows), dtype=DTYPE)
+        rows = rows.astype(np.int64).reshape(-1, 2)
+
+        # Пары упакованы в int64: np.unique сортирует их и убирает
+        # повторы быстрее сортировки по двум столбцам
+        pairs = np.unique(rows[:, 0] << 32 | rows[:, 1])
+        recipes = (pairs >> 32).astype(DTYPE)
+        units = (pairs & 0xFFFFFFFF).astype(DTYPE)
+        # Ингредиенты рецепта r - units[offsets[r]:offsets[r + 1]]
+        sizes = np.bincount(recipes).astype(DTYPE)
+        offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+        pairs = np.unique(units.astype(np.int64) << 32 | recipes)
+        unit_ids, starts = np.unique(pairs >> 32, return_index=True)
+        postings = dict(zip(
+            unit_ids.tolist(),
+            np.split((pairs & 0xFFFFFFFF).astype(DTYPE), starts[1:])
+        )) if len(unit_ids) else dict()
+
+        with self._lock:
+            self._postings = postings
+            self._sizes = sizes
+            self._offsets = offsets
+            self._units = units
+            self._changed = dict()
+
+    def _recipe_units(self, recipe_id):
+        units = self._changed.get(recipe_id)
+        if units is not None:
+            return units
+        if recipe_id + 1 >= len(self._offsets):
+            return ()
+        return self._units[
+            self._offsets[recipe_id]:self._offsets[recipe_id + 1]
+        ].tolist()
+
+    def _reload(self, recipe_ids):
+        """
+            Ингредиенты рецептов из базы, удаленные рецепты
+            убираются из индекса
+        """
+        units = defaultdict(set)
+        recipes = defaultdict(set)
+        for recipe_id, unit_id in Ingredient.objects.filter(
+                recipes_id__in=recipe_ids
+        ).values_list('recipes_id', 'ingredient_unit_id'):
+            units[unit_id].add(recipe_id)
+            recipes[recipe_id].add(unit_id)
+        ids = np.array(sorted(recipe_ids), dtype=DTYPE)
+        empty = np.empty(0, dtype=DTYPE)
+
+        with self._lock:
+            if ids[-1] >= len(self._sizes):
+                sizes = np.zeros(
+                    max(ids[-1] + 1, len(self._sizes) * 2), dtype=DTYPE
+                )
+                sizes[:len(self._sizes)] = self._sizes
+                self._sizes = sizes
+            # Меняются только списки прежних и новых ингредиентов
+            touched = set(units)
+            for recipe_id in ids.tolist():
+                touched.update(self._recipe_units(recipe_id))
+            for unit_id in touched:
+                postings = self._postings.get(unit_id, empty)
+                positions = np.searchsorted(postings, ids)
+                found = positions < len(postings)
+                found[found] = postings[positions[found]] == ids[found]
+                added = units.get(unit_id)
+                # Массивы не меняются на месте: запрос в другом потоке
+                # дочитывает прежнюю версию
+                postings = np.delete(postings, positions[found])
+                if added:
+                    postings = np.union1d(
+                        postings, np.fromiter(added, dtype=DTYPE)
+                    )
+                self._postings[unit_id] = postings
+            for recipe_id in ids.tolist():
+                self._changed[recipe_id] = sorted(recipes[recipe_id])
+            self._sizes[ids] = [len(recipes[x]) for x in ids.tolist()]
+
+    def search(self, unit_ids, max_missing=None):
+        """
+            Рецепты, где есть хотя бы один из ингредиентов unit_ids:
+            сначала те, где не хватает меньше ингредиентов, затем
+            с большим кол-вом совпадений, затем новые
+        :param unit_ids: имеющиеся ингредиенты
+        :param max_missing: не больше стольких недостающих ингредиентов,
+            0 - рецепт целиком из имеющихся
+        :return: массивы id рецептов, совпавших и недостающих ингредиентов
+        """
+        self.refresh()
+        postings = self._postings
+        lists = [
+            postings[x] for x in set(unit_ids) if x in postings
+        ]
+        # Размеры читаются после списков: _reload сначала расширяет их
+        sizes = self._sizes
+        if not lists:
+            empty = np.empty(0, dtype=DTYPE)
+            return empty, empty, empty
+
+        recipes, matched = np.unique(
+            np.concatenate(lists), return_counts=True
+        )
+        missing = sizes[recipes] - matched
+        if max_missing is not None:
+            mask = missing <= max_missing
+            recipes, matched, missing = (
+                recipes[mask], matched[mask], missing[mask]
+            )
+        order = np.lexsort((-recipes, -matched, missing))
+        return recipes[order], matched[order], missing[order]
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
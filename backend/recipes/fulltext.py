@@ -0,0 +1,130 @@
+"""
+    Полнотекстовый поиск рецептов: SQLite FTS5 по названию и описанию.
+
+    Индекс - external content таблица recipes_recipe_fts поверх
+    recipes_recipe, ее синхронизируют триггеры базы, поэтому
+    bulk_create и QuerySet.update тоже попадают в индекс.
+    Ранжирование - bm25, совпадение в названии весит больше.
+"""
+import re
+
+from django.db import connections
+from django.db import router
+
+from .models import Recipe
+from .models import RecipeSearch
+
+TABLE = RecipeSearch._meta.db_table
+# Веса bm25: название, описание
+RANK = 'bm25(10.0, 1.0)'
+
+WORD = re.compile(r'\w+')
+
+SCHEMA = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+        name, text,
+        content='recipes_recipe', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    WHEN old.name IS NOT new.name OR old.text IS NOT new.text BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+)
+
+
+def _connection(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite' \
+            or not router.allow_migrate_model(using, Recipe):
+        return None
+    return connection
+
+
+def create_index(using='default') -> bool:
+    """
+        Создает таблицу FTS5 и триггеры, если их нет.
+        Новая таблица заполняется из recipes_recipe
+    :param using: алиас базы
+    :return: True, если таблица создана
+    """
+    connection = _connection(using)
+    if connection is None:
+        return False
+    with connection.cursor() as cursor:
+        exists = TABLE in connection.introspection.table_names(cursor)
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        if not exists:
+            cursor.execute(
+                f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', %s)",
+                (RANK,)
+            )
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+    return not exists
+
+
+def rebuild_index(using='default', optimize=False) -> None:
+    """
+        Перестраивает индекс по текущему содержимому recipes_recipe
+    :param optimize: слить сегменты индекса в один
+    """
+    connection = _connection(using)
+    if connection is None:
+        return
+    create_index(using)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(
+                f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')"
+            )
+
+
+def to_match(query):
+    """
+        Строка поиска пользователя -> запрос FTS5: все слова,
+        каждое как префикс. Операторы FTS5 в запросе не действуют
+    :return: запрос или None, если в строке нет слов
+    """
+    words = WORD.findall(query)
+    if not words:
+        return None
+    return ' '.join(f'"{x}"*' for x in words)
+
+
+def search_recipes(queryset, query):
+    """
+        Рецепты, содержащие все слова query, по убыванию релевантности
+    :param queryset: QuerySet рецептов
+    :param query: строка поиска
+    :return: QuerySet
+    """
+    match = to_match(query)
+    if match is None:
+        return queryset.none()
+    return queryset.filter(search_document__document__match=match).order_by(
+        'search_document__rank', '-id'
+    )
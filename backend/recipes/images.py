@@ -0,0 +1,182 @@
+"""
+    Варианты картинок рецептов: миниатюры и WebP.
+
+    Имена файлов строятся из sha256 исходного файла, поэтому одинаковые
+    картинки обрабатываются и хранятся один раз. Кодирование выполняется
+    в пуле системных потоков, в том числе под gevent.
+"""
+import hashlib
+import logging
+import threading
+
+from io import BytesIO
+from concurrent import futures
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+from PIL import Image
+from PIL import ImageOps
+
+from backend.cache import invalidate
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _gevent_patched():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            if _gevent_patched():
+                from gevent.threadpool import ThreadPoolExecutor
+            else:
+                ThreadPoolExecutor = futures.ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS
+            )
+        return _executor
+
+
+def run(func, *args):
+    """
+        Выполняет func в пуле системных потоков и ждет результат:
+        под gevent остальные запросы воркера в это время обслуживаются.
+        При RECIPE_IMAGE_WORKERS = 0 - в текущем потоке
+    :return: результат func, исключения func пробрасываются
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        return func(*args)
+    return _get_executor().submit(func, *args).result()
+
+
+def variant_name(image_hash, variant):
+    _, image_format, _ = settings.RECIPE_IMAGE_VARIANTS[variant]
+    return (
+        f'variants/{image_hash[:2]}/'
+        f'{image_hash}_{variant}.{EXTENSIONS[image_format]}'
+    )
+
+
+def variant_urls(recipe):
+    """
+        Ссылки на варианты картинки рецепта.
+        Пока варианты не готовы, отдается исходная картинка
+    :param recipe: Recipe
+    :return: dict вариант -> url
+    """
+    if not recipe.image_hash:
+        return {x: recipe.image.url for x in settings.RECIPE_IMAGE_VARIANTS}
+    return {
+        x: default_storage.url(variant_name(recipe.image_hash, x))
+        for x in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def _render(image, size, image_format, crop):
+    if crop:
+        result = ImageOps.fit(image, size, Image.LANCZOS)
+    else:
+        result = image.copy()
+        result.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and result.mode != 'RGB':
+        result = result.convert('RGB')
+    buffer = BytesIO()
+    result.save(buffer, image_format, quality=80)
+    return buffer.getvalue()
+
+
+def render_variants(content, image_hash):
+    """
+        Декодирует картинку и кодирует недостающие варианты
+    :param content: байты исходной картинки
+    :param image_hash: sha256 исходной картинки
+    :return: dict имя файла -> байты
+    """
+    image = None
+    rendered = dict()
+    for variant, params in settings.RECIPE_IMAGE_VARIANTS.items():
+        name = variant_name(image_hash, variant)
+        if default_storage.exists(name):
+            continue
+        if image is None:
+            image = ImageOps.exif_transpose(Image.open(BytesIO(content)))
+        rendered[name] = _render(image, *params)
+    return rendered
+
+
+def process_image(recipe_id) -> None:
+    """
+        Создает варианты картинки рецепта и сохраняет ее хэш
+    :param recipe_id: id рецепта
+    :return: None
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_hash'
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+
+    with recipe.image.open('rb') as f:
+        content = f.read()
+    image_hash = hashlib.sha256(content).hexdigest()
+    if image_hash == recipe.image_hash:
+        return
+
+    rendered = run(render_variants, content, image_hash)
+    for name, data in rendered.items():
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(data))
+
+    # Ссылки на варианты есть в ответах: меняются ETag
+    # и поколение кэша ответов
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_hash=image_hash, updated_at=timezone.now())
+    if updated:
+        invalidate()
+
+
+def _process_in_background(recipe_id):
+    try:
+        process_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule(recipe_id) -> None:
+    """
+        Запускает обработку картинки вне запроса.
+        При RECIPE_IMAGE_WORKERS = 0 обработка синхронная
+    :param recipe_id: id рецепта
+    :return: None
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        process_image(recipe_id)
+    elif _gevent_patched():
+        import gevent
+        gevent.spawn(_process_in_background, recipe_id)
+    else:
+        threading.Thread(
+            target=_process_in_background, args=(recipe_id,), daemon=True
+        ).start()
@@ -0,0 +1,250 @@
+import random
+import time
+
+from django.db import transaction
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from backend.cache import is_shared
+from backend.cache import invalidate
+from backend.cache import LOCAL_CACHE_WARNING
+from backend.counters import counters
+from backend.conditional import bump_version
+from backend.loading import batched
+
+from tags.models import Tag
+from users.models import User
+from users.models import SubscribeUser
+
+from recipes.models import Recipe
+from recipes.models import ShopList
+from recipes.models import Favorite
+from recipes.models import Ingredient
+from recipes.models import IngredientUnit
+from recipes.models import TimelineEntry
+from recipes import changes
+from recipes import timeline
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'Суп', 'Салат', 'Пирог', 'Рагу', 'Каша', 'Запеканка', 'Омлет',
+    'Паста', 'Котлеты', 'Блины', 'Плов', 'Соус', 'Десерт', 'Хлеб',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'острый', 'сытный', 'летний', 'овощной',
+    'мясной', 'рыбный', 'сливочный', 'пряный', 'легкий', 'праздничный',
+)
+COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F9A62B', '#2D9CDB')
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными для нагрузочных тестов: '
+        'пользователи, тэги, ингредиенты, рецепты, избранное, списки '
+        'покупок и подписки. При одном --seed на пустой базе данные '
+        'совпадают от запуска к запуску'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--tags', type=int, default=20)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--tags-per-recipe', type=int, default=3,
+            help='Максимум тэгов у рецепта'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10,
+            help='Максимум ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Максимум рецептов в избранном пользователя'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Максимум рецептов в списке покупок пользователя'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Максимум подписок пользователя'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--password', default='dataset-password',
+            help='Пароль всех созданных пользователей'
+        )
+
+    def log(self, message):
+        if self.verbosity > 1:
+            self.stdout.write(message)
+
+    def bulk_create(self, model, objects):
+        """
+            Вставка пачками, у каждой пачки своя транзакция
+        :return: созданные объекты с id
+        """
+        created = []
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                created.extend(model.objects.bulk_create(batch))
+        self.log(f'{model._meta.label}: {len(created)}')
+        return created
+
+    @staticmethod
+    def choice(rnd, population):
+        """
+            Элементы из начала population выбираются чаще, как
+            популярные авторы и рецепты
+        """
+        return population[int(len(population) * rnd.random() ** 2)]
+
+    def sample(self, rnd, population, limit):
+        """
+            От 0 до limit разных элементов population
+        """
+        count = min(rnd.randint(0, limit), len(population))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(self.choice(rnd, population))
+        return sorted(chosen)
+
+    def create_users(self, rnd, count, password):
+        start = User.objects.count()
+        password = make_password(password)
+        users = self.bulk_create(User, (
+            User(
+                username=f'user_{start + i}',
+                email=f'user_{start + i}@dataset.example',
+                first_name=rnd.choice(ADJECTIVES).capitalize(),
+                last_name=f'Пользователь {start + i}',
+                password=password,
+            ) for i in range(count)
+        ))
+        return [x.pk for x in users]
+
+    def create_tags(self, count):
+        start = Tag.objects.count()
+        tags = self.bulk_create(Tag, (
+            Tag(
+                name=f'Тэг {start + i}',
+                slug=f'tag-{start + i}',
+                color=COLORS[i % len(COLORS)],
+            ) for i in range(count)
+        ))
+        return [x.pk for x in tags]
+
+    def create_ingredients(self, count):
+        start = IngredientUnit.objects.count()
+        units = self.bulk_create(IngredientUnit, (
+            IngredientUnit(
+                name=f'{WORDS[i % len(WORDS)]} {start + i}'.lower(),
+                measurement_unit=UNITS[i % len(UNITS)],
+            ) for i in range(count)
+        ))
+        return [x.pk for x in units]
+
+    def create_recipes(self, rnd, count, authors, tags, units, options):
+        recipes = []
+        for batch in batched(range(count), self.batch_size):
+            with transaction.atomic():
+                created = Recipe.objects.bulk_create(
+                    Recipe(
+                        author_id=self.choice(rnd, authors),
+                        name=(
+                            f'{rnd.choice(WORDS)} {rnd.choice(ADJECTIVES)} '
+                            f'№{i}'
+                        ),
+                        image='recipes/dataset.png',
+                        text=' '.join(rnd.choices(ADJECTIVES, k=30)),
+                        cooking_time=rnd.randint(1, 180),
+                    ) for i in batch
+                )
+                Recipe.tags.through.objects.bulk_create(
+                    Recipe.tags.through(recipe_id=x.pk, tag_id=tag)
+                    for x in created for tag in self.sample(
+                        rnd, tags, options['tags_per_recipe']
+                    )
+                )
+                Ingredient.objects.bulk_create(
+                    Ingredient(
+                        recipes_id=x.pk,
+                        ingredient_unit_id=unit,
+                        amount=rnd.randint(1, 1000),
+                    )
+                    for x in created for unit in self.sample(
+                        rnd, units, options['ingredients_per_recipe']
+                    )
+                )
+            recipes.extend(x.pk for x in created)
+        self.log(f'{Recipe._meta.label}: {len(recipes)}')
+        return recipes
+
+    def create_lists(self, rnd, model, users, recipes, limit):
+        lists = self.bulk_create(model, (model(author_id=x) for x in users))
+        through = model.recipes.through
+        owner = model.recipes.field.m2m_field_name()
+        self.bulk_create(through, (
+            through(**{f'{owner}_id': x.pk, 'recipe_id': recipe})
+            for x in lists for recipe in self.sample(rnd, recipes, limit)
+        ))
+
+    def create_subscriptions(self, rnd, users, limit):
+        owners = self.bulk_create(
+            SubscribeUser, (SubscribeUser(owner_id=x) for x in users)
+        )
+        through = SubscribeUser.subscriber.through
+        self.bulk_create(through, (
+            through(subscribeuser_id=x.pk, user_id=author)
+            for x in owners for author in self.sample(rnd, users, limit)
+            if author != x.owner_id
+        ))
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 and options['recipes'] > 0:
+            raise CommandError('Для рецептов нужен хотя бы один автор')
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        rnd = random.Random(options['seed'])
+        started = time.monotonic()
+        try:
+            users = self.create_users(
+                rnd, options['users'], options['password']
+            )
+            tags = self.create_tags(options['tags'])
+            units = self.create_ingredients(options['ingredients'])
+            recipes = self.create_recipes(
+                rnd, options['recipes'], users, tags, units, options
+            )
+            self.create_lists(
+                rnd, Favorite, users, recipes, options['favorites']
+            )
+            self.create_lists(
+                rnd, ShopList, users, recipes, options['carts']
+            )
+            self.create_subscriptions(rnd, users, options['subscriptions'])
+            self.log(f'{TimelineEntry._meta.label}: {timeline.rebuild()}')
+            # bulk_create не отправляет сигналы, счетчики
+            # считаются одним UPDATE на каждый
+            for counter in counters:
+                counter.reconcile()
+        finally:
+            # Сброс через базу доходит до всех воркеров: индексы рецептов
+            # перестраиваются по строке сброса в логе изменений,
+            # автодополнение ингредиентов и ETag - по версиям коллекций
+            changes.reset()
+            bump_version('tags')
+            bump_version('ingredients')
+            invalidate()
+
+        if not is_shared():
+            self.stdout.write(self.style.WARNING(LOCAL_CACHE_WARNING))
+
+        self.stdout.write(
+            f'Пользователей: {len(users)}, тэгов: {len(tags)}, '
+            f'ингредиентов: {len(units)}, рецептов: {len(recipes)}, '
+            f'{time.monotonic() - started:.1f} с'
+        )
@@ -0,0 +1,83 @@
+import time
+
+from django.db import transaction
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from backend.cache import is_shared
+from backend.cache import invalidate
+from backend.cache import LOCAL_CACHE_WARNING
+from backend.conditional import bump_version
+from backend.loading import FORMATS
+from backend.loading import batched
+from backend.loading import read_rows
+
+from recipes.models import IngredientUnit
+
+FIELDS = ['name', 'measurement_unit']
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает справочник ингредиентов из CSV/JSON/JSONL. '
+        'Колонки: name, measurement_unit, заголовок CSV необязателен. '
+        'Повторы (name, measurement_unit) пропускаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @staticmethod
+    def units(batch):
+        """
+            Ингредиенты пачки без повторов внутри нее,
+            повторы с уже загруженными отсекает ограничение в базе
+        """
+        units = dict()
+        for row in batch:
+            name = (row.get('name') or '').strip()
+            unit = (row.get('measurement_unit') or '').strip()
+            if name and unit:
+                units.setdefault(
+                    (name, unit),
+                    IngredientUnit(name=name, measurement_unit=unit)
+                )
+        return list(units.values())
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        before = IngredientUnit.objects.count()
+        started = time.monotonic()
+        total = 0
+        try:
+            rows = read_rows(options['path'], options['format'], FIELDS)
+            for batch in batched(rows, batch_size):
+                with transaction.atomic():
+                    IngredientUnit.objects.bulk_create(
+                        self.units(batch),
+                        batch_size=batch_size,
+                        ignore_conflicts=True
+                    )
+                total += len(batch)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{total} строк')
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        finally:
+            # bulk_create не отправляет сигналы моделей. Версия коллекции
+            # в базе: по ней обновляются ETag и индекс автодополнения
+            # во всех воркерах
+            bump_version('ingredients')
+            invalidate()
+
+        if not is_shared():
+            self.stdout.write(self.style.WARNING(LOCAL_CACHE_WARNING))
+
+        created = IngredientUnit.objects.count() - before
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Строк: {total}, добавлено ингредиентов: {created}, '
+            f'{elapsed:.1f} с, {total / max(elapsed, 1e-6):.0f} строк/с'
+        )
@@ -0,0 +1,28 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.core.management.base import BaseCommand
+
+from recipes.models import RecipeSearch
+from recipes.fulltext import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Перестраивает полнотекстовый индекс рецептов (FTS5) '
+        'по названиям и описаниям в базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Алиас базы данных'
+        )
+        parser.add_argument(
+            '--optimize', action='store_true',
+            help='Слить сегменты индекса после перестроения'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        rebuild_index(using, optimize=options['optimize'])
+        count = RecipeSearch.objects.using(using).count()
+        self.stdout.write(f'Проиндексировано рецептов: {count}')
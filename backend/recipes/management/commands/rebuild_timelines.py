@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит ленты подписок (/recipes/feed/) по подпискам '
+        'и рецептам в базе, например после массовой загрузки данных'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Строк в лентах: {rebuild()}')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from backend.counters import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики, разошедшиеся с данными'
+
+    def handle(self, *args, **options):
+        for counter in counters:
+            fixed = counter.reconcile()
+            self.stdout.write(f'{counter}: исправлено {fixed}')
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db import connection
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Collate
 from django.core.validators import MinValueValidator
 
 from tags.models import Tag
@@ -9,6 +13,12 @@ from users.models import User
 class Recipe(models.Model):
     name = models.CharField(max_length=200, verbose_name='Название')
     image = models.ImageField(verbose_name='Ссылка на картинку на сайте')
+    image_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        verbose_name='Хэш картинки, по нему строятся имена вариантов'
+    )
     text = models.TextField(verbose_name='Описание')
     cooking_time = models.IntegerField(
         verbose_name='Время приготовления',
@@ -26,6 +36,17 @@ class Recipe(models.Model):
         on_delete=models.CASCADE
     )
 
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
+
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В списках покупок'
+    )
+
     def __str__(self):
         return self.name
 
@@ -33,6 +54,12 @@ class Recipe(models.Model):
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = (
+            # Рецепты автора в порядке ленты
+            models.Index(
+                fields=('author', '-id'), name='recipe_author_id_idx'
+            ),
+        )
 
 
 class IngredientUnit(models.Model):
@@ -40,6 +67,9 @@ class IngredientUnit(models.Model):
     measurement_unit = models.CharField(
         max_length=200, verbose_name='Единицы измерения'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
 
     def __str__(self):
         return f'Ингридиент {self.name}'
@@ -47,6 +77,18 @@ class IngredientUnit(models.Model):
     class Meta:
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_unit'
+            ),
+        )
+        indexes = (
+            # Поиск по началу названия без учета регистра (name__istartswith)
+            models.Index(
+                Collate('name', 'NOCASE'), name='ingredient_unit_name_ci_idx'
+            ),
+        )
 
 
 class Ingredient(models.Model):
@@ -78,9 +120,98 @@ class Ingredient(models.Model):
         ordering = ('-id',)
         verbose_name = 'Ингридиент в рецепте'
         verbose_name_plural = 'Ингридиенты в рецептах'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipes', 'ingredient_unit'),
+                name='unique_recipe_ingredient'
+            ),
+        )
+
+
+class RecipeListMixin:
+    """
+        Добавление/удаление рецепта в список пользователя одним запросом.
+        Повторы отсекает уникальное ограничение на промежуточной таблице,
+        счетчик recipe_counter у рецепта меняется в той же транзакции
+    """
+    recipe_counter = None
+    # Счетчик есть в ответах, которые кэширует backend.cache
+    counter_rendered = False
+
+    @classmethod
+    def _count(cls, recipe_id, delta):
+        Recipe.objects.filter(pk=recipe_id).update(
+            **{cls.recipe_counter: F(cls.recipe_counter) + delta}
+        )
+        if cls.counter_rendered:
+            from backend.cache import invalidate
+
+            invalidate()
+
+    @classmethod
+    def for_user(cls, user):
+        """
+            Список пользователя, строка создается при первом обращении
+        """
+        return cls.objects.get_or_create(author=user)[0]
+
+    @classmethod
+    def add_recipe(cls, user, recipe_id) -> bool:
+        """
+            INSERT ... ON CONFLICT DO NOTHING. Если вставка ничего
+            не добавила, списка могло не быть: он создается при
+            необходимости (в том числе другим запросом одновременно),
+            и вставка повторяется
+        :return: True, если рецепт добавлен
+        """
+        added = cls._insert_recipe(user, recipe_id)
+        if not added:
+            cls.for_user(user)
+            added = cls._insert_recipe(user, recipe_id)
+        return added
+
+    @classmethod
+    def _insert_recipe(cls, user, recipe_id) -> bool:
+        through = cls.recipes.through
+        owner = cls.recipes.field.m2m_column_name()
+        recipe = cls.recipes.field.m2m_reverse_name()
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {quote(through._meta.db_table)} '
+                    f'({quote(owner)}, {quote(recipe)}) '
+                    f'SELECT {quote("id")}, %s FROM {table} '
+                    f'WHERE {quote("author_id")} = %s '
+                    f'ON CONFLICT DO NOTHING',
+                    (recipe_id, user.id)
+                )
+                added = cursor.rowcount == 1
+            if added:
+                cls._count(recipe_id, 1)
+        return added
+
+    @classmethod
+    def remove_recipe(cls, user, recipe_id) -> bool:
+        """
+            DELETE ... WHERE recipe_id = ... AND list.author_id = ...
+        :return: True, если рецепт был в списке
+        """
+        owner = cls.recipes.field.m2m_field_name()
+        with transaction.atomic(savepoint=False):
+            deleted, _ = cls.recipes.through.objects.filter(
+                **{f'{owner}__author': user, 'recipe_id': recipe_id}
+            ).delete()
+            if not deleted:
+                return False
+            cls._count(recipe_id, -1)
+        return True
 
 
-class ShopList(models.Model):
+class ShopList(RecipeListMixin, models.Model):
+    recipe_counter = 'in_carts_count'
+
     author = models.OneToOneField(
         User,
         verbose_name='Пользователь',
@@ -90,6 +221,7 @@ class ShopList(models.Model):
 
     recipes = models.ManyToManyField(
         Recipe,
+        through='ShopListRecipe',
         verbose_name='Рецепты'
     )
 
@@ -102,7 +234,24 @@ class ShopList(models.Model):
         verbose_name_plural = 'Списки покупок'
 
 
-class Favorite(models.Model):
+class ShopListRecipe(models.Model):
+    shoplist = models.ForeignKey(ShopList, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'recipes_shoplist_recipes'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('shoplist', 'recipe'),
+                name='unique_shop_list_recipe'
+            ),
+        )
+
+
+class Favorite(RecipeListMixin, models.Model):
+    recipe_counter = 'favorites_count'
+    counter_rendered = True
+
     author = models.OneToOneField(
         User,
         verbose_name='Пользователь',
@@ -112,6 +261,7 @@ class Favorite(models.Model):
 
     recipes = models.ManyToManyField(
         Recipe,
+        through='FavoriteRecipe',
         verbose_name='Рецепты'
     )
 
@@ -122,3 +272,134 @@ class Favorite(models.Model):
         ordering = ('-id',)
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+
+
+class FavoriteRecipe(models.Model):
+    favorite = models.ForeignKey(Favorite, on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
+
+    class Meta:
+        db_table = 'recipes_favorite_recipes'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('favorite', 'recipe'),
+                name='unique_favorite_recipe'
+            ),
+        )
+
+
+class SearchDocumentField(models.TextField):
+    """
+        Скрытый столбец FTS5 с именем таблицы, левая часть MATCH
+    """
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+
+class RecipeSearch(models.Model):
+    """
+        Полнотекстовый индекс FTS5 по названию и описанию рецепта.
+        Таблицу и триггеры создает recipes.fulltext после migrate
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_document',
+        on_delete=models.DO_NOTHING
+    )
+    name = models.TextField()
+    text = models.TextField()
+    document = SearchDocumentField(db_column='recipes_recipe_fts')
+    # bm25 с весами столбцов, меньше - релевантнее
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'recipes_recipe_fts'
+
+
+class TimelineEntry(models.Model):
+    """
+        Строка ленты подписок: рецепт автора, на которого подписан
+        владелец ленты. Заполняется при создании рецепта и подписке
+        (recipes.timeline), лента читается по индексу (owner, recipe)
+    """
+    owner = models.ForeignKey(
+        User,
+        verbose_name='Владелец ленты',
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        # Индексы (owner, recipe) и (owner, author) начинаются с owner
+        db_index=False
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        verbose_name='Рецепт',
+        related_name='timeline_entries',
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User,
+        verbose_name='Автор рецепта',
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    class Meta:
+        db_table = 'recipes_timeline'
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('owner', 'recipe'),
+                name='unique_timeline_recipe'
+            ),
+        )
+        indexes = (
+            # Удаление рецептов автора при отписке
+            models.Index(
+                fields=('owner', 'author'), name='timeline_owner_author_idx'
+            ),
+        )
+
+
+class RecipeChange(models.Model):
+    """
+        Рецепт, у которого изменились тэги или ингредиенты, в том числе
+        удаленный. Без рецепта - массовая загрузка, индексы строятся
+        заново. Индексы в памяти каждого процесса читают новые строки
+        (recipes.changes)
+    """
+    recipe_id = models.BigIntegerField(
+        null=True, verbose_name='Рецепт'
+    )
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+
+
+class CollectionVersion(models.Model):
+    """
+        Версия коллекции (списка тэгов, ингредиентов, индекса в памяти).
+        Хранится в базе, чтобы изменение в одном процессе видели
+        все воркеры (backend.conditional)
+    """
+    name = models.CharField(
+        max_length=64, primary_key=True, verbose_name='Коллекция'
+    )
+    version = models.BigIntegerField(verbose_name='Версия')
+    modified = models.FloatField(verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name = 'Версия коллекции'
+        verbose_name_plural = 'Версии коллекций'
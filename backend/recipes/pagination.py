@@ -0,0 +1,34 @@
+"""
+    Пагинация ленты рецептов
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+        Пагинация по ключу (id) без COUNT и OFFSET.
+        Включается параметром ?cursor=, пустое значение - первая страница.
+        С ?search= не сочетается: курсор задает порядок по id, а поиск
+        упорядочивает по релевантности
+    """
+    ordering = '-id'
+    search_error = 'Параметр cursor нельзя использовать вместе с search'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('search', '').strip():
+            raise ParseError(self.search_error)
+        return super().paginate_queryset(queryset, request, view)
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+
+class TimelineCursorPagination(RecipeCursorPagination):
+    """
+        Курсор ленты подписок: id рецепта из TimelineEntry, порядок
+        совпадает с индексом (owner, recipe)
+    """
+    ordering = '-timeline_recipe'
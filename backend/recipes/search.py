@@ -0,0 +1,180 @@
+"""
+    Индекс автодополнения ингредиентов в памяти процесса
+"""
+import threading
+
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+
+from backend.conditional import get_version
+from backend.conditional import aget_versions
+
+from .models import IngredientUnit
+
+COLLECTION = 'ingredients'
+
+NGRAM = 3
+
+
+def _normalize(value):
+    return value.replace('\n', ' ').casefold()
+
+
+def _ngrams(value):
+    return {value[i:i + NGRAM] for i in range(len(value) - NGRAM + 1)}
+
+
+class IngredientIndex:
+    """
+        Отсортированный массив названий в нижнем регистре.
+        Префиксы ищутся бинарным поиском, подстроки - по триграммному
+        индексу (короткие запросы - через str.find по склеенным названиям).
+        Индекс помнит версию коллекции ingredients (CollectionVersion),
+        с которой построен: сигналы IngredientUnit и команды загрузки
+        увеличивают ее в базе, и индекс перестраивается при следующем
+        поиске в каждом процессе
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+
+    def build(self, rows=None):
+        """
+            Строит индекс
+        :param rows: кортежи (id, name, measurement_unit), по умолчанию из БД
+        :return: None
+        """
+        # Изменения, закоммиченные во время построения,
+        # увеличат версию, и индекс построится еще раз
+        version = get_version(COLLECTION)['version']
+        if rows is None:
+            rows = IngredientUnit.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator(chunk_size=10000)
+
+        entries = sorted(
+            ((_normalize(name), _id, name, unit) for _id, name, unit in rows),
+            key=lambda x: (x[0], x[1])
+        )
+        keys = [x[0] for x in entries]
+
+        offsets = array('i')
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+
+        postings = defaultdict(lambda: array('i'))
+        for i, key in enumerate(keys):
+            for ngram in _ngrams(key):
+                postings[ngram].append(i)
+
+        self._snapshot = (
+            keys,
+            [
+                dict(id=_id, name=name, measurement_unit=unit)
+                for _, _id, name, unit in entries
+            ],
+            '\n'.join(keys),
+            offsets,
+            dict(postings)
+        )
+        self._version = version
+
+    def invalidate(self):
+        """
+            Построить индекс заново в этом процессе, остальные
+            перестраивают его по версии коллекции
+        """
+        self._version = None
+
+    def _is_stale(self, version):
+        return self._snapshot is None or self._version != version
+
+    def _get_snapshot(self, version=None):
+        if version is None:
+            version = get_version(COLLECTION)['version']
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.build()
+        elif self._is_stale(version):
+            # Пока один поток перестраивает индекс, остальные
+            # пользуются предыдущей версией
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.build()
+                finally:
+                    self._lock.release()
+        return self._snapshot
+
+    @staticmethod
+    def _substring_candidates(query, keys, haystack, offsets, postings):
+        if len(query) >= NGRAM:
+            lists = [postings.get(x) for x in _ngrams(query)]
+            if not all(lists):
+                return
+            for i in min(lists, key=len):
+                if query in keys[i]:
+                    yield i
+            return
+
+        position = haystack.find(query)
+        while position != -1:
+            i = bisect_right(offsets, position) - 1
+            yield i
+            position = haystack.find(query, offsets[i] + len(keys[i]) + 1)
+
+    def search(self, query, limit):
+        """
+            Сначала совпадения по началу названия, затем по подстроке
+        :param query: строка поиска без учета регистра
+        :param limit: максимальное кол-во результатов
+        :return: список словарей id, name, measurement_unit
+        """
+        return self._search(self._get_snapshot(), query, limit)
+
+    async def asearch(self, query, limit):
+        """
+            search для async-представлений: индекс строится из базы
+            в потоке, поиск по готовому индексу идет без перехода в поток
+        """
+        snapshot = self._snapshot
+        versions = await aget_versions(COLLECTION)
+        version = versions[COLLECTION]['version']
+        if self._is_stale(version):
+            snapshot = await sync_to_async(self._get_snapshot)(version)
+        return self._search(snapshot, query, limit)
+
+    def _search(self, snapshot, query, limit):
+        keys, entries, haystack, offsets, postings = snapshot
+        query = _normalize(query)
+
+        found = []
+        i = bisect_left(keys, query)
+        while i < len(keys) and len(found) < limit:
+            if not keys[i].startswith(query):
+                break
+            found.append(i)
+            i += 1
+
+        if query and len(found) < limit:
+            candidates = self._substring_candidates(
+                query, keys, haystack, offsets, postings
+            )
+            for i in candidates:
+                if not keys[i].startswith(query):
+                    found.append(i)
+                    if len(found) == limit:
+                        break
+
+        return [entries[i] for i in found]
+
+
+ingredient_index = IngredientIndex()
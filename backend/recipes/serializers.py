@@ -5,32 +5,46 @@
     @ Author: Ohlupin Maxim
 
 """
-from django.db.models import Exists
-from django.db.models import OuterRef
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models import prefetch_related_objects
+from django.http import Http404
 
 from rest_framework import serializers
 
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields import fields as extra_fields
 
 from tags.models import Tag
 from tags.serializers import TagSerializer
 
-from users.models import User
-from users.models import SubscribeUser
 from users.serializers import UserSerializer
 
 from .models import Recipe
 from .models import Ingredient
 from .models import IngredientUnit
 
+from .images import run
+from .images import variant_urls
+
+from . import changes
+
 from .validators import positive_value_validator
 
 
+class Base64ImageField(extra_fields.Base64ImageField):
+    """
+        Декодирование base64 и проверка картинки Pillow выполняются
+        в пуле потоков recipes.images, а не в потоке запроса
+    """
+
+    def to_internal_value(self, base64_data):
+        return run(super().to_internal_value, base64_data)
+
+
 class IngredientUnitSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientUnit
-        fields = "__all__"
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -61,41 +75,66 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only=True, default=False
     )
     image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
-    def get_author(self, instance):
-        request = self.context["request"]
-        current_user = request.user
-
-        if current_user.is_authenticated:
-            queryset = User.objects.filter(
-                id=instance.author.id
-            ).annotate(
-                is_subscribed=Exists(
-                    SubscribeUser.objects.filter(
-                        owner=current_user,
-                        subscriber=OuterRef('id')
-                    )
-                )
-            )
-            return UserSerializer(queryset.first(), many=False).data
-        return UserSerializer(instance.author, many=False).data
+    @staticmethod
+    def get_author(instance):
+        author = instance.author
+        author.is_subscribed = getattr(
+            instance, 'author_is_subscribed', False
+        )
+        return UserSerializer(author, many=False).data
 
-    def get_image(self, instance):
+    def _absolute_url(self, url):
         request = self.context["request"]
         if request.headers.get("Host"):
             real_host = request.headers.get("Host")
-            return f"http://{real_host}{instance.image.url}"
-        return request.build_absolute_uri(instance.image.url)
+            return f"http://{real_host}{url}"
+        return request.build_absolute_uri(url)
+
+    def get_image(self, instance):
+        return self._absolute_url(instance.image.url)
+
+    def get_images(self, instance):
+        return {
+            variant: self._absolute_url(url)
+            for variant, url in variant_urls(instance).items()
+        }
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author',
             'ingredients', 'is_in_shopping_cart', 'is_favorited',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'images', 'text', 'cooking_time',
+            'favorites_count'
         )
 
 
+class RecipeCoverageSerializer(RecipeSerializer):
+    """
+        Рецепт в подборке по ингредиентам: сколько ингредиентов
+        из запроса в нем есть и скольких не хватает
+    """
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_ingredients', 'missing_ingredients'
+        )
+
+
+class SimilarRecipeSerializer(RecipeSerializer):
+    """
+        Похожий рецепт: оценка сходства наборов ингредиентов (0..1)
+    """
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('similarity',)
+
+
 class RecipeInSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
@@ -106,12 +145,7 @@ class RecipeInSerializer(serializers.ModelSerializer):
 
 class IngredientRelatedField(serializers.RelatedField):
     def to_internal_value(self, data):
-        data.update(
-            ingredient_unit=get_object_or_404(
-                IngredientUnit, id=data.pop('id')
-            )
-        )
-        return data
+        return dict(id=data['id'], amount=data['amount'])
 
     def to_representation(self, value):
         return dict(
@@ -135,51 +169,79 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def validate_ingredients(ingredients):
+        """
+            Проверяет кол-во и одним запросом подставляет IngredientUnit,
+            повторы одного ингредиента суммируются
+        """
         positive_value_validator(ingredients, "amount")
-        return ingredients
-
+        units = IngredientUnit.objects.in_bulk(
+            {x['id'] for x in ingredients}
+        )
+        amounts = dict()
+        for ingredient in ingredients:
+            unit = units.get(int(ingredient['id']))
+            if unit is None:
+                raise Http404
+            amounts[unit] = amounts.get(unit, 0) + int(ingredient['amount'])
+        return [
+            dict(ingredient_unit=unit, amount=amount)
+            for unit, amount in amounts.items()
+        ]
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         recipe = super().create(validated_data)
 
-        for ingredient in ingredients:
-            Ingredient.objects.create(
-                recipes=recipe,
-                **ingredient
-            )
+        Ingredient.objects.bulk_create(
+            Ingredient(recipes=recipe, **ingredient)
+            for ingredient in ingredients
+        )
+        # Индексы ингредиентов перечитают рецепт из лога изменений
+        changes.record([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        new_ids = {x['ingredient_unit'].id for x in ingredients}
-        old_ids = {
-            x['ingredient_unit__id'] for x in instance.ingredients.values(
-                'ingredient_unit__id'
-            )
-        }
-
-        to_update = new_ids - old_ids
-        to_delete = old_ids - new_ids
-
-        instance.ingredients.filter(
-            ingredient_unit__id__in=to_delete
-        ).delete()
-
-        for ingredient in ingredients:
-            _id = ingredient['ingredient_unit'].id
-            if _id in to_update:
-                curr_ingrid = instance.ingredients.filter(id=_id)
-                if curr_ingrid.exists():
-                    curr_ingrid = curr_ingrid.first()
-                    curr_ingrid.amount = ingredient['amount']
-                    curr_ingrid.save()
-                else:
-                    Ingredient.objects.create(
-                        recipes=instance,
-                        **ingredient
+        ingredients = validated_data.pop('ingredients', None)
+        if ingredients is not None:
+            current = {
+                x.ingredient_unit_id: x for x in instance.ingredients.all()
+            }
+            to_create = []
+            to_update = []
+            for ingredient in ingredients:
+                row = current.pop(ingredient['ingredient_unit'].id, None)
+                if row is None:
+                    to_create.append(
+                        Ingredient(recipes=instance, **ingredient)
                     )
+                elif row.amount != ingredient['amount']:
+                    row.amount = ingredient['amount']
+                    to_update.append(row)
+
+            if current:
+                Ingredient.objects.filter(
+                    id__in=[x.id for x in current.values()]
+                ).delete()
+            Ingredient.objects.bulk_create(to_create)
+            Ingredient.objects.bulk_update(to_update, ('amount',))
+            if to_create or current:
+                changes.record([instance.pk])
         return super().update(instance, validated_data)
 
+    def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.select_related('ingredient_unit')
+            )
+        )
+        return super().to_representation(instance)
+
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = (
+            'updated_at', 'image_hash', 'favorites_count', 'in_carts_count'
+        )
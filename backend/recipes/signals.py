@@ -0,0 +1,211 @@
+from django.db import transaction
+from django.utils import timezone
+from django.dispatch import receiver
+from django.db.models.signals import pre_save
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_migrate
+
+from backend.cache import invalidate
+from backend.conditional import bump_version
+from backend.counters import ForeignKeyCounter
+from backend.counters import ManyToManyCounter
+
+from tags.models import Tag
+
+from users.models import User
+from users.models import SubscribeUser
+
+from .models import Recipe
+from .models import ShopList
+from .models import Favorite
+from .models import Ingredient
+from .models import IngredientUnit
+
+from . import images
+from . import changes
+from . import fulltext
+from . import timeline
+
+ForeignKeyCounter(Recipe.author, 'recipes_count').connect()
+ManyToManyCounter(Favorite.recipes, 'favorites_count').connect()
+ManyToManyCounter(ShopList.recipes, 'in_carts_count').connect()
+
+
+# Поля автора в ответах рецептов
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+# Кэш ответов сбрасывается только при изменении того, что в них есть:
+# список покупок (in_carts_count) и вход пользователя - нет
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=IngredientUnit)
+@receiver(post_delete, sender=IngredientUnit)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Favorite.recipes.through)
+@receiver(pre_delete, sender=Favorite)
+def invalidate_response_cache(sender, **kwargs):
+    invalidate()
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields(sender, instance, update_fields=None, **kwargs):
+    """
+        Отмечает изменение полей автора: у нового пользователя
+        рецептов нет, last_login и пароль в ответах не выводятся
+    """
+    instance._author_changed = False
+    if instance._state.adding or update_fields is not None \
+            and not set(update_fields) & set(AUTHOR_FIELDS):
+        return
+    saved = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS
+    ).first()
+    instance._author_changed = saved != tuple(
+        getattr(instance, x) for x in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, **kwargs):
+    if getattr(instance, '_author_changed', False):
+        invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def record_ingredient_change(sender, instance, **kwargs):
+    # Удаление строк отмечают сериализатор рецепта и админка:
+    # сигнал на каждую строку добавил бы запись в лог на строку
+    changes.record([instance.recipes_id])
+
+
+@receiver(pre_delete, sender=IngredientUnit)
+def record_ingredient_unit_delete(sender, instance, **kwargs):
+    # Строки Ingredient удаляются каскадом
+    changes.record(instance.in_recipe_ingredient.values_list(
+        'recipes_id', flat=True
+    ))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=IngredientUnit)
+@receiver(post_delete, sender=IngredientUnit)
+def bump_ingredients_version(sender, **kwargs):
+    # По версии перестраивается и индекс автодополнения
+    bump_version('ingredients')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action == 'pre_clear':
+            recipes = Recipe.objects.filter(tags=instance)
+        elif action in ('post_add', 'post_remove'):
+            recipes = Recipe.objects.filter(pk__in=pk_set)
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    else:
+        return
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def record_tag_change(sender, instance, action, reverse, pk_set,
+                      **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            changes.record([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        changes.record(pk_set)
+    elif action == 'pre_clear':
+        changes.record(Recipe.objects.filter(
+            tags=instance
+        ).values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+def record_tag_rename(sender, instance, created, **kwargs):
+    # Новый слаг индекс тэгов читает вместе с рецептами
+    if not created:
+        changes.record(Recipe.objects.filter(
+            tags=instance
+        ).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def record_tag_delete(sender, instance, **kwargs):
+    # Связи с рецептами удаляются каскадом без m2m_changed
+    changes.record(Recipe.objects.filter(
+        tags=instance
+    ).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def record_recipe_delete(sender, instance, **kwargs):
+    changes.record([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(m2m_changed, sender=SubscribeUser.subscriber.through)
+def update_timeline(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance - автор, pk_set - id SubscribeUser подписчиков
+        authors = [instance.pk]
+        if action == 'post_clear':
+            timeline.purge(author_ids=authors)
+            return
+        if action not in ('post_add', 'post_remove'):
+            return
+        owners = SubscribeUser.objects.filter(
+            pk__in=pk_set
+        ).values_list('owner_id', flat=True)
+        if action == 'post_add':
+            for owner in owners:
+                timeline.backfill(owner, authors)
+        else:
+            timeline.purge(owners, authors)
+    elif action == 'post_add':
+        timeline.backfill(instance.owner_id, pk_set)
+    elif action == 'post_remove':
+        timeline.purge([instance.owner_id], pk_set)
+    elif action == 'post_clear':
+        timeline.purge([instance.owner_id])
+
+
+@receiver(post_delete, sender=SubscribeUser)
+def purge_timeline(sender, instance, **kwargs):
+    # Связи подписок удаляются каскадом без m2m_changed
+    timeline.purge([instance.owner_id])
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    if sender.label == 'recipes':
+        fulltext.create_index(using)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_image_processing(sender, instance, update_fields=None,
+                              **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    transaction.on_commit(lambda: images.schedule(instance.pk))
@@ -0,0 +1,284 @@
+"""
+    Похожие рецепты: MinHash-сигнатуры наборов ингредиентов
+    (IngredientUnit) и LSH-корзины по полосам сигнатуры в памяти
+    процесса
+"""
+import threading
+
+from itertools import chain
+
+import numpy as np
+
+from django.conf import settings
+
+from .models import Ingredient
+from .changes import ChangeTrackingIndex
+
+# Сигнатура - NUM_PERM минимумов, BANDS полос по ROWS значений.
+# Рецепты попадают в одну корзину хотя бы по одной полосе с
+# вероятностью 1 - (1 - J^ROWS)^BANDS: 0.35 при сходстве Жаккара
+# J = 0.3, 0.88 при J = 0.5, 0.999 при J = 0.7
+NUM_PERM = 48
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Из минимума хранятся младшие 16 бит: случайное совпадение
+# значений (1 / 65536) почти не меняет оценку сходства,
+# а сигнатуры занимают вдвое меньше
+SIGNATURE_DTYPE = np.uint16
+
+# Простое число Мерсенна 2^31 - 1: a * x + b помещается в uint64
+PRIME = (1 << 31) - 1
+_random = np.random.default_rng(20230209)
+HASH_A = _random.integers(1, PRIME, NUM_PERM, dtype=np.uint64)
+HASH_B = _random.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+# Множители для ключа полосы, переполнение uint64 допустимо,
+# в ключ идут старшие 32 бита суммы
+BAND_MULTIPLIERS = _random.integers(
+    1, 1 << 63, ROWS, dtype=np.uint64
+) | np.uint64(1)
+
+# При id ингредиентов меньше этого таблица хэшей строится сразу
+# по всем id, без np.unique по строкам Ingredient
+DENSE_UNITS = 1 << 20
+# Кандидатов из одной корзины: корзины одинаковых наборов
+# популярных ингредиентов могут быть большими
+BUCKET_LIMIT = 1000
+
+
+def hash_units(unit_ids):
+    """
+        NUM_PERM хэшей (a * x + b) mod PRIME для каждого ингредиента
+    :param unit_ids: id IngredientUnit
+    :return: массив (NUM_PERM, len(unit_ids)) uint32
+    """
+    units = np.asarray(unit_ids, dtype=np.uint64)
+    return (
+        (HASH_A.reshape(-1, 1) * units + HASH_B.reshape(-1, 1)) % PRIME
+    ).astype(np.uint32)
+
+
+def minhash(unit_ids):
+    """
+        Сигнатура одного набора ингредиентов
+    """
+    return hash_units(unit_ids).min(axis=1).astype(SIGNATURE_DTYPE)
+
+
+def band_keys(signatures):
+    """
+    :param signatures: массив (n, NUM_PERM) сигнатур
+    :return: массив (n, BANDS) uint32 ключей корзин
+    """
+    bands = signatures.reshape(-1, BANDS, ROWS).astype(np.uint64)
+    keys = (bands * BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+    return (keys >> np.uint64(32)).astype(np.uint32)
+
+
+def signatures(recipes, units):
+    """
+        MinHash-сигнатуры наборов ингредиентов рецептов
+    :param recipes: id рецептов по строкам Ingredient
+    :param units: id IngredientUnit по строкам Ingredient
+    :return: отсортированные id рецептов и массив (n, NUM_PERM)
+    """
+    order = np.argsort(recipes, kind='stable')
+    ids, starts = np.unique(recipes[order], return_index=True)
+    units = units[order]
+    # Хэши считаются один раз на ингредиент, строки берут их по индексу
+    if len(units) and units.max() < DENSE_UNITS:
+        table = hash_units(np.arange(units.max() + 1))
+    else:
+        unique_units, units = np.unique(units, return_inverse=True)
+        table = hash_units(unique_units)
+
+    # По одной перестановке за раз: временный массив - одно значение
+    # на строку Ingredient, минимум по рецепту - reduceat
+    result = np.empty((len(ids), NUM_PERM), dtype=SIGNATURE_DTYPE)
+    for permutation, hashes in enumerate(table):
+        if len(ids):
+            result[:, permutation] = np.minimum.reduceat(
+                hashes[units], starts
+            )
+    return ids.astype(np.int32), result
+
+
+class SimilarRecipeIndex(ChangeTrackingIndex):
+    """
+        Сигнатуры рецептов (массив по отсортированным id) и для каждой
+        полосы - ключи корзин по возрастанию с id рецептов.
+        Кандидаты - рецепты, совпавшие с рецептом хотя бы в одной
+        корзине, сходство оценивается по доле равных значений сигнатур.
+        Перед поиском индекс перечитывает рецепты из лога изменений
+        (recipes.changes): новые сигнатуры хранятся отдельно (_extra)
+        и проверяются перебором, прежние отмечены в _removed. Раз
+        в SIMILAR_RECIPES_MERGE_EVERY рецептов они вливаются в основные
+        массивы без чтения базы
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._ids = None
+        self._signatures = None
+        self._buckets = None
+        self._extra_ids = np.empty(0, dtype=np.int32)
+        self._extra = np.empty((0, NUM_PERM), dtype=SIGNATURE_DTYPE)
+        self._removed = frozenset()
+
+    def _build(self, rows=None):
+        """
+            Строит индекс
+        :param rows: массив (n, 2) или пары (recipe_id, ingredient_unit_id),
+            по умолчанию из БД
+        :return: None
+        """
+        if rows is None:
+            rows = Ingredient.objects.values_list(
+                'recipes_id', 'ingredient_unit_id'
+            ).order_by().iterator(chunk_size=10000)
+        if not isinstance(rows, np.ndarray):
+            rows = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+        rows = rows.reshape(-1, 2)
+
+        ids, values = signatures(rows[:, 0], rows[:, 1])
+        keys = band_keys(values)
+        buckets = []
+        for band in range(BANDS):
+            order = np.argsort(keys[:, band])
+            buckets.append((keys[order, band], ids[order]))
+
+        with self._lock:
+            self._ids = ids
+            self._signatures = values
+            self._buckets = buckets
+            self._extra_ids = np.empty(0, dtype=np.int32)
+            self._extra = np.empty((0, NUM_PERM), dtype=SIGNATURE_DTYPE)
+            self._removed = frozenset()
+
+    def _reload(self, recipe_ids):
+        """
+            Новые сигнатуры рецептов из базы, у удаленных рецептов
+            и рецептов без ингредиентов сигнатуры нет
+        """
+        rows = Ingredient.objects.filter(
+            recipes_id__in=recipe_ids
+        ).values_list('recipes_id', 'ingredient_unit_id').order_by()
+        rows = np.fromiter(
+            chain.from_iterable(rows), dtype=np.int64
+        ).reshape(-1, 2)
+        ids, values = signatures(rows[:, 0], rows[:, 1])
+
+        keep = ~np.isin(self._extra_ids, list(recipe_ids))
+        extra_ids = np.concatenate((self._extra_ids[keep], ids))
+        extra = np.concatenate((self._extra[keep], values))
+        removed = self._removed | recipe_ids
+        if len(extra_ids) + len(removed) \
+                > getattr(settings, 'SIMILAR_RECIPES_MERGE_EVERY', 1000):
+            self._merge(extra_ids, extra, removed)
+            return
+        # Массивы и множество заменяются целиком: запрос в другом
+        # потоке дочитывает прежнюю версию
+        with self._lock:
+            self._extra_ids = extra_ids
+            self._extra = extra
+            self._removed = removed
+
+    def _merge(self, extra_ids, extra, removed):
+        """
+            Вливает новые сигнатуры в основные массивы: вставка
+            в отсортированные массивы, без сортировки всего индекса
+        """
+        size = max(
+            int(self._ids.max(initial=0)), int(extra_ids.max(initial=0)),
+            max(removed)
+        ) + 1
+        stale = np.zeros(size, dtype=bool)
+        stale[list(removed)] = True
+        order = np.argsort(extra_ids)
+        extra_ids, extra = extra_ids[order], extra[order]
+
+        keep = ~stale[self._ids]
+        ids = self._ids[keep]
+        positions = np.searchsorted(ids, extra_ids)
+        ids = np.insert(ids, positions, extra_ids)
+        values = np.insert(
+            self._signatures[keep], positions, extra, axis=0
+        )
+        keys = band_keys(extra)
+        buckets = []
+        for band, (sorted_keys, members) in enumerate(self._buckets):
+            keep = ~stale[members]
+            sorted_keys, members = sorted_keys[keep], members[keep]
+            order = np.argsort(keys[:, band])
+            positions = np.searchsorted(sorted_keys, keys[order, band])
+            buckets.append((
+                np.insert(sorted_keys, positions, keys[order, band]),
+                np.insert(members, positions, extra_ids[order]),
+            ))
+
+        with self._lock:
+            self._ids = ids
+            self._signatures = values
+            self._buckets = buckets
+            self._extra_ids = np.empty(0, dtype=np.int32)
+            self._extra = np.empty((0, NUM_PERM), dtype=SIGNATURE_DTYPE)
+            self._removed = frozenset()
+
+    def _signature(self, recipe_id):
+        position = np.flatnonzero(self._extra_ids == recipe_id)
+        if len(position):
+            return self._extra[position[0]]
+        if recipe_id in self._removed:
+            return None
+        position = np.searchsorted(self._ids, recipe_id)
+        if recipe_id not in self._ids[position:position + 1]:
+            return None
+        return self._signatures[position]
+
+    def search(self, recipe_id, count):
+        """
+            Рецепты с похожим набором ингредиентов: по убыванию
+            оценки сходства Жаккара, при равной - новые
+        :param recipe_id: id рецепта
+        :param count: сколько рецептов вернуть
+        :return: массивы id рецептов и оценок сходства
+        """
+        self.refresh()
+        with self._lock:
+            ids = self._ids
+            values = self._signatures
+            buckets = self._buckets
+            extra_ids = self._extra_ids
+            extra = self._extra
+            removed = self._removed
+            signature = self._signature(recipe_id)
+        if signature is None:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+
+        keys = band_keys(signature)[0]
+        candidates = []
+        for (sorted_keys, members), key in zip(buckets, keys):
+            first = np.searchsorted(sorted_keys, key, side='left')
+            last = np.searchsorted(sorted_keys, key, side='right')
+            candidates.append(members[first:min(last, first + BUCKET_LIMIT)])
+        candidates = np.unique(np.concatenate(candidates))
+        candidates = candidates[~np.isin(
+            candidates, [recipe_id, *removed]
+        )]
+        scores = (
+            values[np.searchsorted(ids, candidates)] == signature
+        ).mean(axis=1)
+
+        if len(extra_ids):
+            mask = (band_keys(extra) == keys).any(axis=1)
+            mask &= extra_ids != recipe_id
+            candidates = np.concatenate((candidates, extra_ids[mask]))
+            scores = np.concatenate((
+                scores, (extra[mask] == signature).mean(axis=1)
+            ))
+
+        order = np.lexsort((-candidates, -scores))[:count]
+        return candidates[order], scores[order]
+
+
+similar_index = SimilarRecipeIndex()
@@ -0,0 +1,182 @@
+"""
+    Фильтр ленты по тэгам в памяти процесса: битовая карта рецептов
+    на каждый тэг и массив авторов по id рецепта
+"""
+import threading
+
+from functools import reduce
+from itertools import chain
+from collections import defaultdict
+
+import numpy as np
+
+from tags.models import Tag
+
+from .models import Recipe
+from .changes import ChangeTrackingIndex
+
+
+def _capacity(size):
+    """
+        Размер массивов с запасом, кратный 8 (битовые карты по байтам)
+    """
+    return (size + size // 4 + 64) // 8 * 8
+
+
+def _pairs(queryset):
+    """
+        Пары значений values_list в массив (n, 2) без списка кортежей
+    """
+    rows = queryset.order_by().iterator(chunk_size=10000)
+    return np.fromiter(
+        chain.from_iterable(rows), dtype=np.int64
+    ).reshape(-1, 2)
+
+
+def _pack(recipe_ids, size):
+    mask = np.zeros(size, dtype=bool)
+    mask[recipe_ids] = True
+    return np.packbits(mask, bitorder='little')
+
+
+def _resized(array, size):
+    """
+        Копия массива, дополненная нулями до size
+    """
+    result = np.zeros(size, dtype=array.dtype)
+    result[:len(array)] = array
+    return result
+
+
+def _bits(recipe_ids):
+    """
+    :return: байты и маски битов рецептов в битовой карте
+    """
+    recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+    return recipe_ids >> 3, (1 << (recipe_ids & 7)).astype(np.uint8)
+
+
+class TagBitmapIndex(ChangeTrackingIndex):
+    """
+        Битовая карта (np.uint8, бит на id рецепта) для каждого тэга.
+        Лента по тэгам - объединение карт, пересеченное с рецептами
+        автора; из базы затем читается только страница.
+        Перед чтением индекс перечитывает рецепты из лога изменений
+        (recipes.changes). Если лог читает другой поток, лента
+        строится запросом к базе, а не по устаревшему индексу
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._bits = None
+        self._slugs = None
+        self._authors = None
+
+    def _build(self):
+        slugs = dict(Tag.objects.values_list('slug', 'id'))
+
+        recipes = _pairs(Recipe.objects.values_list('id', 'author_id'))
+        size = _capacity(int(recipes[:, 0].max(initial=0)) + 1)
+        authors = np.zeros(size, dtype=np.int32)
+        authors[recipes[:, 0]] = recipes[:, 1]
+
+        rows = _pairs(
+            Recipe.tags.through.objects.values_list('tag_id', 'recipe_id')
+        )
+        bits = {
+            tag_id: _pack(rows[rows[:, 0] == tag_id, 1], size)
+            for tag_id in slugs.values()
+        }
+
+        with self._lock:
+            self._bits = bits
+            self._slugs = slugs
+            self._authors = authors
+
+    def _reload(self, recipe_ids):
+        """
+            Авторы и тэги рецептов из базы, удаленные рецепты
+            убираются из индекса. Массивы не меняются на месте:
+            меняются копии, затем ссылки, и запрос в другом потоке
+            дочитывает прежнюю версию
+        """
+        slugs = dict(Tag.objects.values_list('slug', 'id'))
+        authors = dict(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('id', 'author_id'))
+        added = defaultdict(list)
+        for tag_id, recipe_id in Recipe.tags.through.objects.filter(
+                recipe_id__in=recipe_ids
+        ).values_list('tag_id', 'recipe_id'):
+            added[tag_id].append(recipe_id)
+
+        # Индекс меняет только этот поток (refresh под _sync_lock)
+        ids = sorted(recipe_ids)
+        size = len(self._authors)
+        if ids[-1] >= size:
+            size = _capacity(ids[-1] + 1)
+        new_authors = _resized(self._authors, size)
+        new_authors[ids] = [authors.get(x, 0) for x in ids]
+
+        empty = np.empty(0, dtype=np.uint8)
+        byte, bit = _bits(ids)
+        new_bits = dict()
+        for tag_id in slugs.values():
+            bits = self._bits.get(tag_id, empty)
+            if len(bits) == size // 8 and tag_id not in added \
+                    and not (bits[byte] & bit).any():
+                new_bits[tag_id] = bits
+                continue
+            bits = _resized(bits, size // 8)
+            # ufunc.at: у нескольких рецептов может быть общий байт
+            np.bitwise_and.at(bits, byte, ~bit)
+            if tag_id in added:
+                np.bitwise_or.at(bits, *_bits(added[tag_id]))
+            new_bits[tag_id] = bits
+
+        with self._lock:
+            self._bits = new_bits
+            self._slugs = slugs
+            self._authors = new_authors
+
+    def recipe_ids(self, slugs, author=None):
+        """
+            Рецепты хотя бы с одним из тэгов, как фильтр
+            tags в ленте
+        :param slugs: слаги тэгов
+        :param author: id автора или None
+        :return: np.ndarray id рецептов по убыванию или None,
+            если индекс сейчас обновляет другой поток
+        """
+        if not self.refresh(blocking=False):
+            return None
+        return self._recipe_ids(slugs, author)
+
+    async def arecipe_ids(self, slugs, author=None):
+        """
+            recipe_ids для async-представлений: лог изменений
+            и индекс читаются из базы в потоке
+        """
+        if not await self.arefresh(blocking=False):
+            return None
+        return self._recipe_ids(slugs, author)
+
+    def _recipe_ids(self, slugs, author):
+        with self._lock:
+            tags = [
+                self._bits[self._slugs[x]] for x in set(slugs)
+                if self._slugs.get(x) in self._bits
+            ]
+            authors = self._authors
+        if not tags:
+            return np.empty(0, dtype=np.int64)
+        mask = np.unpackbits(
+            reduce(np.bitwise_or, tags), bitorder='little'
+        ).view(bool)
+        if author is not None:
+            mask &= authors[:len(mask)] == author
+        return np.flatnonzero(mask)[::-1]
+
+
+tag_index = TagBitmapIndex()
@@ -1,21 +1,122 @@
+import os
 import json
+import asyncio
+import time
+import base64
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from io import BytesIO
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+
+from PIL import Image
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from django.db import connection
+from django.db import connections
+from django.db.utils import ConnectionHandler
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
 
 from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+
+from backend.conditional import increment_version
 
 from tags.models import Tag
 
 from users.models import User
+from users.models import SubscribeUser
 
 from .models import Recipe
+from .models import ShopList
+from .models import Favorite
 from .models import Ingredient
 from .models import IngredientUnit
+from .models import RecipeChange
+
+from .views import RecipeViewSet
+
+from .pagination import TimelineCursorPagination
+
+from .serializers import RecipeSerializer
+
+from .search import ingredient_index
+from .coverage import recipe_ingredient_index
+from .tag_bitmaps import tag_index
+from .similar import similar_index
+from .similar import signatures
 
+from .images import process_image
+from .images import variant_name
+
+from . import changes
+
+
+class RecipeWriteMixin:
+    """
+        Запись рецептов через API. Картинки сохраняются во временный
+        MEDIA_ROOT, а не в media проекта
+    """
+    image = (
+        'data:image/png;base64,'
+        'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACVBMVEUAAAD///9fX1/S'
+        '0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCByxOyYQAAAABJ'
+        'RU5ErkJggg=='
+    )
 
-class RecipeTestCase(APITestCase):
     @classmethod
-    def setUp(cls) -> None:
+    def setUpClass(cls):
         super().setUpClass()
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+
+    def _write(self, method, url, units, tags=None, user=None):
+        """
+            Создает или изменяет рецепт, картинка не обрабатывается
+        :param units: индексы в self.units, количество - 1
+        :param tags: тэги рецепта, по умолчанию self.tag
+        :param user: автор, по умолчанию self.user
+        :return: id рецепта
+        """
+        user = user or self.user
+        with mock.patch('recipes.images.schedule'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                url,
+                content_type='application/json',
+                data=json.dumps(dict(
+                    image=self.image, name='string', text='string',
+                    cooking_time=1, tags=[x.id for x in tags or [self.tag]],
+                    ingredients=[
+                        dict(id=self.units[i].id, amount=1) for i in units
+                    ]
+                )),
+                HTTP_AUTHORIZATION=f'Token {user.auth_token.key}'
+            )
+        self.assertIn(response.status_code, (200, 201))
+        return response.data['id']
+
 
+class RecipeTestCase(RecipeWriteMixin, APITestCase):
+    def setUp(self) -> None:
         user = User.objects.create_user(
             username='test_user_1',
             email='test_user_1@mail.ru',
@@ -27,18 +128,18 @@ class RecipeTestCase(APITestCase):
             email='another_author@gmail.com',
             password='12345678'
         )
-        cls.user = user
-        cls.another_user = another_user
+        self.user = user
+        self.another_user = another_user
 
-        cls.recipe_model_fields = [
+        self.recipe_model_fields = [
             x.name for x in getattr(Recipe, '_meta').fields
         ]
 
-        cls.ingredient_unit_model_fields = [
+        self.ingredient_unit_model_fields = [
             x.name for x in getattr(IngredientUnit, '_meta').fields
         ]
 
-        cls.ingredients = [
+        self.ingredients = [
             IngredientUnit.objects.create(
                 name=name, measurement_unit=unit
             ) for name, unit in (
@@ -47,7 +148,7 @@ class RecipeTestCase(APITestCase):
             )
         ]
 
-        cls.tags = [
+        self.tags = [
             Tag.objects.create(name=n, slug=s) for n, s in (
                 ('Популярный', 'popular'),
                 ('Ужин', 'dinner')
@@ -62,27 +163,27 @@ class RecipeTestCase(APITestCase):
             'cooking_time': 1
         }
 
-        cls.recipe_1 = Recipe.objects.create(
+        self.recipe_1 = Recipe.objects.create(
             **addit_recipe_data
         )
 
-        cls.recipe_1.tags.add(cls.tags[0])
-        cls.recipe_1.tags.add(cls.tags[1])
+        self.recipe_1.tags.add(self.tags[0])
+        self.recipe_1.tags.add(self.tags[1])
 
         [
             Ingredient.objects.create(
-                ingredient_unit=cls.ingredients[x],
-                recipes=cls.recipe_1,
+                ingredient_unit=self.ingredients[x],
+                recipes=self.recipe_1,
                 amount=1
             ) for x in range(2)
         ]
 
-        cls.recipe_2 = Recipe.objects.create(
+        self.recipe_2 = Recipe.objects.create(
             **addit_recipe_data,
         )
 
         addit_recipe_data['author'] = another_user
-        cls.recipe_3 = Recipe.objects.create(
+        self.recipe_3 = Recipe.objects.create(
             **addit_recipe_data,
         )
 
@@ -117,7 +218,8 @@ class RecipeTestCase(APITestCase):
         fields = (
             'id', 'tags', 'author',
             'ingredients', 'is_in_shopping_cart', 'is_favorited',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'images', 'text', 'cooking_time',
+            'favorites_count'
         )
         self.assertEqual(tuple(item.keys()), fields,
                          'Некорректный вывод элемента списка рецептов')
@@ -233,7 +335,9 @@ class RecipeTestCase(APITestCase):
         self.assertEqual(response.status_code, 201,
                          'Некорректный запрос при добавлении в список покупок')
 
-        in_list_key = self.user.shop_list.recipes.filter(id=1).exists()
+        in_list_key = ShopList.for_user(self.user).recipes.filter(
+            id=1
+        ).exists()
 
         self.assertTrue(in_list_key, 'Рецепт не добавлен')
 
@@ -245,9 +349,66 @@ class RecipeTestCase(APITestCase):
         self.assertEqual(delete_response.status_code, 204,
                          'Некорректный запрос при удалении из списка покупок')
 
-        in_list_key = self.user.shop_list.recipes.filter(id=1).exists()
+        in_list_key = ShopList.for_user(self.user).recipes.filter(
+            id=1
+        ).exists()
         self.assertFalse(in_list_key, 'Рецепт не удален из списка покупок')
 
+    def test_download_shop_list(self):
+        token = self.user.auth_token
+        Ingredient.objects.create(
+            ingredient_unit=self.ingredients[0],
+            recipes=self.recipe_2,
+            amount=5
+        )
+        ShopList.for_user(self.user).recipes.add(
+            self.recipe_1, self.recipe_2
+        )
+
+        response = self.client.get(
+            '/recipes/download_shopping_cart/',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(response.status_code, 200,
+                         'Некорректный статус при выгрузке списка покупок')
+        self.assertTrue(response.streaming, 'Ответ должен быть потоковым')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            rows,
+            [
+                'name,amount,measurement_unit',
+                'Картошка,1,кг',
+                'Крупа,6,г',
+            ],
+            'Ингредиенты в списке покупок не просуммированы'
+        )
+
+        response = self.client.get(
+            '/recipes/download_shopping_cart/?type=txt',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows, ['Картошка (кг) - 1', 'Крупа (г) - 6'])
+
+        response = self.client.get(
+            '/recipes/download_shopping_cart/?type=pdf',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        content = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+        # Текст со встроенным шрифтом, а не картинки страниц
+        self.assertNotIn(b'/Subtype /Image', content)
+        self.assertIn(b'/FontFile2', content)
+
+        response = self.client.get(
+            '/recipes/download_shopping_cart/?type=doc',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(response.status_code, 400,
+                         'Некорректный статус для неизвестного формата')
+
     def test_in_favorites(self):
         false_response = self.client.post(
             '/recipes/1/favorite/'
@@ -269,7 +430,9 @@ class RecipeTestCase(APITestCase):
         self.assertEqual(response.status_code, 201,
                          'Некорректный запрос при добавлении в избранное')
 
-        in_list_key = self.user.favorite.recipes.filter(id=1).exists()
+        in_list_key = Favorite.for_user(self.user).recipes.filter(
+            id=1
+        ).exists()
 
         self.assertTrue(in_list_key, 'Рецепт не добавлен')
 
@@ -281,7 +444,9 @@ class RecipeTestCase(APITestCase):
         self.assertEqual(delete_response.status_code, 204,
                          'Некорректный запрос при удалении из избранных')
 
-        in_list_key = self.user.shop_list.recipes.filter(id=1).exists()
+        in_list_key = ShopList.for_user(self.user).recipes.filter(
+            id=1
+        ).exists()
         self.assertFalse(in_list_key, 'Рецепт не удален из избранных')
 
     def test_delete_recipe(self):
@@ -400,9 +565,9 @@ class RecipeTestCase(APITestCase):
     def test_get_recipe_unit(self):
         self._login_request()
         token = self.user.auth_token
-        self.user.shop_list.recipes.add(self.recipe_3)
-        self.user.favorite.recipes.add(self.recipe_3)
-        self.user.subscribe_model.subscriber.add(self.another_user)
+        ShopList.for_user(self.user).recipes.add(self.recipe_3)
+        Favorite.for_user(self.user).recipes.add(self.recipe_3)
+        SubscribeUser.for_user(self.user).subscriber.add(self.another_user)
 
         request = self.client.get(
             '/recipes/3/',
@@ -431,6 +596,70 @@ class RecipeTestCase(APITestCase):
             'Некорректное значение в поле is_favorited'
         )
 
+    def test_get_recipe_unit_not_modified(self):
+        token = self.user.auth_token
+        url = f'/recipes/{self.recipe_3.id}/'
+        etag = self.client.get(
+            url, HTTP_AUTHORIZATION=f'Token {token}'
+        )['ETag']
+
+        with mock.patch.object(
+                RecipeSerializer, 'to_representation'
+        ) as to_representation:
+            response = self.client.get(
+                url,
+                HTTP_AUTHORIZATION=f'Token {token}',
+                HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304,
+                         'Некорректный статус при запросе рецепта')
+        to_representation.assert_not_called()
+
+        guest_response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(guest_response.status_code, 200,
+                         'ETag не должен совпадать у разных пользователей')
+
+        Favorite.for_user(self.user).recipes.add(self.recipe_3)
+        response = self.client.get(
+            url,
+            HTTP_AUTHORIZATION=f'Token {token}',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200,
+                         'ETag не изменился после добавления в избранное')
+        self.assertTrue(response.data['is_favorited'])
+
+        etag = response['ETag']
+        self.recipe_3.tags.add(self.tags[0])
+        response = self.client.get(
+            url,
+            HTTP_AUTHORIZATION=f'Token {token}',
+            HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200,
+                         'ETag не изменился после изменения тэгов')
+
+    def test_get_recipe_if_modified_since(self):
+        token = self.user.auth_token
+        url = f'/recipes/{self.recipe_3.id}/'
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {token}')
+        self.assertNotIn('Last-Modified', response,
+                         'Дата изменения не учитывает избранное')
+
+        response = self.client.post(
+            f'{url}favorite/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(
+            url,
+            HTTP_AUTHORIZATION=f'Token {token}',
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)
+        )
+        self.assertEqual(response.status_code, 200,
+                         'Рецепт не изменился после добавления в избранное')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertEqual(response.data['favorites_count'], 1)
+
     def test_get_recipe_list(self):
         guest_response = self.client.get(
             '/recipes/'
@@ -467,7 +696,7 @@ class RecipeTestCase(APITestCase):
 
         self._login_request()
 
-        self.user.shop_list.recipes.add(self.recipe_1)
+        ShopList.for_user(self.user).recipes.add(self.recipe_1)
         token = self.user.auth_token.key
         in_shop_cart_filter = self.client.get(
             '/recipes/?is_in_shopping_cart=1',
@@ -479,7 +708,7 @@ class RecipeTestCase(APITestCase):
             'Некорректное значение вывода списка рецептов с фильтром по списку покупок'
         )
 
-        self.user.favorite.recipes.add(self.recipe_1)
+        Favorite.for_user(self.user).recipes.add(self.recipe_1)
         in_favorite_filter = self.client.get(
             '/recipes/?is_favorited=1',
             HTTP_AUTHORIZATION=f'Token {token}'
@@ -502,3 +731,1594 @@ class RecipeTestCase(APITestCase):
             1,
             'Некорректное кол-во объектов при выводе списка рецептов'
         )
+
+
+@override_settings(RESPONSE_CACHE=None)
+class RecipeFeedQueriesTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='feed_reader',
+            email='feed_reader@mail.ru',
+            password='12345678'
+        )
+
+        authors = [
+            User.objects.create_user(
+                username=f'feed_author_{i}',
+                email=f'feed_author_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(5)
+        ]
+        SubscribeUser.for_user(self.user).subscriber.add(authors[0])
+
+        tags = [
+            Tag.objects.create(name=n, slug=s) for n, s in (
+                ('Завтрак', 'breakfast'),
+                ('Обед', 'lunch'),
+                ('Ужин', 'dinner')
+            )
+        ]
+
+        units = [
+            IngredientUnit.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            ) for i in range(4)
+        ]
+
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=authors[i % len(authors)],
+                image='recipe.png',
+                name=f'Рецепт {i}',
+                text='string',
+                cooking_time=1
+            ) for i in range(100)
+        )
+
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags[:2]
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(recipes=recipe, ingredient_unit=unit, amount=1)
+            for recipe in recipes for unit in units
+        )
+
+    def _get_feed(self, page_size, **kwargs):
+        pagination_class = RecipeViewSet.pagination_class
+        with mock.patch.object(pagination_class, 'page_size', page_size):
+            response = self.client.get('/recipes/', **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return response
+
+    def _assert_feed_queries(self, num, **kwargs):
+        for page_size in (12, 100):
+            with self.assertNumQueries(num):
+                self._get_feed(page_size, **kwargs)
+
+    def test_cursor_pagination(self):
+        token = self.user.auth_token.key
+        Favorite.for_user(self.user).recipes.add(
+            *Recipe.objects.all()[:30]
+        )
+        Recipe.tags.through.objects.filter(
+            tag__slug='lunch', recipe_id__lt=50
+        ).delete()
+
+        expected = list(
+            Recipe.objects.filter(
+                tags__slug__in=['breakfast', 'lunch'],
+                id__in=Favorite.for_user(self.user).recipes.values('id')
+            ).distinct().values_list('id', flat=True)
+        )
+        url = '/recipes/?cursor=&tags=breakfast&tags=lunch&is_favorited=1'
+        ids = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(
+                    url, HTTP_AUTHORIZATION=f'Token {token}'
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('count', response.data)
+                ids += [x['id'] for x in response.data['results']]
+                url = response.data['next']
+
+        self.assertEqual(ids, expected,
+                         'Некорректная выдача при пагинации по курсору')
+        for query in queries:
+            self.assertNotIn('DISTINCT', query['sql'])
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_guest_feed_queries(self):
+        self._assert_feed_queries(4)
+
+    def test_authorized_feed_queries(self):
+        token = self.user.auth_token.key
+        response = self._get_feed(
+            100, HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self._assert_feed_queries(4, HTTP_AUTHORIZATION=f'Token {token}')
+
+        subscribed = {
+            x['author']['id'] for x in response.data['results']
+            if x['author']['is_subscribed']
+        }
+        self.assertEqual(
+            subscribed,
+            set(SubscribeUser.for_user(self.user).subscriber.values_list(
+                'id', flat=True
+            )),
+            'Некорректное значение в поле is_subscribed автора'
+        )
+
+
+class IngredientSearchTestCase(APITestCase):
+    def setUp(self) -> None:
+        ingredient_index.invalidate()
+
+        for name in ('Молоко', 'Сгущенное молоко', 'молотый перец', 'Мука'):
+            IngredientUnit.objects.create(name=name, measurement_unit='г')
+
+    def _search(self, name):
+        response = self.client.get('/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200,
+                         'Некорректный HTTP STATUS')
+        return [x['name'] for x in response.data]
+
+    def test_prefix_then_substring(self):
+        self.assertEqual(
+            self._search('мол'),
+            ['Молоко', 'молотый перец', 'Сгущенное молоко'],
+            'Некорректный порядок результатов поиска ингредиентов'
+        )
+        self.assertEqual(self._search('ПЕРЕЦ'), ['молотый перец'])
+        self.assertEqual(self._search('хлеб'), [])
+
+    def test_search_limit(self):
+        with self.settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(self._search(''), ['Молоко', 'молотый перец'])
+            self.assertEqual(len(self._search('о')), 2)
+
+    def test_index_refresh_on_save(self):
+        self.assertEqual(self._search('мас'), [])
+        # Кэш ответов сбрасывается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            unit = IngredientUnit.objects.create(
+                name='Масло', measurement_unit='г'
+            )
+        self.assertEqual(self._search('мас'), ['Масло'])
+        with self.captureOnCommitCallbacks(execute=True):
+            unit.delete()
+        self.assertEqual(self._search('мас'), [])
+
+    def test_changes_from_other_process(self):
+        self.assertEqual(ingredient_index.search('мас', 10), [])
+        # Другой процесс: строка без сигналов и новая версия коллекции
+        IngredientUnit.objects.bulk_create(
+            [IngredientUnit(name='Масло', measurement_unit='г')]
+        )
+        self.assertEqual(ingredient_index.search('мас', 10), [])
+        increment_version('ingredients')
+        self.assertEqual(
+            [x['name'] for x in ingredient_index.search('мас', 10)],
+            ['Масло']
+        )
+
+
+class LoadIngredientsTestCase(APITestCase):
+    def _load(self, suffix, content, *args):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8'
+        ) as file:
+            file.write(content)
+            file.flush()
+            out = StringIO()
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(
+                    'load_ingredients', file.name, *args, stdout=out
+                )
+        return out.getvalue()
+
+    def test_load(self):
+        IngredientUnit.objects.create(name='Соль', measurement_unit='г')
+        self.assertEqual(
+            self.client.get('/ingredients/?name=мук').json(), []
+        )
+
+        rows = [
+            dict(name='Мука', measurement_unit='г'),
+            dict(name=' Мука ', measurement_unit='г'),
+            dict(name='Мука', measurement_unit='кг'),
+            dict(name='Соль', measurement_unit='г'),
+            dict(name='', measurement_unit='г'),
+        ]
+        out = self._load('.json', json.dumps(rows), '--batch-size=2')
+        self.assertIn('Строк: 5, добавлено ингредиентов: 2', out)
+
+        out = self._load('.csv', 'Сахар,г\nМука,г\n')
+        self.assertIn('Строк: 2, добавлено ингредиентов: 1', out)
+        out = self._load('.csv', 'name,measurement_unit\nПерец,г\n')
+        self.assertIn('Строк: 1, добавлено ингредиентов: 1', out)
+
+        self.assertEqual(IngredientUnit.objects.count(), 5)
+        self.assertEqual(
+            len(self.client.get('/ingredients/?name=мук').json()), 2,
+            'Индекс поиска не обновился после загрузки'
+        )
+
+
+class GenerateDatasetTestCase(APITestCase):
+    def _generate(self, **options):
+        out = StringIO()
+        call_command(
+            'generate_dataset', users=20, recipes=50, tags=3,
+            ingredients=30, batch_size=16, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def _snapshot(self):
+        return (
+            list(Recipe.objects.order_by('id').values_list(
+                'author__email', 'name', 'favorites_count', 'in_carts_count'
+            )),
+            list(Ingredient.objects.order_by('id').values_list(
+                'recipes__name', 'ingredient_unit__name', 'amount'
+            )),
+        )
+
+    def test_generate(self):
+        out = self._generate()
+        self.assertIn('Пользователей: 20, тэгов: 3', out)
+        self.assertEqual(Recipe.objects.count(), 50)
+        self.assertTrue(Favorite.recipes.through.objects.exists())
+        self.assertTrue(SubscribeUser.subscriber.through.objects.exists())
+
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertNotRegex(
+            out.getvalue(), r'исправлено [1-9]',
+            'Счетчики не совпадают с данными'
+        )
+
+        response = self.client.get('/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 50)
+
+    def test_indexes_reset(self):
+        # Индексы другого процесса, построенные до генерации
+        for index in (ingredient_index, tag_index, similar_index):
+            index.build()
+            self.addCleanup(index.invalidate)
+        # Версии коллекций увеличиваются после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self._generate()
+
+        unit = IngredientUnit.objects.first()
+        self.assertIn(
+            unit.id, [x['id'] for x in ingredient_index.search(unit.name, 50)]
+        )
+        tagged = Recipe.objects.filter(
+            tags__isnull=False
+        ).distinct().values_list('id', flat=True)
+        ids = tag_index.recipe_ids(Tag.objects.values_list('slug', flat=True))
+        self.assertCountEqual(ids.tolist(), tagged)
+        recipe = Ingredient.objects.first().recipes
+        similar_index.search(recipe.id, 6)
+        self.assertIsNotNone(similar_index._signature(recipe.id))
+
+    def test_seed(self):
+        self._generate(seed=1)
+        first = self._snapshot()
+        self.assertTrue(first[0] and first[1])
+
+        for model in (Recipe, IngredientUnit, Tag, User):
+            model.objects.all().delete()
+        self._generate(seed=1)
+        self.assertEqual(self._snapshot(), first)
+
+
+class RecipeWriteQueriesTestCase(RecipeWriteMixin, APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='writer',
+            email='writer@mail.ru',
+            password='12345678'
+        )
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.units = IngredientUnit.objects.bulk_create(
+            IngredientUnit(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(60)
+        )
+
+    def _request(self, method, url, ingredients):
+        token = self.user.auth_token.key
+        return getattr(self.client, method)(
+            url,
+            content_type='application/json',
+            data=json.dumps(dict(
+                image=self.image,
+                name='string',
+                text='string',
+                cooking_time=1,
+                tags=[self.tag.id],
+                ingredients=ingredients
+            )),
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+
+    def _ingredients(self, count, amount=1):
+        return [
+            dict(id=x.id, amount=amount) for x in self.units[:count]
+        ]
+
+    def test_create_queries(self):
+        self._request('post', '/recipes/', self._ingredients(1))
+        for count in (5, 50):
+            # Подписчиков у автора нет: запись в ленты - один SELECT,
+            # в лог изменений - INSERT после тэгов и после ингредиентов
+            with self.assertNumQueries(16):
+                response = self._request(
+                    'post', '/recipes/', self._ingredients(count)
+                )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_update_queries(self):
+        recipe_id = self._request(
+            'post', '/recipes/', self._ingredients(50)
+        ).data['id']
+        url = f'/recipes/{recipe_id}/'
+
+        # В том числе запись в лог изменений
+        with self.assertNumQueries(16):
+            response = self._request(
+                'patch', url,
+                self._ingredients(25, amount=3) + [
+                    dict(id=x.id, amount=1) for x in self.units[50:]
+                ]
+            )
+        self.assertEqual(response.status_code, 200)
+
+        amounts = dict(
+            Ingredient.objects.filter(
+                recipes_id=recipe_id
+            ).values_list('ingredient_unit_id', 'amount')
+        )
+        self.assertEqual(len(amounts), 35, 'Ингредиенты не обновились')
+        self.assertEqual(
+            {amounts[x.id] for x in self.units[:25]}, {3},
+            'Кол-во ингредиента в рецепте не обновилось'
+        )
+
+    def test_duplicate_ingredients(self):
+        response = self._request(
+            'post', '/recipes/',
+            [dict(id=self.units[0].id, amount=2)] * 2
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(Ingredient.objects.filter(
+                recipes_id=response.data['id']
+            ).values_list('amount', flat=True)),
+            [4]
+        )
+
+    def test_unknown_ingredient(self):
+        response = self._request(
+            'post', '/recipes/', [dict(id=10 ** 6, amount=1)]
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeListToggleTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='toggle_user',
+            email='toggle_user@mail.ru',
+            password='12345678'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.user, image='recipe.png', name='string',
+            text='string', cooking_time=1
+        )
+
+    def test_add_is_idempotent(self):
+        for recipe_list in (ShopList, Favorite):
+            self.assertFalse(
+                recipe_list.objects.filter(author=self.user).exists(),
+                'Список должен создаваться при первом обращении'
+            )
+            self.assertTrue(
+                recipe_list.add_recipe(self.user, self.recipe.id)
+            )
+            self.assertFalse(
+                recipe_list.add_recipe(self.user, self.recipe.id),
+                'Рецепт добавлен повторно'
+            )
+            self.assertEqual(
+                recipe_list.recipes.through.objects.count(), 1
+            )
+
+            with self.assertNumQueries(2):
+                removed = recipe_list.remove_recipe(
+                    self.user, self.recipe.id
+                )
+            self.assertTrue(removed)
+            self.assertFalse(
+                recipe_list.remove_recipe(self.user, self.recipe.id)
+            )
+            with self.assertNumQueries(2):
+                added = recipe_list.add_recipe(self.user, self.recipe.id)
+            self.assertTrue(added)
+
+    def test_list_created_concurrently(self):
+        insert = Favorite._insert_recipe
+
+        def insert_then_create(user, recipe_id):
+            # Список создает другой запрос после первой вставки
+            added = insert(user, recipe_id)
+            Favorite.objects.get_or_create(author=user)
+            return added
+
+        with mock.patch.object(
+                Favorite, '_insert_recipe', side_effect=insert_then_create
+        ):
+            self.assertTrue(Favorite.add_recipe(self.user, self.recipe.id))
+        self.assertEqual(Favorite.recipes.through.objects.count(), 1)
+
+    def test_repeated_requests(self):
+        token = self.user.auth_token.key
+        url = f'/recipes/{self.recipe.id}/favorite/'
+        statuses = [
+            self.client.post(
+                url, HTTP_AUTHORIZATION=f'Token {token}'
+            ).status_code for _ in range(2)
+        ]
+        self.assertEqual(statuses, [201, 400])
+
+        statuses = [
+            self.client.delete(
+                url, HTTP_AUTHORIZATION=f'Token {token}'
+            ).status_code for _ in range(2)
+        ]
+        self.assertEqual(statuses, [204, 400])
+
+        response = self.client.post(
+            '/recipes/100500/shopping_cart/',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeListConcurrencyTestCase(TransactionTestCase):
+    """
+        Переключения из нескольких потоков на файловой базе с настройками
+        DB_PROFILE=production: у каждого потока свое подключение.
+        Поток переключает свой рецепт, потоки одного пользователя
+        одновременно создают его список
+    """
+    TOGGLES = 10
+
+    def setUp(self) -> None:
+        self.users = [
+            User.objects.create_user(
+                username=f'concurrent_{i}',
+                email=f'concurrent_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(3)
+        ]
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.users[0], name=f'Рецепт {i}', text='string',
+                cooking_time=1
+            ) for i in range(2)
+        ]
+
+        # Копия тестовой базы в памяти в файл
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'db.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(path)
+        connection.connection.backup(target)
+        target.close()
+
+        self.connections = ConnectionHandler(dict(default=dict(
+            ENGINE='backend.sqlite3', NAME=path, OPTIONS=dict(
+                timeout=0.05,
+                pragmas=dict(journal_mode='WAL', synchronous='NORMAL'),
+                transaction_mode='IMMEDIATE',
+                busy_retries=20,
+            )
+        )))
+
+    def _run(self, target, *args):
+        """
+            target в потоке с подключением к файловой базе
+        """
+        previous = connections['default']
+        connections['default'] = self.connections['default']
+        try:
+            target(*args)
+        finally:
+            self.connections['default'].close()
+            connections['default'] = previous
+
+    def _toggle(self, recipe_list, user, recipe, results):
+        try:
+            for _ in range(self.TOGGLES):
+                results.append(recipe_list.add_recipe(user, recipe.id))
+                results.append(recipe_list.remove_recipe(user, recipe.id))
+            results.append(recipe_list.add_recipe(user, recipe.id))
+        except Exception as error:
+            results.append(error)
+
+    def _check(self, recipe_list, counter):
+        through = recipe_list.recipes.through
+        for recipe in self.recipes:
+            owner = recipe_list.recipes.field.m2m_field_name()
+            rows = list(through.objects.filter(
+                recipe_id=recipe.id
+            ).values_list(f'{owner}__author_id', flat=True))
+            self.assertCountEqual(rows, [x.id for x in self.users])
+            recipe = Recipe.objects.get(pk=recipe.id)
+            self.assertEqual(getattr(recipe, counter), len(self.users))
+
+    def test_toggles(self):
+        for recipe_list, counter in (
+            (Favorite, 'favorites_count'), (ShopList, 'in_carts_count')
+        ):
+            results = []
+            threads = [
+                threading.Thread(target=self._run, args=(
+                    self._toggle, recipe_list, user, recipe, results
+                ))
+                for user in self.users for recipe in self.recipes
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(
+                results, [True] * len(threads) * (2 * self.TOGGLES + 1)
+            )
+            self._run(self._check, recipe_list, counter)
+
+
+class CountersTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.users = [
+            User.objects.create_user(
+                username=f'counter_{i}',
+                email=f'counter_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(3)
+        ]
+        self.author = self.users[0]
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, image='recipe.png', name=f'Рецепт {i}',
+                text='string', cooking_time=1
+            ) for i in range(2)
+        ]
+
+    def _counters(self):
+        self.author.refresh_from_db()
+        return (
+            self.author.recipes_count,
+            self.author.subscribers_count,
+            [
+                (x.favorites_count, x.in_carts_count)
+                for x in Recipe.objects.order_by('id')
+            ]
+        )
+
+    def test_counters(self):
+        first, second = self.recipes
+        reader, another = self.users[1:]
+        self.assertEqual(self._counters(), (2, 0, [(0, 0), (0, 0)]))
+
+        Favorite.add_recipe(reader, first.id)
+        Favorite.for_user(another).recipes.add(first, second)
+        second.shoplist_set.add(
+            ShopList.for_user(reader), ShopList.for_user(another)
+        )
+        for user in (reader, another):
+            SubscribeUser.for_user(user).subscriber.add(self.author)
+        self.assertEqual(self._counters(), (2, 2, [(2, 0), (1, 2)]))
+
+        Favorite.for_user(another).recipes.remove(first, first)
+        second.shoplist_set.clear()
+        self.author.user_subscriptions.remove(
+            SubscribeUser.for_user(reader)
+        )
+        self.assertEqual(self._counters(), (2, 1, [(1, 0), (1, 0)]))
+
+        second.delete()
+        another.delete()
+        self.assertEqual(self._counters(), (1, 0, [(1, 0)]))
+
+    def test_reconcile(self):
+        Recipe.objects.filter(id=self.recipes[0].id).update(
+            favorites_count=10
+        )
+        Favorite.recipes.through.objects.create(
+            favorite=Favorite.for_user(self.users[1]), recipe=self.recipes[1]
+        )
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn(
+            'recipes.Recipe.favorites_count: исправлено 2', out.getvalue()
+        )
+        self.assertEqual(self._counters(), (2, 0, [(0, 0), (1, 0)]))
+
+
+@override_settings(RESPONSE_CACHE=None)
+class QueryPlanTestCase(APITestCase):
+    """
+        EXPLAIN QUERY PLAN для запросов горячих эндпоинтов:
+        полный проход допускается только по таблице, которую
+        эндпоинт листает целиком
+    """
+
+    def setUp(self) -> None:
+        self.user, self.author = [
+            User.objects.create_user(
+                username=f'plan_{i}',
+                email=f'plan_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(2)
+        ]
+        tag = Tag.objects.create(name='Обед', slug='lunch')
+        unit = IngredientUnit.objects.create(
+            name='Мука', measurement_unit='г'
+        )
+        for i in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, image='recipe.png', name=f'Рецепт {i}',
+                text='string', cooking_time=1
+            )
+            recipe.tags.add(tag)
+            Ingredient.objects.create(
+                recipes=recipe, ingredient_unit=unit, amount=1
+            )
+            Favorite.add_recipe(self.user, recipe.id)
+            ShopList.add_recipe(self.user, recipe.id)
+        SubscribeUser.for_user(self.user).subscriber.add(self.author)
+        # Индекс тэгов строится при запуске (warm_up), не в запросе
+        tag_index.build()
+
+    def _plans(self, url):
+        token = self.user.auth_token.key
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                url, HTTP_AUTHORIZATION=f'Token {token}'
+            )
+        self.assertEqual(response.status_code, 200, url)
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                yield query['sql'], [row[3] for row in cursor.fetchall()]
+
+    def _scanned(self, plan):
+        return {
+            x.split()[1] for x in plan if x.startswith('SCAN ')
+        }
+
+    def test_no_full_scans(self):
+        author = self.author.id
+        recipe = Recipe.objects.first().id
+        for url, allowed in (
+                (f'/recipes/?author={author}', set()),
+                (f'/recipes/?author={author}&cursor=', set()),
+                ('/recipes/?tags=lunch', set()),
+                ('/recipes/?is_favorited=1', {'recipes_recipe'}),
+                ('/recipes/?is_in_shopping_cart=1', {'recipes_recipe'}),
+                ('/recipes/?search=Рецепт', {'recipes_recipe_fts'}),
+                (f'/recipes/{recipe}/', set()),
+                ('/recipes/download_shopping_cart/', set()),
+                ('/users/subscriptions/?recipes_limit=2', set()),
+                ('/recipes/feed/', set()),
+                ('/recipes/feed/?cursor=', set()),
+        ):
+            for sql, plan in self._plans(url):
+                self.assertLessEqual(
+                    self._scanned(plan), allowed,
+                    f'Полный проход таблицы: {url}\n{sql}\n{plan}'
+                )
+
+    def test_ingredient_prefix(self):
+        queryset = IngredientUnit.objects.filter(name__istartswith='му')
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[3] for row in cursor.fetchall()]
+        self.assertFalse(self._scanned(plan), plan)
+        self.assertTrue(
+            any('ingredient_unit_name_ci_idx' in x for x in plan), plan
+        )
+
+
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='cache_user',
+            email='cache_user@mail.ru',
+            password='12345678'
+        )
+        self.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        self.recipe = Recipe.objects.create(
+            author=self.user, image='recipe.png', name='string',
+            text='string', cooking_time=1
+        )
+        self.recipe.tags.add(self.tag)
+
+    def _get(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200,
+                         'Некорректный HTTP STATUS')
+        return response
+
+    def test_anonymous_hit(self):
+        first = self._get('/recipes/?tags=dinner&page=1')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self._get('/recipes/?page=1&tags=dinner&tags=dinner')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+
+        self.assertNotIn('X-Cache', self._get('/recipes/?limit=6'))
+
+        token = self.user.auth_token.key
+        response = self._get(
+            '/recipes/?tags=dinner', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertNotIn('X-Cache', response)
+
+    def test_invalidation(self):
+        self.assertEqual(len(self._get('/tags/').json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch')
+        response = self._get('/tags/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 2)
+
+        self._get(f'/recipes/{self.recipe.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.clear()
+        response = self._get(f'/recipes/{self.recipe.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['tags'], [])
+
+        self._get('/ingredients/?name=мол')
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientUnit.objects.create(
+                name='Молоко', measurement_unit='мл'
+            )
+        response = self._get('/ingredients/?name=мол')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 1)
+
+    def test_invalidation_after_commit(self):
+        self._get('/tags/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='Обед', slug='lunch')
+            # До коммита ответ может сохраниться только под
+            # прежним поколением
+            self.assertEqual(self._get('/tags/')['X-Cache'], 'HIT')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._get('/tags/')['X-Cache'], 'MISS')
+
+    def test_favorite_count(self):
+        self._get(f'/recipes/{self.recipe.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.add_recipe(self.user, self.recipe.id)
+        response = self._get(f'/recipes/{self.recipe.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['favorites_count'], 1)
+
+    def test_unrendered_changes_keep_cache(self):
+        url = f'/recipes/{self.recipe.id}/'
+        self._get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShopList.add_recipe(self.user, self.recipe.id)
+            self.user.set_password('87654321')
+            self.user.save()
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+            User.objects.create_user(
+                username='new_user', email='new_user@mail.ru',
+                password='12345678'
+            )
+        self.assertEqual(self._get(url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Иван'
+            self.user.save()
+        response = self._get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['author']['first_name'], 'Иван')
+
+    @override_settings(RESPONSE_CACHE='shared-responses')
+    def test_shared_backend(self):
+        with tempfile.TemporaryDirectory() as location, \
+                mock.patch.object(
+                    caches['shared-responses'], '_dir', location
+                ):
+            self.assertEqual(self._get('/tags/')['X-Cache'], 'MISS')
+            self.assertEqual(self._get('/tags/')['X-Cache'], 'HIT')
+            with self.captureOnCommitCallbacks(execute=True):
+                Tag.objects.create(name='Обед', slug='lunch')
+            self.assertEqual(self._get('/tags/')['X-Cache'], 'MISS')
+
+
+class RecipeImageVariantsTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.media_root = tempfile.mkdtemp()
+
+        self.user = User.objects.create_user(
+            username='photographer',
+            email='photographer@mail.ru',
+            password='12345678'
+        )
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.unit = IngredientUnit.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), (200, 30, 30)).save(buffer, 'PNG')
+        self.image = (
+            'data:image/png;base64,'
+            f'{base64.b64encode(buffer.getvalue()).decode()}'
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def _create_recipe(self):
+        token = self.user.auth_token.key
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/recipes/',
+                content_type='application/json',
+                data=json.dumps(dict(
+                    image=self.image,
+                    name='string',
+                    text='string',
+                    cooking_time=1,
+                    tags=[self.tag.id],
+                    ingredients=[dict(id=self.unit.id, amount=1)]
+                )),
+                HTTP_AUTHORIZATION=f'Token {token}'
+            )
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(id=response.data['id'])
+
+    def test_variants(self):
+        with self.settings(MEDIA_ROOT=self.media_root,
+                           RECIPE_IMAGE_WORKERS=0):
+            recipe = self._create_recipe()
+            self.assertTrue(recipe.image_hash, 'Картинка не обработана')
+
+            sizes = dict()
+            for variant in settings.RECIPE_IMAGE_VARIANTS:
+                name = variant_name(recipe.image_hash, variant)
+                with default_storage.open(name) as f:
+                    sizes[variant] = Image.open(f).size
+            self.assertEqual(sizes['thumbnail'], (320, 320))
+            self.assertEqual(sizes['thumbnail_webp'], (320, 320))
+            self.assertEqual(sizes['webp'], (1280, 640))
+
+            second = self._create_recipe()
+            self.assertEqual(second.image_hash, recipe.image_hash,
+                             'Одинаковые картинки должны дедуплицироваться')
+
+            response = self.client.get(f'/recipes/{recipe.id}/')
+            self.assertTrue(
+                response.data['images']['thumbnail'].endswith(
+                    variant_name(recipe.image_hash, 'thumbnail')
+                ),
+                'Некорректная ссылка на миниатюру'
+            )
+
+    def test_decoded_in_pool(self):
+        threads = []
+        decode = base64.b64decode
+
+        def record(*args, **kwargs):
+            threads.append(threading.get_ident())
+            return decode(*args, **kwargs)
+
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                mock.patch('recipes.images.schedule'), \
+                mock.patch('base64.b64decode', side_effect=record):
+            self._create_recipe()
+        self.assertTrue(threads)
+        self.assertNotIn(
+            threading.get_ident(), threads,
+            'Картинка декодируется в потоке запроса'
+        )
+
+    def test_processed_image_changes_validators(self):
+        with self.settings(MEDIA_ROOT=self.media_root), \
+                mock.patch('recipes.images.schedule'):
+            recipe = self._create_recipe()
+            response = self.client.get(f'/recipes/{recipe.id}/')
+            etag = response['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                process_image(recipe.id)
+            response = self.client.get(f'/recipes/{recipe.id}/')
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertNotEqual(response.get('X-Cache'), 'HIT')
+        self.assertTrue(
+            response.data['images']['thumbnail'].endswith(
+                variant_name(Recipe.objects.get(
+                    pk=recipe.id
+                ).image_hash, 'thumbnail')
+            )
+        )
+
+
+@override_settings(ROOT_URLCONF='backend.asgi_urls')
+class AsyncReadTestCase(APITestCase):
+    def setUp(self) -> None:
+        call_command(
+            'generate_dataset', users=5, recipes=30, tags=3, ingredients=20,
+            stdout=StringIO()
+        )
+        self.user = User.objects.order_by('id').first()
+        self.token = Token.objects.get_or_create(user=self.user)[0].key
+        self.recipe = Recipe.objects.order_by('id').first()
+
+    def _get(self, url, token=None, method='get', **headers):
+        if token:
+            headers['authorization'] = f'Token {token}'
+
+        async def request():
+            return await getattr(self.async_client, method)(url, **headers)
+
+        return async_to_sync(request)()
+
+    def _get_sync(self, url, token=None):
+        headers = dict()
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+        with override_settings(ROOT_URLCONF='backend.urls'):
+            return self.client.get(url, **headers)
+
+    @override_settings(RESPONSE_CACHE=None)
+    def test_same_as_drf(self):
+        for url in (
+                '/recipes/', '/recipes/?page=2&tags=tag-1',
+                f'/recipes/?author={self.user.pk}', '/recipes/?page=last',
+                f'/recipes/{self.recipe.pk}/', '/tags/',
+                '/ingredients/?name=суп', '/recipes/?page=100',
+                '/recipes/?search=суп&tags=tag-1',
+                f'/recipes/?tags=tag-0&tags=tag-2&author={self.user.pk}',
+                '/recipes/?tags=tag-1&page=100',
+        ):
+            for token in (None, self.token):
+                with self.subTest(url=url, token=token):
+                    response = self._get(url, token)
+                    expected = self._get_sync(url, token)
+                    self.assertEqual(
+                        response.status_code, expected.status_code
+                    )
+                    self.assertEqual(response.content, expected.content)
+                    self.assertEqual(
+                        response.get('ETag'), expected.get('ETag')
+                    )
+
+    @override_settings(RESPONSE_CACHE=None)
+    def test_queries(self):
+        url = f'/recipes/{self.recipe.pk}/'
+        self._get(url, self.token)
+        # Карточка, версии коллекций, тэги, ингредиенты;
+        # ETag считается по той же строке карточки
+        with self.assertNumQueries(4):
+            response = self._get(url, self.token)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        with self.assertNumQueries(2):
+            response = self._get(url, self.token, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.assertNumQueries(4):
+            self._get('/recipes/', self.token)
+
+    def test_response_cache(self):
+        response = self._get('/tags/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self._get_sync('/tags/')['X-Cache'], 'HIT')
+        self.assertEqual(self._get('/recipes/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self._get('/recipes/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+    @override_settings(RESPONSE_CACHE='shared-responses')
+    def test_shared_cache_off_loop(self):
+        cache = caches['shared-responses']
+        on_loop = []
+
+        def spy(method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(method.__name__)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+            return wrapper
+
+        with tempfile.TemporaryDirectory() as location, \
+                mock.patch.object(cache, '_dir', location), \
+                mock.patch.object(cache, 'get', spy(cache.get)), \
+                mock.patch.object(cache, 'set', spy(cache.set)), \
+                mock.patch.object(cache, 'add', spy(cache.add)):
+            self.assertEqual(self._get('/tags/')['X-Cache'], 'MISS')
+            self.assertEqual(self._get('/recipes/')['X-Cache'], 'MISS')
+            self.assertEqual(self._get('/recipes/')['X-Cache'], 'HIT')
+        # Файловый кэш не читается в потоке цикла событий
+        self.assertEqual(on_loop, [])
+
+    def test_fallback(self):
+        response = self._get('/recipes/', 'invalid')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+        response = self._get(f'/recipes/{self.recipe.pk}/', method='delete')
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(Recipe.objects.filter(pk=self.recipe.pk).exists())
+
+        response = self._get('/recipes/?cursor=', self.token)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.data['previous'])
+
+
+@override_settings(RESPONSE_CACHE=None)
+class RecipeSearchTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.user, self.other = [
+            User.objects.create_user(
+                username=f'search_{i}',
+                email=f'search_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(2)
+        ]
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.recipes = dict()
+        for author, name, text in (
+                (self.user, 'Острый суп', 'Суп с перцем'),
+                (self.user, 'Салат', 'Подается перед острым супом'),
+                (self.other, 'Суп с фрикадельками', 'Фрикадельки'),
+                (self.other, 'Пирог', 'Ёжики из теста'),
+        ):
+            self.recipes[name] = Recipe.objects.create(
+                author=author, image='recipe.png', name=name, text=text,
+                cooking_time=1
+            )
+        self.recipes['Острый суп'].tags.add(self.tag)
+        self.recipes['Суп с фрикадельками'].tags.add(self.tag)
+
+    def _search(self, query, **params):
+        response = self.client.get(
+            '/recipes/', dict(search=query, **params)
+        )
+        self.assertEqual(response.status_code, 200)
+        return [x['name'] for x in response.data['results']]
+
+    def test_ranking(self):
+        # Совпадение в названии выше совпадения только в описании
+        self.assertEqual(self._search('СУП')[-1], 'Салат')
+        self.assertEqual(
+            self._search('остр суп'), ['Острый суп', 'Салат']
+        )
+        self.assertEqual(self._search('фрикад'), ['Суп с фрикадельками'])
+        self.assertEqual(self._search('ёжики'), ['Пирог'])
+        self.assertEqual(self._search('борщ'), [])
+        self.assertEqual(self._search('"*:'), [])
+        self.assertEqual(self._search('суп OR пирог'), [])
+        self.assertEqual(len(self._search('  ')), len(self.recipes))
+
+    def test_filters(self):
+        self.assertEqual(
+            self._search('суп', tags='lunch', author=self.other.id),
+            ['Суп с фрикадельками']
+        )
+        response = self.client.get('/recipes/', dict(search='суп'))
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.get('/recipes/', dict(search='суп', page=2))
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_with_cursor(self):
+        for cursor in ('', 'cD0xMA=='):
+            response = self.client.get(
+                '/recipes/', dict(search='суп', cursor=cursor)
+            )
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/recipes/', dict(search=' ', cursor=''))
+        self.assertEqual(response.status_code, 200)
+
+    def test_index_follows_changes(self):
+        recipe = self.recipes['Пирог']
+        recipe.name = 'Пирог с капустой'
+        recipe.save()
+        self.assertEqual(self._search('капуст'), ['Пирог с капустой'])
+
+        Recipe.objects.filter(pk=recipe.pk).update(text='Начинка')
+        self.assertEqual(self._search('ёжики'), [])
+        self.assertEqual(self._search('начинка'), ['Пирог с капустой'])
+
+        recipe.delete()
+        self.assertEqual(self._search('пирог'), [])
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) "
+                "VALUES ('delete-all')"
+            )
+        self.assertEqual(self._search('суп'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('4', out.getvalue())
+        self.assertEqual(len(self._search('суп')), 3)
+
+
+class ByIngredientsTestCase(RecipeWriteMixin, APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='cook',
+            email='cook@mail.ru',
+            password='12345678'
+        )
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.units = IngredientUnit.objects.bulk_create(
+            IngredientUnit(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(5)
+        )
+        self.recipes = []
+        for units in ((0, 1), (0, 1, 2), (2, 3), (3,)):
+            recipe = Recipe.objects.create(
+                author=self.user, image='recipe.png', name='string',
+                text='string', cooking_time=1
+            )
+            Ingredient.objects.bulk_create(
+                Ingredient(
+                    recipes=recipe, ingredient_unit=self.units[i], amount=1
+                ) for i in units
+            )
+            self.recipes.append(recipe.id)
+        recipe_ingredient_index.build()
+        self.addCleanup(recipe_ingredient_index.invalidate)
+
+    def _get(self, *units, **params):
+        response = self.client.get('/recipes/by_ingredients/', dict(
+            ingredients=','.join(str(self.units[i].id) for i in units),
+            **params
+        ))
+        self.assertEqual(response.status_code, 200)
+        return [
+            (
+                self.recipes.index(x['id']),
+                x['matched_ingredients'], x['missing_ingredients']
+            ) for x in response.data['results']
+        ]
+
+    def test_coverage(self):
+        self.assertEqual(self._get(0, 1), [(0, 2, 0), (1, 2, 1)])
+        self.assertEqual(
+            self._get(0, 1, 2), [(1, 3, 0), (0, 2, 0), (2, 1, 1)]
+        )
+        self.assertEqual(
+            self._get(0, 1, 2, max_missing=0), [(1, 3, 0), (0, 2, 0)]
+        )
+        self.assertEqual(self._get(4), [])
+
+    def test_queries(self):
+        self._get(0)
+        # count не нужен: лог изменений, страница, тэги, ингредиенты
+        with self.assertNumQueries(4):
+            self._get(0, 1, 2, 3)
+
+    def test_bad_params(self):
+        for params in (
+                dict(), dict(ingredients='a'), dict(ingredients='-1'),
+                dict(ingredients='1', max_missing='-1'),
+                dict(ingredients=','.join(map(str, range(1, 200)))),
+        ):
+            response = self.client.get('/recipes/by_ingredients/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_incremental_updates(self):
+        with mock.patch.object(recipe_ingredient_index, 'build') as build:
+            recipe_id = self._write('post', '/recipes/', (3, 4))
+            self.recipes.append(recipe_id)
+            self.assertEqual(self._get(4), [(4, 1, 1)])
+
+            self._write('patch', f'/recipes/{recipe_id}/', (0, 4))
+            self.assertEqual(self._get(3), [(3, 1, 0), (2, 1, 1)])
+            self.assertEqual(self._get(0, 4)[0], (4, 2, 0))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipe.objects.filter(pk=recipe_id).delete()
+            self.assertEqual(self._get(4), [])
+            build.assert_not_called()
+
+    def test_changes_from_other_process(self):
+        # Строки добавил другой процесс: bulk_create без сигналов
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                recipes_id=self.recipes[3], ingredient_unit=self.units[i],
+                amount=1
+            ) for i in (2, 4)
+        )
+        RecipeChange.objects.create(recipe_id=self.recipes[3])
+        with mock.patch.object(recipe_ingredient_index, 'build') as build:
+            self.assertEqual(self._get(3, 4), [(3, 2, 1), (2, 1, 1)])
+            build.assert_not_called()
+
+    def test_reload_touches_recipe_units(self):
+        postings = dict(recipe_ingredient_index._postings)
+        # Рецепт 1: ингредиенты 0, 1, 2 -> 2, 4
+        self._write('patch', f'/recipes/{self.recipes[1]}/', (2, 4))
+        self.assertEqual(self._get(0), [(0, 1, 1)])
+        changed = {
+            unit_id
+            for unit_id, recipes in recipe_ingredient_index._postings.items()
+            if recipes is not postings.get(unit_id)
+        }
+        self.assertEqual(changed, {self.units[i].id for i in (0, 1, 2, 4)})
+
+    def test_ingredient_unit_delete(self):
+        self.units[3].delete()
+        self.assertEqual(self._get(2), [(2, 1, 0), (1, 1, 2)])
+
+
+@override_settings(RESPONSE_CACHE=None)
+class TagBitmapTestCase(RecipeWriteMixin, APITestCase):
+    def setUp(self) -> None:
+        self.users = [
+            User.objects.create_user(
+                username=f'bitmap_{i}',
+                email=f'bitmap_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(2)
+        ]
+        self.tags = [
+            Tag.objects.create(name=f'Тэг {i}', slug=f'tag-{i}')
+            for i in range(3)
+        ]
+        self.units = [
+            IngredientUnit.objects.create(name='Мука', measurement_unit='г')
+        ]
+        self.recipes = []
+        for author, tags in ((0, (0,)), (0, (1,)), (1, (0, 1)), (1, ())):
+            recipe = Recipe.objects.create(
+                author=self.users[author], image='recipe.png',
+                name='string', text='string', cooking_time=1
+            )
+            recipe.tags.set([self.tags[i] for i in tags])
+            self.recipes.append(recipe.id)
+        tag_index.build()
+
+    def _get(self, *tags, **params):
+        response = self.client.get('/recipes/', dict(
+            tags=[f'tag-{i}' for i in tags], **params
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['count'], len(response.data['results'])
+        )
+        return [self.recipes.index(x['id']) for x in response.data['results']]
+
+    def test_filter(self):
+        self.assertEqual(self._get(0), [2, 0])
+        self.assertEqual(self._get(0, 1), [2, 1, 0])
+        self.assertEqual(self._get(0, 1, author=self.users[1].id), [2])
+        self.assertEqual(self._get(2), [])
+        response = self.client.get('/recipes/', dict(tags='missing'))
+        self.assertEqual(response.data['count'], 0)
+
+    def test_queries(self):
+        self._get(0)
+        # count не нужен: лог изменений, страница, тэги, ингредиенты
+        with self.assertNumQueries(4):
+            self._get(0, 1)
+
+    def test_incremental_updates(self):
+        recipe = Recipe.objects.get(pk=self.recipes[3])
+        with mock.patch.object(tag_index, 'build') as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.tags.add(self.tags[2])
+            self.assertEqual(self._get(2), [3])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tags[0].recipe_set.remove(self.recipes[0])
+            self.assertEqual(self._get(0), [2])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tags[1].recipe_set.clear()
+            self.assertEqual(self._get(1), [])
+
+            self.recipes.append(self._write(
+                'post', '/recipes/', [0], [self.tags[1]], self.users[0]
+            ))
+            self.assertEqual(self._get(1, author=self.users[0].id), [4])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe.delete()
+            self.assertEqual(self._get(2), [])
+            build.assert_not_called()
+
+    def test_reload_copies_arrays(self):
+        self._get(0)
+        bits = {x: y.copy() for x, y in tag_index._bits.items()}
+        live = dict(tag_index._bits)
+        authors = tag_index._authors.copy()
+        live_authors = tag_index._authors
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.get(pk=self.recipes[0]).tags.set([self.tags[2]])
+        self.assertEqual(self._get(2), [0])
+        # Запрос в другом потоке мог читать прежние массивы
+        for tag_id, value in live.items():
+            np.testing.assert_array_equal(value, bits[tag_id])
+        np.testing.assert_array_equal(live_authors, authors)
+        self.assertIs(tag_index._bits[self.tags[1].id], live[self.tags[1].id])
+
+    def test_changes_from_other_process(self):
+        # Другой процесс поставил тэг: в этом процессе сигналов
+        # не было, изменение приходит через лог
+        Recipe.tags.through.objects.create(
+            recipe_id=self.recipes[3], tag_id=self.tags[2].id
+        )
+        RecipeChange.objects.create(recipe_id=self.recipes[3])
+        with mock.patch.object(tag_index, 'build') as build:
+            self.assertEqual(self._get(2), [3])
+            build.assert_not_called()
+        # Массовая загрузка: индекс строится заново
+        Recipe.tags.through.objects.create(
+            recipe_id=self.recipes[0], tag_id=self.tags[2].id
+        )
+        changes.reset()
+        self.assertEqual(self._get(2), [3, 0])
+
+    def test_tag_delete(self):
+        self.tags[1].delete()
+        self.assertEqual(self._get(0, 1), [2, 0])
+
+    def test_database_while_index_busy(self):
+        # Лог читает другой поток: лента строится запросом к базе
+        Recipe.objects.get(pk=self.recipes[3]).tags.add(self.tags[2])
+        with tag_index._sync_lock:
+            self.assertEqual(self._get(2), [3])
+            self.assertEqual(
+                async_to_sync(tag_index.arecipe_ids)(['tag-2']), None
+            )
+
+
+@override_settings(RECIPE_CHANGES_KEEP=2, RECIPE_CHANGES_TRIM_EVERY=2)
+class RecipeChangesTestCase(APITestCase):
+    def test_since(self):
+        self.assertEqual(changes.since(0), (0, set()))
+        changes.record([1, 2, 1])
+        change_id = changes.last_id()
+        self.assertEqual(changes.since(change_id), (change_id, set()))
+        changes.record([3])
+        self.assertEqual(changes.since(change_id), (change_id + 1, {3}))
+        changes.reset()
+        self.assertEqual(changes.since(change_id)[1], None)
+
+    def test_trim(self):
+        changes.record([1])
+        change_id = changes.last_id()
+        changes.record([2, 3, 4])
+        self.assertEqual(RecipeChange.objects.count(), 2)
+        # Строка change_id удалена: индекс строится заново
+        self.assertEqual(changes.since(change_id)[1], None)
+
+
+class TimelineTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.reader, *self.authors = [
+            User.objects.create_user(
+                username=f'timeline_{i}',
+                email=f'timeline_{i}@mail.ru',
+                password='12345678'
+            ) for i in range(3)
+        ]
+        self.recipes = [
+            self._create(author) for author in (0, 1, 0)
+        ]
+
+    def _create(self, author):
+        return Recipe.objects.create(
+            author=self.authors[author], image='recipe.png',
+            name='string', text='string', cooking_time=1
+        ).id
+
+    def _request(self, method, url):
+        return getattr(self.client, method)(
+            url, HTTP_AUTHORIZATION=f'Token {self.reader.auth_token.key}'
+        )
+
+    def _feed(self, url='/recipes/feed/'):
+        response = self._request('get', url)
+        self.assertEqual(response.status_code, 200)
+        return [x['id'] for x in response.data['results']]
+
+    def test_subscribe(self):
+        self.assertEqual(self._feed(), [])
+        for author in self.authors:
+            self._request('post', f'/users/{author.id}/subscribe/')
+        self.assertEqual(self._feed(), self.recipes[::-1])
+
+        self._request('delete', f'/users/{self.authors[0].id}/subscribe/')
+        self.assertEqual(self._feed(), [self.recipes[1]])
+
+        response = self.client.get('/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_fan_out(self):
+        SubscribeUser.for_user(self.reader).subscriber.add(self.authors[0])
+        recipe = self._create(0)
+        self._create(1)
+        self.assertEqual(
+            self._feed(), [recipe, self.recipes[2], self.recipes[0]]
+        )
+        Recipe.objects.filter(pk=recipe).delete()
+        self.assertEqual(self._feed(), [self.recipes[2], self.recipes[0]])
+
+    def test_reverse_relation(self):
+        subscriptions = self.authors[1].user_subscriptions
+        subscriptions.add(SubscribeUser.for_user(self.reader))
+        self.assertEqual(self._feed(), [self.recipes[1]])
+        subscriptions.clear()
+        self.assertEqual(self._feed(), [])
+
+    @override_settings(RECIPE_TIMELINE_LENGTH=2, RECIPE_TIMELINE_TRIM_EVERY=1)
+    def test_trim(self):
+        SubscribeUser.for_user(self.reader).subscriber.add(*self.authors)
+        self.assertEqual(self._feed(), self.recipes[:0:-1])
+        recipe = self._create(1)
+        self.assertEqual(self._feed(), [recipe, self.recipes[2]])
+
+    def test_cursor_and_plan(self):
+        SubscribeUser.for_user(self.reader).subscriber.add(*self.authors)
+        with mock.patch.object(TimelineCursorPagination, 'page_size', 2), \
+                CaptureQueriesContext(connection) as context:
+            response = self._request('get', '/recipes/feed/?cursor=')
+            self.assertEqual(
+                self._feed(response.data['next']), [self.recipes[0]]
+            )
+        page = next(
+            x['sql'] for x in context.captured_queries
+            if 'recipes_timeline' in x['sql']
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {page}')
+            plan = [row[3] for row in cursor.fetchall()]
+        # Страница - диапазон индекса (owner, recipe), без сортировки
+        self.assertFalse(any('TEMP B-TREE' in x for x in plan), plan)
+
+    def test_rebuild(self):
+        subscriptions = SubscribeUser.for_user(self.reader).subscriber
+        subscriptions.add(*self.authors)
+        self._create(1)
+        subscriptions.remove(self.authors[0])
+        expected = self._feed()
+        out = StringIO()
+        call_command('rebuild_timelines', stdout=out)
+        self.assertIn('Строк в лентах: 2', out.getvalue())
+        self.assertEqual(self._feed(), expected)
+
+
+class SimilarRecipesTestCase(RecipeWriteMixin, APITestCase):
+    def setUp(self) -> None:
+        self.user = User.objects.create_user(
+            username='similar',
+            email='similar@mail.ru',
+            password='12345678'
+        )
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.units = IngredientUnit.objects.bulk_create(
+            IngredientUnit(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        self.recipes = []
+        for units in (range(6), range(6), (0, 1, 2, 3, 4, 6), (7, 8, 9)):
+            recipe = Recipe.objects.create(
+                author=self.user, image='recipe.png', name='string',
+                text='string', cooking_time=1
+            )
+            Ingredient.objects.bulk_create(
+                Ingredient(
+                    recipes=recipe, ingredient_unit=self.units[i], amount=1
+                ) for i in units
+            )
+            self.recipes.append(recipe.id)
+        similar_index.build()
+        self.addCleanup(similar_index.invalidate)
+
+    def _get(self, recipe, **params):
+        response = self.client.get(
+            f'/recipes/{self.recipes[recipe]}/similar/', params
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (self.recipes.index(x['id']), x['similarity'])
+            for x in response.data
+        ]
+
+    def test_similar(self):
+        similar = self._get(0)
+        self.assertEqual(similar[0], (1, 1.0))
+        self.assertEqual(similar[1][0], 2)
+        self.assertAlmostEqual(similar[1][1], 5 / 7, delta=0.2)
+        self.assertEqual(len(similar), 2)
+        self.assertEqual(self._get(0, limit=1), [(1, 1.0)])
+        self.assertEqual(self._get(3), [])
+
+    def test_estimate(self):
+        rnd = np.random.default_rng(0)
+        recipes, units, exact = [], [], []
+        for i in range(200):
+            first = set(rnd.choice(100, 20, replace=False).tolist())
+            second = set(rnd.choice(100, 20, replace=False).tolist())
+            second |= set(list(first)[:rnd.integers(0, 20)])
+            for recipe, rows in ((2 * i, first), (2 * i + 1, second)):
+                recipes += [recipe] * len(rows)
+                units += rows
+            exact.append(len(first & second) / len(first | second))
+        _, values = signatures(np.array(recipes), np.array(units))
+        estimate = (values[::2] == values[1::2]).mean(axis=1)
+        self.assertLess(np.abs(estimate - exact).mean(), 0.1)
+
+    def test_bad_params(self):
+        url = f'/recipes/{self.recipes[0]}/similar/'
+        for limit in ('0', 'a', '-1', '1000'):
+            response = self.client.get(url, dict(limit=limit))
+            self.assertEqual(response.status_code, 400, limit)
+        response = self.client.get(f'/recipes/{self.recipes[-1] + 1}/similar/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_incremental_updates(self):
+        with mock.patch.object(similar_index, 'build') as build:
+            recipe_id = self._write('post', '/recipes/', (7, 8, 9))
+            self.recipes.append(recipe_id)
+            self.assertEqual(self._get(3), [(4, 1.0)])
+            self.assertEqual(self._get(4), [(3, 1.0)])
+
+            self._write('patch', f'/recipes/{recipe_id}/', range(6))
+            self.assertEqual(self._get(3), [])
+            self.assertEqual(self._get(0, limit=2), [(4, 1.0), (1, 1.0)])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipe.objects.filter(pk=recipe_id).delete()
+            self.assertEqual(self._get(0, limit=1), [(1, 1.0)])
+            build.assert_not_called()
+
+    @override_settings(SIMILAR_RECIPES_MERGE_EVERY=0)
+    def test_merge(self):
+        # Новые сигнатуры сразу вливаются в основные массивы
+        self.test_incremental_updates()
+        self.assertEqual(len(similar_index._extra_ids), 0)
+        self.assertEqual({x for x, _ in self._get(2)}, {0, 1})
+
+    def test_changes_from_other_process(self):
+        Ingredient.objects.filter(recipes_id=self.recipes[3]).delete()
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                recipes_id=self.recipes[3], ingredient_unit=self.units[i],
+                amount=1
+            ) for i in range(6)
+        )
+        RecipeChange.objects.create(recipe_id=self.recipes[3])
+        self.assertEqual(self._get(0, limit=2), [(3, 1.0), (1, 1.0)])
@@ -0,0 +1,123 @@
+"""
+    Лента подписок с разветвлением при записи (fan-out-on-write).
+
+    Новый рецепт сразу добавляется в TimelineEntry каждого подписчика
+    автора, подписка добавляет последние рецепты автора, отписка
+    удаляет их. Лента пользователя - диапазон индекса (owner, recipe)
+    длиной около RECIPE_TIMELINE_LENGTH.
+"""
+import random
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.db.models import Subquery
+
+from users.models import SubscribeUser
+
+from .models import Recipe
+from .models import TimelineEntry
+
+BATCH_SIZE = 1000
+
+
+def _insert(entries) -> None:
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(recipe) -> int:
+    """
+        Добавляет рецепт в ленты подписчиков автора пачками
+        по BATCH_SIZE. Лента обрезается в среднем раз
+        в RECIPE_TIMELINE_TRIM_EVERY добавлений
+    :param recipe: новый рецепт
+    :return: кол-во лент
+    """
+    owners = list(SubscribeUser.objects.filter(
+        subscriber=recipe.author_id
+    ).values_list('owner_id', flat=True))
+    _insert(
+        TimelineEntry(
+            owner_id=x, recipe_id=recipe.pk, author_id=recipe.author_id
+        ) for x in owners
+    )
+    every = settings.RECIPE_TIMELINE_TRIM_EVERY
+    trim([x for x in owners if random.random() * every < 1])
+    return len(owners)
+
+
+def backfill(owner_id, author_ids) -> None:
+    """
+        Последние рецепты авторов в ленту после подписки
+    :param owner_id: id подписчика
+    :param author_ids: id авторов
+    """
+    length = settings.RECIPE_TIMELINE_LENGTH
+    for author_id in author_ids:
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-id'
+        ).values_list('id', flat=True)[:length]
+        _insert(
+            TimelineEntry(owner_id=owner_id, recipe_id=x, author_id=author_id)
+            for x in recipes
+        )
+    trim([owner_id])
+
+
+def purge(owner_ids=None, author_ids=None) -> None:
+    """
+        Удаляет из лент рецепты авторов после отписки
+    :param owner_ids: id подписчиков, None - все
+    :param author_ids: id авторов, None - все
+    """
+    entries = TimelineEntry.objects.all()
+    if owner_ids is not None:
+        entries = entries.filter(owner_id__in=owner_ids)
+    if author_ids is not None:
+        entries = entries.filter(author_id__in=author_ids)
+    entries.delete()
+
+
+def trim(owner_ids) -> None:
+    """
+        Оставляет в каждой ленте RECIPE_TIMELINE_LENGTH новых рецептов
+    """
+    length = settings.RECIPE_TIMELINE_LENGTH
+    for owner_id in owner_ids:
+        entries = TimelineEntry.objects.filter(owner_id=owner_id)
+        oldest = entries.order_by('-recipe_id').values(
+            'recipe_id'
+        )[length:length + 1]
+        entries.filter(recipe_id__lte=Subquery(oldest)).delete()
+
+
+def rebuild() -> int:
+    """
+        Заново строит все ленты по подпискам одним INSERT ... SELECT.
+        Для массовой загрузки, которая не отправляет сигналы
+    :return: кол-во строк в лентах
+    """
+    field = SubscribeUser.subscriber.field
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+                f'(owner_id, recipe_id, author_id) '
+                f'SELECT owner_id, recipe_id, author_id FROM ('
+                f'SELECT s.owner_id, r.id AS recipe_id, r.author_id, '
+                f'ROW_NUMBER() OVER ('
+                f'PARTITION BY s.owner_id ORDER BY r.id DESC'
+                f') AS position '
+                f'FROM {quote(field.m2m_db_table())} t '
+                f'JOIN {quote(SubscribeUser._meta.db_table)} s '
+                f'ON s.id = t.{quote(field.m2m_column_name())} '
+                f'JOIN {quote(Recipe._meta.db_table)} r '
+                f'ON r.author_id = t.{quote(field.m2m_reverse_name())}'
+                f') WHERE position <= %s',
+                (settings.RECIPE_TIMELINE_LENGTH,)
+            )
+            return cursor.rowcount
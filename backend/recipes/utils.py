@@ -7,15 +7,137 @@
 """
 import csv
 
-from django.http.response import HttpResponse
+from io import BytesIO
+from itertools import chain
 
+from django.conf import settings
+from django.db.models import Sum
+from django.http.response import StreamingHttpResponse
 
-def download_csv(queryset, fields):
-    response = HttpResponse()
-    response['Content-Type'] = 'text/csv'
-    response['Content-Disposition'] = 'attachment; filename=export.csv'
-    writer = csv.writer(response)
-    writer.writerow(fields)
-    for obj in queryset.values_list(*fields):
-        writer.writerow(obj)
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.ttfonts import TTFError
+
+from .models import Ingredient
+
+SHOP_LIST_FIELDS = ('name', 'amount', 'measurement_unit')
+
+CHUNK_SIZE = 2000
+
+# A4 в пунктах
+PDF_PAGE_SIZE = (595, 842)
+PDF_FONT_NAME = 'ShopList'
+PDF_MARGIN = 40
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+
+
+class Echo:
+    """
+        Псевдо-буфер для csv.writer: строки не накапливаются,
+        а сразу отдаются в генератор ответа
+    """
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+def get_shop_list(user):
+    """
+        Суммирует ингредиенты всех рецептов из списка покупок одним запросом
+    :param user: владелец списка покупок
+    :return: итератор кортежей (name, amount, measurement_unit)
+    """
+    return Ingredient.objects.filter(
+        recipes__shoplist__author=user
+    ).values(
+        'ingredient_unit'
+    ).annotate(
+        amount_sum=Sum('amount')
+    ).values_list(
+        'ingredient_unit__name', 'amount_sum',
+        'ingredient_unit__measurement_unit'
+    ).order_by(
+        'ingredient_unit__name'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _line(row):
+    name, amount, measurement_unit = row
+    return f'{name} ({measurement_unit}) - {amount}'
+
+
+def csv_content(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOP_LIST_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def txt_content(rows):
+    for row in rows:
+        yield f'{_line(row)}\n'
+
+
+def _pdf_font():
+    """
+        TrueType-шрифт SHOP_LIST_FONT встраивается в PDF (только
+        использованные символы), без него - Helvetica без кириллицы
+    """
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    try:
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, settings.SHOP_LIST_FONT))
+    except (OSError, TTFError):
+        return 'Helvetica'
+    return PDF_FONT_NAME
+
+
+def pdf_content(rows):
+    """
+        PDF с текстом (reportlab): строки длиннее ширины страницы
+        переносятся. Страницы хранит reportlab, поэтому документ
+        отдается целиком после чтения всех строк
+    """
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=PDF_PAGE_SIZE)
+    pdf.setTitle('Список покупок')
+    font = _pdf_font()
+    width, height = PDF_PAGE_SIZE
+    top = height - PDF_MARGIN - PDF_FONT_SIZE
+    y = top
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for line in chain(('Список покупок', ''), map(_line, rows)):
+        parts = simpleSplit(
+            line, font, PDF_FONT_SIZE, width - 2 * PDF_MARGIN
+        )
+        for part in parts or ('',):
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = top
+            pdf.drawString(PDF_MARGIN, y, part)
+            y -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+FILE_FORMATS = {
+    'csv': ('text/csv', csv_content),
+    'txt': ('text/plain; charset=utf-8', txt_content),
+    'pdf': ('application/pdf', pdf_content),
+}
+
+
+def download_file(rows, file_format='csv'):
+    content_type, content = FILE_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        content(rows), content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename=export.{file_format}'
+    )
     return response
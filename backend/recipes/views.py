@@ -1,96 +1,306 @@
+import hashlib
+
+from django.conf import settings
+from django.http import QueryDict
+from django.db.models import F
 from django.db.models import Exists
 from django.db.models import OuterRef
+from django.db.models import Prefetch
 
 from rest_framework import status
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
 
+from backend.cache import CachedReadMixin
+from backend.conditional import get_versions
+from backend.conditional import ConditionalReadMixin
+
+from users.models import SubscribeUser
+from users.authentication import CachedTokenAuthentication
 from users.permissions import IsAuthOrReadOnly
 
 from .models import Recipe
+from .models import ShopList
+from .models import Favorite
+from .models import Ingredient
 from .models import IngredientUnit
 
 from .serializers import RecipeSerializer
+from .serializers import RecipeCoverageSerializer
+from .serializers import SimilarRecipeSerializer
 from .serializers import RecipeInSerializer
 from .serializers import CreateRecipeSerializer
 from .serializers import IngredientUnitSerializer
 
-from .utils import download_csv
+from .search import ingredient_index
+from .fulltext import search_recipes
+from .coverage import recipe_ingredient_index
+from .similar import similar_index
+from .tag_bitmaps import tag_index
+
+from .pagination import RecipeCursorPagination
+from .pagination import TimelineCursorPagination
+
+from .utils import FILE_FORMATS
+from .utils import get_shop_list
+from .utils import download_file
 
 AUTH = dict(
     permission_classes=[IsAuthenticated, ],
-    authentication_classes=[TokenAuthentication, ]
+    authentication_classes=[CachedTokenAuthentication, ]
 )
 
+# Версии коллекций в ETag карточки рецепта
+RECIPE_COLLECTIONS = ('tags', 'ingredients')
+
+
+def filter_recipes(queryset, user, query_params):
+    """
+        Флаги текущего пользователя и фильтры ленты рецептов,
+        общие для DRF- и async-представлений
+    :param queryset: QuerySet рецептов
+    :param user: текущий пользователь
+    :param query_params: QueryDict параметров запроса
+    :return: QuerySet
+    """
+    if user.is_authenticated:
+        queryset = queryset.annotate(
+            is_in_shopping_cart=Exists(
+                ShopList.recipes.through.objects.filter(
+                    shoplist__author=user,
+                    recipe_id=OuterRef('id')
+                )
+            ),
+            is_favorited=Exists(
+                Favorite.recipes.through.objects.filter(
+                    favorite__author=user,
+                    recipe_id=OuterRef('id')
+                )
+            ),
+            author_is_subscribed=Exists(
+                SubscribeUser.subscriber.through.objects.filter(
+                    subscribeuser__owner=user,
+                    user_id=OuterRef('author_id')
+                )
+            )
+        )
+
+        is_favorited = query_params.get('is_favorited')
+        is_in_shopping_cart = query_params.get('is_in_shopping_cart')
+        if is_favorited:
+            queryset = queryset.filter(
+                is_favorited=bool(int(is_favorited[0])),
+            )
+
+        if is_in_shopping_cart:
+            queryset = queryset.filter(
+                is_in_shopping_cart=bool(int(is_in_shopping_cart[0]))
+            )
+
+    tags = query_params.getlist('tags')
+    if tags:
+        queryset = queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('id'),
+                    tag__slug__in=tags
+                )
+            )
+        )
+
+    author = query_params.get('author')
+    if author:
+        queryset = queryset.filter(
+            author__id=int(author)
+        )
+
+    search = query_params.get('search', '').strip()
+    if search:
+        queryset = search_recipes(queryset, search)
+    return queryset
+
+
+def indexed_feed_params(user, query_params):
+    """
+        Параметры ленты, которую можно отобрать по битовым картам
+        тэгов: фильтр по тэгам и, возможно, по автору, без поиска,
+        курсора и флагов пользователя
+    :return: слаги тэгов и id автора (или None), None - без индекса
+    """
+    tags = query_params.getlist('tags')
+    if not tags or 'cursor' in query_params \
+            or query_params.get('search', '').strip():
+        return None
+    if user.is_authenticated and (
+        query_params.get('is_favorited')
+        or query_params.get('is_in_shopping_cart')
+    ):
+        return None
+    author = query_params.get('author')
+    if not author:
+        return tags, None
+    if not author.isdecimal():
+        return None
+    return tags, int(author)
+
 
-class IngredientUnitViewSet(viewsets.ModelViewSet):
+def recipe_validator_fields(user):
+    fields = [
+        'updated_at', 'favorites_count',
+        'author__email', 'author__username',
+        'author__first_name', 'author__last_name'
+    ]
+    if user.is_authenticated:
+        fields += [
+            'is_in_shopping_cart', 'is_favorited', 'author_is_subscribed'
+        ]
+    return fields
+
+
+def recipe_validators(row, user, versions):
+    """
+        ETag карточки рецепта: дата изменения, данные автора,
+        флаги текущего пользователя и версии тэгов и ингредиентов.
+        Last-Modified нет: избранное и список покупок меняют счетчик
+        и флаги, не трогая updated_at
+    :param row: значения полей recipe_validator_fields(user)
+    :param user: текущий пользователь
+    :param versions: get_versions(*RECIPE_COLLECTIONS)
+    :return: ETag и None вместо Last-Modified
+    """
+    etag = hashlib.md5(repr((
+        tuple(row), user.pk,
+        *(versions[x]['version'] for x in RECIPE_COLLECTIONS)
+    )).encode()).hexdigest()
+    return f'"{etag}"', None
+
+
+class IngredientUnitViewSet(ConditionalReadMixin, CachedReadMixin,
+                            viewsets.ModelViewSet):
     queryset = IngredientUnit.objects.all()
     serializer_class = IngredientUnitSerializer
     pagination_class = None
     http_method_names = ('get',)
+    cache_params = ('name',)
+    collection = 'ingredients'
 
     def filter_queryset(self, queryset):
-        query_params = self.request.query_params
-
-        name_filter = query_params.get('name')
-        if name_filter:
-            return queryset.filter(
-                name__startswith=name_filter
-            )
-
-        return queryset
+        if self.action != 'list':
+            return queryset
+        return ingredient_index.search(
+            self.request.query_params.get('name', ''),
+            settings.INGREDIENT_SEARCH_LIMIT
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalReadMixin, CachedReadMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthOrReadOnly,)
     http_method_names = ('get', 'post', 'patch', 'delete',)
+    cache_params = ('tags', 'author', 'search', 'page', 'cursor')
+    # Лента зависит от пользователя и пагинации, версии у нее нет
+    conditional_actions = ('retrieve',)
 
-    def filter_queryset(self, queryset):
-        query_params = self.request.query_params
-        if self.request.user.is_authenticated:
-            current_user = self.request.user
-            queryset = queryset.annotate(
-                is_in_shopping_cart=Exists(
-                    current_user.shop_list.recipes.filter(
-                        id=OuterRef('id')
-                    )
-                ),
-                is_favorited=Exists(
-                    current_user.favorite.recipes.filter(
-                        id=OuterRef('id')
-                    )
-                )
+    def get_object_validators(self):
+        user = self.request.user
+        row = Recipe.objects.filter(pk=self.kwargs['pk'])
+        row = self.filter_queryset(row).values_list(
+            *recipe_validator_fields(user)
+        ).first()
+        if row is None:
+            return None, None
+        return recipe_validators(
+            row, user, get_versions(*RECIPE_COLLECTIONS)
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                if self.action == 'feed':
+                    self._paginator = TimelineCursorPagination()
+                else:
+                    self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def paginate_queryset(self, queryset):
+        params = None
+        if self.action == 'list':
+            params = indexed_feed_params(
+                self.request.user, self.request.query_params
             )
+        ids = None
+        if params is not None:
+            ids = tag_index.recipe_ids(*params)
+        if ids is None:
+            return super().paginate_queryset(queryset)
+        # Страница отбирается по индексу, без COUNT по базе; фильтр
+        # тэгов в queryset остается проверкой для рецептов страницы.
+        # Paginator режет массив numpy, в список идет только страница
+        page = list(map(int, self.paginator.paginate_queryset(
+            ids, self.request, view=self
+        )))
+        objects = queryset.in_bulk(page)
+        return [objects[x] for x in page if x in objects]
 
-            is_favorited = query_params.get('is_favorited')
-            is_in_shopping_cart = query_params.get('is_in_shopping_cart')
-            if is_favorited:
-                queryset = queryset.filter(
-                    is_favorited=bool(int(is_favorited[0])),
-                )
+    def get_queryset(self):
+        return super().get_queryset().select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=Ingredient.objects.select_related('ingredient_unit')
+            )
+        )
 
-            if is_in_shopping_cart:
-                queryset = queryset.filter(
-                    is_in_shopping_cart=bool(int(is_in_shopping_cart[0]))
-                )
+    def filter_queryset(self, queryset):
+        return filter_recipes(
+            queryset, self.request.user, self.request.query_params
+        )
 
-        tags = query_params.getlist('tags')
-        if tags:
-            queryset = queryset.filter(
-                tags__slug__in=tags
+    @staticmethod
+    def _add_recipe(recipe_list, user, recipe_id):
+        recipe = Recipe.objects.filter(id=recipe_id).only(
+            'id', 'name', 'image', 'cooking_time'
+        ).first()
+        if recipe is None:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data=dict(error='Рецепт не найден')
+            )
+        if not recipe_list.add_recipe(user, recipe.id):
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data=dict(error='Уже добавлено')
             )
+        serializer = RecipeInSerializer(recipe)
+        return Response(
+            status=status.HTTP_201_CREATED,
+            data=serializer.data
+        )
 
-        author = query_params.get('author')
-        if author:
-            queryset = queryset.filter(
-                author__id=int(author)
+    @staticmethod
+    def _remove_recipe(recipe_list, user, recipe_id, error):
+        if recipe_list.remove_recipe(user, recipe_id):
+            return Response(
+                status=status.HTTP_204_NO_CONTENT,
             )
-        return queryset.distinct()
+        if Recipe.objects.filter(id=recipe_id).exists():
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data=dict(error=error)
+            )
+        return Response(
+            status=status.HTTP_404_NOT_FOUND,
+            data=dict(error='Рецепт не найден')
+        )
 
     @action(
         methods=('post',), detail=False,
@@ -98,47 +308,136 @@ class RecipeViewSet(viewsets.ModelViewSet):
         **AUTH
     )
     def add_in_shop_list(self, request, recipe_id):
-        current_user = request.user
-        recipe = Recipe.objects.filter(id=recipe_id)
-        if recipe.exists():
-            shop_list = current_user.shop_list.recipes
-            if shop_list.filter(id=recipe_id).exists():
-                return Response(
-                    status=status.HTTP_400_BAD_REQUEST,
-                    data=dict(error='Уже добавлено')
-                )
-            recipe = recipe.first()
-            shop_list.add(recipe)
-            serializer = RecipeInSerializer(recipe)
+        return self._add_recipe(ShopList, request.user, recipe_id)
+
+    @add_in_shop_list.mapping.delete
+    def remove_from_shop_list(self, request, recipe_id):
+        return self._remove_recipe(
+            ShopList, request.user, recipe_id,
+            'Рецепт не был добавлен в список покупок'
+        )
+
+    @staticmethod
+    def _parse_coverage_params(query_params):
+        """
+        :return: множество id ингредиентов и max_missing (или None)
+        :raise ValueError: некорректные параметры
+        """
+        values = [
+            x for value in query_params.getlist('ingredients')
+            for x in value.split(',') if x
+        ]
+        max_missing = query_params.get('max_missing') or None
+        if not all(x.isdecimal() for x in values) \
+                or not (max_missing or '0').isdecimal():
+            raise ValueError('Ожидаются целые неотрицательные числа')
+        unit_ids = {int(x) for x in values}
+        if not unit_ids:
+            raise ValueError('Не указаны ингредиенты')
+        if len(unit_ids) > settings.RECIPE_BY_INGREDIENTS_LIMIT:
+            raise ValueError('Слишком много ингредиентов')
+        if max_missing is not None:
+            max_missing = int(max_missing)
+        return unit_ids, max_missing
+
+    @action(methods=('get',), detail=False, url_path='by_ingredients')
+    def by_ingredients(self, request):
+        """
+            Рецепты из имеющихся ингредиентов: ?ingredients=1,2,3
+            (или ingredients=1&ingredients=2), ?max_missing=0 - только
+            рецепты целиком из них. Подбор и сортировка идут по индексу
+            в памяти, из базы читается только текущая страница
+        """
+        try:
+            unit_ids, max_missing = self._parse_coverage_params(
+                request.query_params
+            )
+        except ValueError as error:
             return Response(
-                status=status.HTTP_201_CREATED,
-                data=serializer.data
+                status=status.HTTP_400_BAD_REQUEST,
+                data=dict(error=str(error))
             )
-        return Response(
-            status=status.HTTP_404_NOT_FOUND,
-            data=dict(error='Рецепт не найден')
+        recipes, matched, missing = recipe_ingredient_index.search(
+            unit_ids, max_missing
         )
 
-    @add_in_shop_list.mapping.delete
-    def remove_from_shop_list(self, request, recipe_id):
-        current_user = request.user
-        recipe = Recipe.objects.filter(id=recipe_id)
-        if recipe.exists():
-            shop_list = current_user.shop_list.recipes
-            if shop_list.filter(id=recipe_id).exists():
-                recipe = recipe.first()
-                shop_list.remove(recipe)
-                return Response(
-                    status=status.HTTP_204_NO_CONTENT,
-                )
+        paginator = self.pagination_class()
+        page = list(map(int, paginator.paginate_queryset(
+            recipes, request, view=self
+        )))
+        offset = paginator.page.start_index() - 1
+        objects = filter_recipes(
+            self.get_queryset(), request.user, QueryDict()
+        ).in_bulk(page)
+        results = []
+        for i, recipe_id in enumerate(page, offset):
+            recipe = objects.get(recipe_id)
+            if recipe is None:
+                # Удален в другом процессе, индекс еще не перестроен
+                continue
+            recipe.matched_ingredients = matched[i]
+            recipe.missing_ingredients = missing[i]
+            results.append(recipe)
+        serializer = RecipeCoverageSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=('get',), detail=True, url_path='similar')
+    def similar(self, request, pk):
+        """
+            Рецепты с похожим набором ингредиентов (MinHash/LSH),
+            ?limit= - сколько вернуть. Кандидаты и оценки сходства
+            берутся из индекса в памяти, из базы читаются только они
+        """
+        count = request.query_params.get('limit') \
+            or str(settings.SIMILAR_RECIPES_COUNT)
+        if not count.isdecimal() \
+                or not 0 < int(count) <= settings.SIMILAR_RECIPES_LIMIT:
             return Response(
                 status=status.HTTP_400_BAD_REQUEST,
-                data=dict(error='Рецепт не был добавлен в список покупок')
+                data=dict(error='Некорректный limit')
             )
-        return Response(
-            status=status.HTTP_404_NOT_FOUND,
-            data=dict(error='Рецепт не найден')
+        if not pk.isdecimal() or not Recipe.objects.filter(pk=pk).exists():
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data=dict(error='Рецепт не найден')
+            )
+        recipes, scores = similar_index.search(int(pk), int(count))
+        objects = filter_recipes(
+            self.get_queryset(), request.user, QueryDict()
+        ).in_bulk(recipes.tolist())
+        results = []
+        for recipe_id, score in zip(recipes.tolist(), scores.tolist()):
+            recipe = objects.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.similarity = round(score, 3)
+            results.append(recipe)
+        serializer = SimilarRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()
         )
+        return Response(serializer.data)
+
+    @action(methods=('get',), detail=False, url_path='feed', **AUTH)
+    def feed(self, request):
+        """
+            Рецепты авторов из подписок пользователя, новые сначала.
+            Лента материализована (TimelineEntry), страница читается
+            диапазоном индекса; фильтры ленты рецептов тоже действуют
+        """
+        # Сортировка по столбцу ленты, а не recipes_recipe.id: иначе
+        # SQLite сортирует всю ленту пользователя перед LIMIT
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(
+                timeline_entries__owner=request.user
+            ).annotate(
+                timeline_recipe=F('timeline_entries__recipe_id')
+            ).order_by('-timeline_recipe')
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(
         methods=('get',), detail=False,
@@ -146,15 +445,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         **AUTH
     )
     def download_shop_list(self, request):
-        current_user = request.user
-        ingreds_id = current_user.shop_list.recipes.values_list(
-            'ingredients__ingredient_unit__id'
-        )
-        ingreds = IngredientUnit.objects.filter(
-            id__in=[x[0] for x in ingreds_id]
-        )
-        fields = ('name', 'in_recipe_ingredient__amount', 'measurement_unit')
-        return download_csv(ingreds, fields)
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in FILE_FORMATS:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data=dict(error='Неподдерживаемый формат файла')
+            )
+        return download_file(get_shop_list(request.user), file_format)
 
     @action(
         methods=('post',), detail=False,
@@ -162,48 +459,22 @@ class RecipeViewSet(viewsets.ModelViewSet):
         **AUTH
     )
     def add_to_favorite(self, request, recipe_id):
-        current_user = request.user
-        recipe = Recipe.objects.filter(id=recipe_id)
-        if recipe.exists():
-            favorite = current_user.favorite.recipes
-            if favorite.filter(id=recipe_id).exists():
-                return Response(
-                    status=status.HTTP_400_BAD_REQUEST,
-                    data=dict(error='Уже добавлено')
-                )
-            recipe = recipe.first()
-            favorite.add(recipe)
-            serializer = RecipeInSerializer(recipe)
-            return Response(
-                status=status.HTTP_201_CREATED,
-                data=serializer.data
-            )
-        return Response(
-            status=status.HTTP_404_NOT_FOUND,
-            data=dict(error='Рецепт не найден')
-        )
+        return self._add_recipe(Favorite, request.user, recipe_id)
 
     @add_to_favorite.mapping.delete
     def remove_from_favorite(self, request, recipe_id):
-        current_user = request.user
-        recipe = Recipe.objects.filter(id=recipe_id)
-        if recipe.exists():
-            favorite = current_user.favorite.recipes
-            if favorite.filter(id=recipe_id).exists():
-                recipe = recipe.first()
-                favorite.remove(recipe)
-                return Response(
-                    status=status.HTTP_204_NO_CONTENT,
-                )
-            return Response(
-                status=status.HTTP_400_BAD_REQUEST,
-                data=dict(error='Рецепт не был добавлен в список покупок')
-            )
-        return Response(
-            status=status.HTTP_404_NOT_FOUND,
-            data=dict(error='Рецепт не найден')
+        return self._remove_recipe(
+            Favorite, request.user, recipe_id,
+            'Рецепт не был добавлен в избранное'
         )
 
+    def get_object(self):
+        # update/destroy сначала проверяют автора, затем объект
+        # запрашивается повторно внутри миксинов DRF
+        if not hasattr(self, 'object'):
+            self.object = super().get_object()
+        return self.object
+
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return CreateRecipeSerializer
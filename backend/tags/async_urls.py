@@ -0,0 +1,16 @@
+"""
+    Маршруты async-чтения, остальное обрабатывают представления из urls
+"""
+from django.urls import path
+
+from backend.asynchronous import async_read_view
+
+from . import async_views
+
+from .urls import router
+
+views = {x.name: x.callback for x in router.urls}
+
+urlpatterns = [
+    path('tags/', async_read_view(async_views.tag_list, views['tag-list'])),
+]
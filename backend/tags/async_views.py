@@ -0,0 +1,28 @@
+"""
+    Async-чтение списка тэгов (ASGI)
+"""
+from django.contrib.auth.models import AnonymousUser
+
+from backend.asynchronous import render
+from backend.asynchronous import cached_response
+from backend.asynchronous import conditional_response
+from backend.conditional import aget_collection_validators
+
+from .models import Tag
+
+from .serializers import TagSerializer
+
+from .views import TagViewSet
+
+
+async def tag_list(request):
+    async def build():
+        tags = [x async for x in Tag.objects.all()]
+        return render(TagSerializer(tags, many=True).data)
+
+    return await conditional_response(
+        request, await aget_collection_validators(TagViewSet.collection),
+        lambda: cached_response(
+            request, AnonymousUser(), TagViewSet.cache_params, build
+        )
+    )
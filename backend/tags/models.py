@@ -10,6 +10,7 @@ class Tag(models.Model):
     color = ColorField(default='#FF0000', verbose_name='Цвет в HEX')
     slug = models.SlugField(
         max_length=200,
+        unique=True,
         verbose_name='Уникальный слаг',
         validators=[
             RegexValidator(
@@ -18,6 +19,9 @@ class Tag(models.Model):
             )
         ]
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name='Дата изменения'
+    )
 
     def __str__(self):
         return f"Тэг_{self.name}"
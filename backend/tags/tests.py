@@ -1,24 +1,25 @@
+from unittest import mock
+
 from rest_framework.test import APITestCase
 from rest_framework.utils.serializer_helpers import ReturnList
 
 from .models import Tag
 
+from .serializers import TagSerializer
 
-class TagTestCase(APITestCase):
-    @classmethod
-    def setUp(cls) -> None:
-        super().setUpClass()
 
-        cls.tag_model_fields = [
+class TagTestCase(APITestCase):
+    def setUp(self) -> None:
+        self.tag_model_fields = [
             x.name for x in getattr(Tag, '_meta').fields
         ]
 
-        cls.first_tag = Tag.objects.create(
+        self.first_tag = Tag.objects.create(
             name='First Tag',
             slug='first_tag_slug'
         )
 
-        cls.second_tag = Tag.objects.create(
+        self.second_tag = Tag.objects.create(
             name='Second Tag',
             slug='second_tag_slug'
         )
@@ -53,3 +54,61 @@ class TagTestCase(APITestCase):
         data = tag_item.data
         self.assertEqual(tag_item.status_code, 200, 'Некорректный HTTP STATUS')
         self._assert_tag_card(data)
+
+    def test_tag_list_not_modified(self):
+        response = self.client.get('/tags/')
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        with mock.patch.object(
+                TagSerializer, 'to_representation'
+        ) as to_representation, self.assertNumQueries(2):
+            not_modified = self.client.get(
+                '/tags/', HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(not_modified.status_code, 304,
+                             'Некорректный HTTP STATUS')
+            not_modified = self.client.get(
+                '/tags/', HTTP_IF_MODIFIED_SINCE=last_modified
+            )
+            self.assertEqual(not_modified.status_code, 304,
+                             'Некорректный HTTP STATUS')
+        to_representation.assert_not_called()
+
+        # Версия коллекции увеличивается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Third Tag', slug='third_tag_slug')
+        response = self.client.get('/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200,
+                         'Некорректный HTTP STATUS')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tag_item_not_modified(self):
+        url = f'/tags/{self.first_tag.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.first_tag.name = 'New name'
+        self.first_tag.save()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_version_bumped_after_commit(self):
+        etag = self.client.get('/tags/')['ETag']
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='Third Tag', slug='third_tag_slug')
+            # До коммита другие процессы не видят новый тэг,
+            # версия прежняя
+            self.assertEqual(
+                self.client.get(
+                    '/tags/', HTTP_IF_NONE_MATCH=etag
+                ).status_code, 304
+            )
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            self.client.get('/tags/', HTTP_IF_NONE_MATCH=etag).status_code,
+            200
+        )
@@ -1,12 +1,17 @@
 from rest_framework import viewsets
 
+from backend.cache import CachedReadMixin
+from backend.conditional import ConditionalReadMixin
+
 from .models import Tag
 
 from .serializers import TagSerializer
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalReadMixin, CachedReadMixin,
+                 viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     http_method_names = ("get",)
+    collection = 'tags'
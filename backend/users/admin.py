@@ -5,7 +5,9 @@ from .models import SubscribeUser
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ("email", "date_joined")
+    list_display = (
+        "email", "date_joined", "recipes_count", "subscribers_count"
+    )
 
 
 class SubscribeUserAdmin(admin.ModelAdmin):
@@ -0,0 +1,94 @@
+import copy
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authentication import get_authorization_header
+
+_lock = threading.Lock()
+_tokens = dict()
+
+
+def _ttl():
+    return getattr(settings, 'TOKEN_CACHE_TTL', 5)
+
+
+def invalidate_token(key) -> None:
+    """
+        Удаляет токен из кэша процесса. Остальные процессы
+        проверят токен в базе по истечении TOKEN_CACHE_TTL
+    :param key: ключ токена
+    :return: None
+    """
+    with _lock:
+        _tokens.pop(key, None)
+
+
+def invalidate_user(user_id) -> None:
+    """
+        Удаляет из кэша процесса все токены пользователя
+    :param user_id: id пользователя
+    :return: None
+    """
+    with _lock:
+        for key in [k for k, v in _tokens.items() if v[1].pk == user_id]:
+            del _tokens[key]
+
+
+def clear_cache() -> None:
+    with _lock:
+        _tokens.clear()
+
+
+def _get_cached(key):
+    """
+    :return: копия пользователя и токен из кэша процесса или None
+    """
+    with _lock:
+        cached = _tokens.get(key)
+    if cached and cached[0] > time.monotonic():
+        return copy.copy(cached[1]), cached[2]
+    return None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        Аутентификация по токену с кэшем token -> user внутри процесса.
+        Токен проверяется в базе не чаще одного раза за TOKEN_CACHE_TTL:
+        удаленный в другом процессе токен или заблокированный
+        пользователь (is_active) перестают проходить не позже чем
+        через TTL. Каждый запрос получает свою копию пользователя
+    """
+
+    def authenticate_credentials(self, key):
+        cached = _get_cached(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        with _lock:
+            _tokens[key] = (time.monotonic() + _ttl(), user, token)
+        return copy.copy(user), token
+
+
+async def aauthenticate(request):
+    """
+        Аутентификация по токену для async-представлений.
+        Токен из кэша процесса проверяется без перехода в поток
+    :param request: HttpRequest
+    :return: (user, token) или None, если токен не передан
+    :raise AuthenticationFailed: неверный токен
+    """
+    authentication = CachedTokenAuthentication()
+    header = get_authorization_header(request).split()
+    keyword = authentication.keyword.lower().encode()
+    if not header or header[0].lower() != keyword:
+        return None
+    if len(header) == 2:
+        cached = _get_cached(header[1].decode(errors='replace'))
+        if cached is not None:
+            return cached
+    return await sync_to_async(authentication.authenticate)(request)
@@ -0,0 +1,80 @@
+import time
+
+from django.db import transaction
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import identify_hasher
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from backend.loading import FORMATS
+from backend.loading import batched
+from backend.loading import read_rows
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает пользователей из CSV/JSONL пачками. '
+        'Колонки: email, username, first_name, last_name, password. '
+        'Пароль может быть готовым хэшем Django, иначе он хэшируется, '
+        'пустой пароль делает вход по паролю невозможным. '
+        'Пользователи с уже занятым email пропускаются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--hasher', default='default',
+            help='Алгоритм для паролей в открытом виде'
+        )
+
+    @staticmethod
+    def password(value, hasher):
+        if not value:
+            return make_password(None)
+        try:
+            identify_hasher(value)
+        except ValueError:
+            return make_password(value, hasher=hasher)
+        return value
+
+    def build(self, row, hasher):
+        email = (row.get('email') or '').strip()
+        if not email:
+            return None
+        return User(
+            email=User.objects.normalize_email(email),
+            username=User.normalize_username(
+                row.get('username') or email.split('@')[0]
+            ),
+            first_name=row.get('first_name') or '',
+            last_name=row.get('last_name') or '',
+            password=self.password(row.get('password'), hasher),
+        )
+
+    def handle(self, *args, **options):
+        try:
+            rows = read_rows(options['path'], options['format'])
+            before = User.objects.count()
+            started = time.monotonic()
+            total = skipped = 0
+            for batch in batched(rows, options['batch_size']):
+                users = [self.build(x, options['hasher']) for x in batch]
+                users = [x for x in users if x is not None]
+                total += len(batch)
+                skipped += len(batch) - len(users)
+                with transaction.atomic():
+                    User.objects.bulk_create(users, ignore_conflicts=True)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        created = User.objects.count() - before
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Строк: {total}, создано пользователей: {created}, '
+            f'без email: {skipped}, '
+            f'{total / max(elapsed, 1e-6):.0f} строк/с'
+        )
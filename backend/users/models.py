@@ -1,24 +1,20 @@
 from django.db import models
-from django.db import OperationalError
 from django.contrib.auth import models as auth_models
 
-from rest_framework.authtoken.models import Token
-
 
 class User(auth_models.AbstractUser):
     email = models.EmailField(verbose_name="Email Address", unique=True)
     username = models.CharField(verbose_name="username", max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество рецептов"
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество подписчиков"
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", ]
 
-    @property
-    def is_authenticated(self):
-        try:
-            return Token.objects.filter(user=self).exists()
-        except (models.ObjectDoesNotExist, OperationalError):
-            return False
-
     def __str__(self):
         return f"{self.pk}_{self.username}"
 
@@ -40,6 +36,13 @@ class SubscribeUser(models.Model):
         blank=True
     )
 
+    @classmethod
+    def for_user(cls, user):
+        """
+            Подписки пользователя, строка создается при первом обращении
+        """
+        return cls.objects.get_or_create(owner=user)[0]
+
     class Meta:
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки на пользователей"
@@ -59,10 +59,11 @@ class SubscriptionsSerializer(UserSerializer):
     def to_representation(self, instance):
         ret = super().to_representation(instance)
         recipes_limit = self.context.get("recipes_limit")
-        if recipes_limit:
-            recipes = instance.recipes.all()[:int(recipes_limit)]
-        else:
+        recipes = getattr(instance, 'limited_recipes', None)
+        if recipes is None:
             recipes = instance.recipes.all()
+            if recipes_limit:
+                recipes = recipes[:int(recipes_limit)]
         recipe_serializer = SubscriberRecipeSerializer(recipes, many=True)
         ret["recipes"] = recipe_serializer.data
         return ret
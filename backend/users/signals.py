@@ -11,17 +11,21 @@ from django.db.models.signals import post_save
 
 from rest_framework.authtoken.models import Token
 
-from recipes.models import ShopList
-from recipes.models import Favorite
-
 from .models import User
 from .models import SubscribeUser
 
+from backend.counters import ManyToManyCounter
+
+from .authentication import invalidate_user
+
+ManyToManyCounter(SubscribeUser.subscriber, 'subscribers_count').connect()
+
 
 @receiver(post_save, sender=User)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
+        # Списки покупок, избранное и подписки создаются при первом
+        # обращении через for_user
         Token.objects.create(user=instance)
-        ShopList.objects.create(author=instance)
-        Favorite.objects.create(author=instance)
-        SubscribeUser.objects.create(owner=instance)
+    else:
+        invalidate_user(instance.pk)
@@ -1,33 +1,48 @@
+import time
+import tempfile
+
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.contrib.auth.hashers import make_password
+
 from rest_framework.test import APITestCase
 from rest_framework.authtoken.models import Token
 
+from recipes.models import Recipe
+
 from .models import User
+from .models import SubscribeUser
 
 
 class UsersTestCase(APITestCase):
-    @classmethod
-    def setUp(cls) -> None:
-        super().setUpClass()
+    def setUp(self) -> None:
         user = User
 
-        cls.user = user.objects.create_user(
+        self.user = user.objects.create_user(
             username='test_user_1',
             email='test_user_1@mail.ru',
             password='12345678'
         )
 
-        cls.another_user = user.objects.create_user(
+        self.another_user = user.objects.create_user(
             username='another_author',
             email='another_author@gmail.com',
             password='12345678'
         )
 
-        cls.second_another_user = user.objects.create_user(
+        self.second_another_user = user.objects.create_user(
             username='second',
             email='second@gmail.com',
             password='12345678'
         )
 
+    @property
+    def subscriptions(self):
+        return SubscribeUser.for_user(self.user).subscriber
+
     def _login_request(self, password: str = None):
         if not password:
             password = '12345678'
@@ -112,14 +127,65 @@ class UsersTestCase(APITestCase):
 
     def test_logout(self):
         self._login_request()
+        token = self.user.auth_token.key
+        self.client.get(
+            '/users/me/',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
         logout = self._logout_request()
         token_key = Token.objects.filter(user=self.user).exists()
         self.assertEqual(logout.status_code, 204, 'Некорректный HTTP STATUS')
         self.assertFalse(token_key, 'Токен не был удален!')
-        self.assertFalse(
-            self.user.is_authenticated, 'Пользователь все еще авторизирован!'
+        me = self.client.get(
+            '/users/me/',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(
+            me.status_code, 401, 'Пользователь все еще авторизирован!'
         )
 
+    def test_token_resolved_from_cache(self):
+        self._login_request()
+        token = self.user.auth_token.key
+        self.client.get(
+            '/users/me/',
+            HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        with self.assertNumQueries(0):
+            user_card = self.client.get(
+                '/users/me/',
+                HTTP_AUTHORIZATION=f'Token {token}'
+            )
+        self.assertEqual(
+            user_card.status_code, 200, 'Некорректный HTTP STATUS'
+        )
+        self.assertEqual(user_card.data['id'], self.user.id)
+
+    def test_revoked_token_expires(self):
+        # Токен удален и пользователь заблокирован в другом процессе:
+        # кэш этого процесса не сбрасывался
+        token = self.user.auth_token.key
+        another = self.another_user.auth_token.key
+        for key in (token, another):
+            response = self.client.get(
+                '/users/me/', HTTP_AUTHORIZATION=f'Token {key}'
+            )
+            self.assertEqual(response.status_code, 200)
+        Token.objects.filter(key=token).delete()
+        User.objects.filter(pk=self.another_user.pk).update(is_active=False)
+
+        expired = time.monotonic() + settings.TOKEN_CACHE_TTL + 1
+        with mock.patch('users.authentication.time.monotonic',
+                        return_value=expired):
+            for key in (token, another):
+                response = self.client.get(
+                    '/users/me/', HTTP_AUTHORIZATION=f'Token {key}'
+                )
+                self.assertEqual(
+                    response.status_code, 401,
+                    'Отозванный токен принят после TOKEN_CACHE_TTL'
+                )
+
     def test_set_password(self):
         new_password = '87654321'
         current_password = '12345678'
@@ -210,10 +276,10 @@ class UsersTestCase(APITestCase):
         self.assertEqual(rspn.status_code, 201, 'Некорректный HTTP STATUS')
         data = rspn.data
         self._assert_subscriptions_card(data)
-        count_subscribers = self.user.subscribe_model.subscriber.count()
+        count_subscribers = self.subscriptions.count()
         self.assertEqual(count_subscribers, 1, 'Подписка не создалась')
         self._create_subscribe_request(3)
-        count_subscribers = self.user.subscribe_model.subscriber.count()
+        count_subscribers = self.subscriptions.count()
         self.assertEqual(
             count_subscribers, 2,
             'Подписка на другого пользователя не создалась'
@@ -223,7 +289,7 @@ class UsersTestCase(APITestCase):
             false_rspn.status_code, 400,
             'Некорректный HTTP STATUS при подписке на самого себя'
         )
-        count_subscribers = self.user.subscribe_model.subscriber.count()
+        count_subscribers = self.subscriptions.count()
         self.assertEqual(
             count_subscribers, 2,
             'При подписке на самого себя изменилось кол-во подписок'
@@ -233,7 +299,7 @@ class UsersTestCase(APITestCase):
             false_rspn.status_code, 400,
             'Некорректный HTTP STATUS при повторной подписке'
         )
-        count_subscribers = self.user.subscribe_model.subscriber.count()
+        count_subscribers = self.subscriptions.count()
         self.assertEqual(
             count_subscribers, 2,
             'При подписке на самого себя изменилось кол-во подписок у пользователя'
@@ -244,9 +310,9 @@ class UsersTestCase(APITestCase):
         self._create_subscribe_request(3)
         rspn = self._delete_subscribe_request()
         self.assertEqual(rspn.status_code, 204, 'Некорректный HTTP STATUS')
-        count_subscribers = self.user.subscribe_model.subscriber.count()
+        count_subscribers = self.subscriptions.count()
         self.assertEqual(count_subscribers, 1, 'Подписка не удалена')
-        queryset = self.user.subscribe_model.subscriber.all()
+        queryset = self.subscriptions.all()
         self.assertEqual(3, queryset[0].pk, 'Удалена не та подписка')
 
     def test_list_subscribers(self):
@@ -260,3 +326,112 @@ class UsersTestCase(APITestCase):
             len(rspn.data['results']), 2,
             'Вернулись слишком много пользователей, для них подписки не создавались'
         )
+
+    def test_subscriptions_recipes_limit(self):
+        authors = (self.another_user, self.second_another_user)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author, image='recipe.png', name=f'Рецепт {i}',
+                text='string', cooking_time=1
+            ) for author in authors for i in range(5)
+        )
+        # bulk_create не вызывает сигналы, счетчики пересчитываются
+        call_command('reconcile_counters', stdout=StringIO())
+        self.subscriptions.add(*authors)
+        token = self.user.auth_token
+        self.client.get(
+            '/users/me/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+
+        with self.assertNumQueries(3):
+            rspn = self.client.get(
+                '/users/subscriptions/?recipes_limit=2',
+                HTTP_AUTHORIZATION=f'Token {token}',
+            )
+        for author in rspn.data['results']:
+            self.assertEqual(author['recipes_count'], 5)
+            self.assertEqual(
+                [x['id'] for x in author['recipes']],
+                list(Recipe.objects.filter(
+                    author_id=author['id']
+                ).values_list('id', flat=True)[:2]),
+                'Некорректные рецепты в карточке подписки'
+            )
+
+        third_author = User.objects.create_user(
+            username='third',
+            email='third@gmail.com',
+            password='12345678'
+        )
+        self.subscriptions.add(third_author)
+        with self.assertNumQueries(3):
+            self.client.get(
+                '/users/subscriptions/?recipes_limit=2',
+                HTTP_AUTHORIZATION=f'Token {token}',
+            )
+
+        rspn = self.client.post(
+            f'/users/{third_author.id}/subscribe/?recipes_limit=1',
+            HTTP_AUTHORIZATION=f'Token {token}',
+        )
+        self.assertEqual(rspn.status_code, 400)
+        self.subscriptions.remove(third_author)
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=third_author, image='recipe.png', name=f'Рецепт {i}',
+                text='string', cooking_time=1
+            ) for i in range(3)
+        )
+        rspn = self.client.post(
+            f'/users/{third_author.id}/subscribe/?recipes_limit=1',
+            HTTP_AUTHORIZATION=f'Token {token}',
+        )
+        self.assertEqual(rspn.status_code, 201, 'Некорректный HTTP STATUS')
+        self.assertEqual(len(rspn.data['recipes']), 1)
+
+    def test_lazy_user_rows(self):
+        self.assertFalse(SubscribeUser.objects.exists())
+        token = self.user.auth_token
+        rspn = self.client.get(
+            '/users/subscriptions/', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        self.assertEqual(rspn.data['results'], [])
+        self.assertFalse(SubscribeUser.objects.exists())
+
+        rspn = self._delete_subscribe_request()
+        self.assertEqual(rspn.status_code, 404, 'Некорректный HTTP STATUS')
+        self.assertEqual(self._create_subscribe_request().status_code, 201)
+        self.assertEqual(self.subscriptions.count(), 1)
+
+    def test_bulk_import_users(self):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8'
+        ) as file:
+            file.write(
+                'email,username,first_name,last_name,password\n'
+                f'{self.user.email},dup,,,\n'
+                'new_1@Mail.RU,new_1,Имя,Фамилия,secret-pass\n'
+                f'new_2@mail.ru,new_2,,,{make_password("hashed-pass")}\n'
+                'new_1@mail.ru,again,,,\n'
+                ',no_email,,,\n'
+            )
+            file.flush()
+            out = StringIO()
+            call_command(
+                'bulk_import_users', file.name, '--batch-size=2',
+                stdout=out
+            )
+        self.assertIn('создано пользователей: 2', out.getvalue())
+        self.assertIn('без email: 1', out.getvalue())
+
+        first = User.objects.get(email='new_1@mail.ru')
+        self.assertEqual(first.first_name, 'Имя')
+        self.assertTrue(first.check_password('secret-pass'))
+        second = User.objects.get(email='new_2@mail.ru')
+        self.assertTrue(second.check_password('hashed-pass'))
+
+        rspn = self.client.post(
+            '/auth/token/login/',
+            data=dict(email='new_1@mail.ru', password='secret-pass')
+        )
+        self.assertEqual(rspn.status_code, 200, 'Некорректный HTTP STATUS')
@@ -8,18 +8,23 @@ from rest_framework.authtoken.views import ObtainAuthToken
 
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
-from rest_framework.authentication import TokenAuthentication
-
 from rest_framework.decorators import action
 
-from django.db.models import Count
 from django.db.models import Exists
 from django.db.models import OuterRef
+from django.db.models import Prefetch
+from django.db.models import Subquery
 from django.db.models import ObjectDoesNotExist
+from django.db.models import prefetch_related_objects
+
+from recipes.models import Recipe
 
 from .models import User
 from .models import SubscribeUser
 
+from .authentication import invalidate_token
+from .authentication import CachedTokenAuthentication
+
 from .permissions import IsAuthOrReadOnly
 
 from .serializers import SubscriptionsSerializer
@@ -35,7 +40,7 @@ AUTH = dict(
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthOrReadOnly,)
     http_method_names = ('get', 'post', 'delete',)
 
@@ -77,10 +82,32 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def prefetch_recipes(authors, recipes_limit):
+        """
+            Загружает рецепты всех авторов страницы одним запросом,
+            не больше recipes_limit последних рецептов на автора
+        """
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time', 'author_id'
+        )
+        if recipes_limit:
+            recipes = recipes.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(
+                        author_id=OuterRef('author_id')
+                    ).values('id')[:int(recipes_limit)]
+                )
+            )
+        prefetch_related_objects(
+            authors,
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
     @action(detail=False, methods=['get'], url_path='subscriptions', **AUTH)
     def subscriptions(self, request):
-        queryset = request.user.subscribe_model.subscriber.annotate(
-            recipes_count=Count('recipes')
+        queryset = User.objects.filter(
+            user_subscriptions__owner=request.user
         ).order_by('-id')
 
         page = self.paginate_queryset(queryset)
@@ -90,11 +117,14 @@ class UserViewSet(viewsets.ModelViewSet):
         context = dict(recipes_limit=recipes_limit)
 
         if page is not None:
+            self.prefetch_recipes(page, recipes_limit)
             serializer = SubscriptionsSerializer(
                 page, many=True, context=context
             )
             return self.get_paginated_response(serializer.data)
 
+        queryset = list(queryset)
+        self.prefetch_recipes(queryset, recipes_limit)
         serializer = SubscriptionsSerializer(
             queryset, many=True, context=context
         )
@@ -119,26 +149,21 @@ class UserViewSet(viewsets.ModelViewSet):
                     errors='Нельзя подписаться на самого себя'
                 )
             )
-        another_user = User.objects.filter(id=subscribe_id)
-        if another_user.exists():
-            another_user = another_user.annotate(
-                recipes_count=Count('recipes')
-            ).first()
-            try:
-                subscribe_model = request.user.subscribe_model.subscriber
-                if subscribe_model.filter(id=another_user.id).exists():
-                    return Response(
-                        status=status.HTTP_400_BAD_REQUEST,
-                        data=dict(detail="Подписка уже создана!")
-                    )
-                subscribe_model.add(another_user)
-            except ObjectDoesNotExist:
-                subscribe_model = SubscribeUser.objects.create(
-                    owner=request.user
+        another_user = User.objects.filter(id=subscribe_id).first()
+        if another_user is not None:
+            subscribe_model = SubscribeUser.for_user(request.user).subscriber
+            if subscribe_model.filter(id=another_user.id).exists():
+                return Response(
+                    status=status.HTTP_400_BAD_REQUEST,
+                    data=dict(detail="Подписка уже создана!")
                 )
-                subscribe_model.subscriber.add(another_user)
+            subscribe_model.add(another_user)
 
-            serializer = SubscriptionsSerializer(another_user)
+            recipes_limit = request.query_params.get("recipes_limit")
+            self.prefetch_recipes([another_user], recipes_limit)
+            serializer = SubscriptionsSerializer(
+                another_user, context=dict(recipes_limit=recipes_limit)
+            )
 
             return Response(
                 data=serializer.data,
@@ -198,6 +223,7 @@ class TokenUserAuth(ObtainAuthToken):
                 token = Token.objects.filter(key=auth[6:])
                 if token.exists():
                     token.delete()
+                    invalidate_token(auth[6:])
                     return Response(status=204)
                 return Response(
                     status=404,